@@ -0,0 +1,142 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import threading
+
+# Fields of ResourceUsage taken from the command's struct_rusage.
+_RUSAGE_FIELDS = (
+    ('user_time', 'ru_utime'),
+    ('system_time', 'ru_stime'),
+    ('max_rss', 'ru_maxrss'),
+    ('input_blocks', 'ru_inblock'),
+    ('output_blocks', 'ru_oublock'),
+    ('voluntary_switches', 'ru_nvcsw'),
+    ('involuntary_switches', 'ru_nivcsw')
+)
+
+
+class ResourceUsage(object):
+    """
+    Resources a command used.
+
+    wall_time is the seconds from its start until it was reaped.
+    user_time and system_time are CPU seconds, max_rss the peak resident
+    set size in kilobytes, input_blocks and output_blocks the file system
+    blocks it read and wrote, voluntary_switches and involuntary_switches
+    its context switches; these come from wait4() and cover the command
+    and the children it waited for. They are None for warm scripts,
+    which are not children of the agent. stdout_bytes and stderr_bytes
+    count the command's output and log_lines the lines it logged.
+
+    Linux counts the pages a process shared with its parent before exec
+    in its peak, so max_rss is never below the agent's own resident size
+    at spawn time: it only tells about scripts (or their children) that
+    grew larger than the agent.
+    """
+
+    FIELDS = ('wall_time',) + tuple(name for name, _ in _RUSAGE_FIELDS) + \
+        ('stdout_bytes', 'stderr_bytes', 'log_lines')
+
+    def __init__(self, wall_time, rusage, stdout_bytes, stderr_bytes,
+                 log_lines):
+        self.wall_time = wall_time
+        for name, field in _RUSAGE_FIELDS:
+            setattr(self, name,
+                    getattr(rusage, field) if rusage is not None else None)
+        self.stdout_bytes = stdout_bytes
+        self.stderr_bytes = stderr_bytes
+        self.log_lines = log_lines
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.FIELDS)
+
+    def summary(self):
+        """
+        One line 'key=value' description, as in the log.
+        """
+        parts = ['wall={0:.3f}s'.format(self.wall_time)]
+        if self.user_time is not None:
+            parts.extend([
+                'user={0:.3f}s'.format(self.user_time),
+                'sys={0:.3f}s'.format(self.system_time),
+                'max_rss={0}KB'.format(self.max_rss),
+                'blocks_in={0}'.format(self.input_blocks),
+                'blocks_out={0}'.format(self.output_blocks),
+                'ctx_switches={0}/{1}'.format(self.voluntary_switches,
+                                              self.involuntary_switches)
+            ])
+        parts.extend([
+            'stdout={0}B'.format(self.stdout_bytes),
+            'stderr={0}B'.format(self.stderr_bytes),
+            'log_lines={0}'.format(self.log_lines)
+        ])
+        return ', '.join(parts)
+
+    def __repr__(self):
+        return 'ResourceUsage({0})'.format(self.summary())
+
+
+class ExecutionHooks(object):
+    """
+    Base class of exporters notified of every command an ExecutionEngine
+    runs (see register_hooks). Methods run on the engine's thread, in the
+    middle of multiplexing all running commands, so they should be quick
+    and hand slow work (e.g. network calls) off to another thread.
+    Exceptions they raise are logged and otherwise ignored.
+    """
+
+    def pre_spawn(self, execution, argv, env):
+        """
+        Called before execution's command is started, with its argv and
+        the environment (a dict, which may be changed) it gets.
+        """
+
+    def on_line(self, execution, stream, line):
+        """
+        Called for each line the command writes, stream being 'stdout',
+        'stderr' or 'ctx' (the side channel).
+        """
+
+    def post_exit(self, execution, usage):
+        """
+        Called once the command exited, with its ResourceUsage, before its
+        result is available.
+        """
+
+
+_hooks = ()
+_hooks_lock = threading.Lock()
+
+
+def register_hooks(hooks):
+    """
+    Notify hooks, an ExecutionHooks, of the commands started from now on.
+    """
+    global _hooks
+    with _hooks_lock:
+        if hooks not in _hooks:
+            _hooks += (hooks,)
+
+
+def unregister_hooks(hooks):
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h is not hooks)
+
+
+def get_hooks():
+    """
+    The registered ExecutionHooks, as a tuple.
+    """
+    return _hooks
@@ -0,0 +1,366 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import atexit
+import os
+import subprocess
+import threading
+
+from bash_runner.helpers import get_helper_bundle
+
+# Environment variable setting the number of warm workers per agent.
+POOL_SIZE_ENV = 'CLOUDIFY_BASH_POOL_SIZE'
+DEFAULT_POOL_SIZE = 4
+
+# Scripts a worker runs before it is replaced by a fresh one.
+DEFAULT_MAX_USES = 100
+
+# Oldest bash major version workers run scripts with, see get_bash_pool.
+MIN_BASH_VERSION = 5
+
+# The worker reads job directories from stdin, one per line, and answers
+# each with two lines on stdout: 'pid <pid>' once the job started and the
+# exit code of the job once it finished. Every job runs in its own
+# subshell, which is a plain fork of the already initialized worker:
+#
+#   - the worker runs with job control (set -m), so each subshell leads
+#     its own process group and can be killed with everything it started,
+#     without taking the worker down. Job control is off inside the
+#     subshell, so the script's background commands stay in that group.
+#   - stdout, stderr and the side channel (fd 3, see spawn.CTX_FD) are
+#     redirected to the job's FIFOs, stdin to /dev/null.
+#   - the job's environment is applied as a delta to the worker's own
+#     (the agent's environment when the worker started): the .env file
+#     holds NUL separated entries, KEY=VALUE to export and a bare KEY to
+#     unset. Jobs mostly differ from the agent in a few CLOUDIFY_*
+#     variables, and exporting a whole environment costs more than
+#     starting a new bash.
+#   - $0 is set to the script path through BASH_ARGV0, which bash only
+#     honors since version 5 (see MIN_BASH_VERSION).
+#   - the script is sourced, so 'exit N' ends the subshell with N.
+#
+# The helper libraries passed as arguments are sourced once at startup
+# and are inherited by every subshell.
+WORKER_PROGRAM = r'''
+for __cfy_helper in "$@"; do . "$__cfy_helper"; done
+unset __cfy_helper
+set -m --
+while IFS= read -r __cfy_job; do
+    IFS= read -r __cfy_script < "$__cfy_job/.script"
+    (
+        set +m
+        exec </dev/null >"$__cfy_job/.stdout" 2>"$__cfy_job/.stderr" \
+            3>"$__cfy_job/.ctx"
+        while IFS= read -r -d '' __cfy_var; do
+            if [[ $__cfy_var == *=* ]]; then
+                export "$__cfy_var"
+            else
+                unset "$__cfy_var"
+            fi
+        done < "$__cfy_job/.env"
+        unset __cfy_var __cfy_job
+        BASH_ARGV0=$__cfy_script
+        . "$__cfy_script"
+    ) &
+    echo "pid $!"
+    wait "$!"
+    echo "$?"
+done
+'''
+
+
+def _helpers():
+    try:
+        return [get_helper_bundle()]
+    except (IOError, OSError):
+        # as in setup_environment: scripts source the libraries themselves
+        return []
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _environment_delta(base, env):
+    entries = ['{0}={1}'.format(_encode(key), _encode(value))
+               for key, value in env.iteritems()
+               if base.get(key) != value]
+    entries.extend(_encode(key) for key in base if key not in env)
+    return ''.join(entry + '\0' for entry in entries)
+
+
+class BashWorker(object):
+    """
+    A long lived bash coprocess running scripts in subshells. A reader
+    thread, started once per worker, hands each pid and exit code to the
+    callbacks of the job they belong to.
+    """
+
+    def __init__(self, helpers=None):
+        self.uses = 0
+        self.environ = dict(os.environ)
+        self._on_start = None
+        self._on_status = None
+        with open(os.devnull, 'w') as devnull:
+            self.process = subprocess.Popen(
+                self.command(helpers),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=devnull,
+                close_fds=True,
+                env=self.environ)
+        self._reader = threading.Thread(target=self._read_events,
+                                        name='bash-runner-worker')
+        self._reader.daemon = True
+        self._reader.start()
+
+    def command(self, helpers):
+        return (['/bin/bash', '-c', WORKER_PROGRAM, 'cloudify-bash-worker'] +
+                list(_helpers() if helpers is None else helpers))
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def submit(self, job_dir, on_start, on_status):
+        """
+        Run the job in job_dir. on_start is called with the pid of the
+        job's subshell, on_status with the job's exit code, or None if the
+        worker died before the job finished.
+        """
+        self.uses += 1
+        self._on_start = on_start
+        self._on_status = on_status
+        try:
+            # written to the descriptor, not through the file object: a
+            # short job can complete, and close() the worker from the
+            # reader thread, before a file object's write() returned, and
+            # Python 2 refuses to close a file in use by another thread.
+            os.write(self.process.stdin.fileno(), job_dir + '\n')
+        except OSError:
+            # the worker died, the reader reports it to on_status.
+            pass
+
+    def _read_events(self):
+        for line in iter(self.process.stdout.readline, ''):
+            try:
+                if line.startswith('pid '):
+                    self._started(int(line[4:]))
+                else:
+                    self._complete(int(line))
+            except ValueError:
+                continue
+        self.process.wait()
+        self._complete(None)
+
+    def _started(self, pid):
+        on_start, self._on_start = self._on_start, None
+        if on_start is not None:
+            on_start(pid)
+
+    def _complete(self, status):
+        self._on_start = None
+        on_status, self._on_status = self._on_status, None
+        if on_status is not None:
+            on_status(status)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        self.process.wait()
+
+
+class WarmProcess(object):
+    """
+    A script running on a BashWorker, exposing the subset of the
+    subprocess.Popen interface execute() uses. stdout, stderr and ctx (the
+    side channel) are FIFOs in the job directory. The process object keeps
+    a write end of each open until the job's exit code arrived, so they
+    reach EOF exactly when a cold spawned script's pipes would: once the
+    script and anything it left running in the background closed them.
+    'pid' is the pid of the job's subshell, which leads the job's process
+    group, and is None until the worker started the job. 'rusage' is
+    always None: the subshell is a child of the worker, not of the agent.
+    """
+
+    rusage = None
+
+    def __init__(self, pool, worker, script, env, job_dir):
+        self.pool = pool
+        self.worker = worker
+        self.pid = None
+        self.returncode = None
+        self._done = threading.Event()
+
+        with open(os.path.join(job_dir, '.script'), 'w') as f:
+            f.write(script + '\n')
+        with open(os.path.join(job_dir, '.env'), 'wb') as f:
+            f.write(_environment_delta(worker.environ, env))
+
+        self._holders = []
+        streams = []
+        for name in ('.stdout', '.stderr', '.ctx'):
+            path = os.path.join(job_dir, name)
+            os.mkfifo(path, 0600)
+            streams.append(os.fdopen(
+                os.open(path, os.O_RDONLY | os.O_NONBLOCK), 'rb'))
+            self._holders.append(os.open(path, os.O_WRONLY | os.O_NONBLOCK))
+        self.stdout, self.stderr, self.ctx = streams
+
+        worker.submit(job_dir, self._on_start, self._on_status)
+
+    def _on_start(self, pid):
+        self.pid = pid
+
+    def _on_status(self, status):
+        if status is None:
+            worker_code = self.worker.process.returncode
+            status = worker_code if worker_code else -1
+        self.returncode = status
+        for fd in self._holders:
+            os.close(fd)
+        self._holders = []
+        try:
+            # released first, so a caller waiting for this job to start
+            # the next one finds the worker idle.
+            self.pool.release(self.worker, reuse=status == 0)
+        finally:
+            self._done.set()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        self._done.wait()
+        return self.returncode
+
+
+class BashWorkerPool(object):
+    """
+    Pool of at most 'size' warm bash workers. A worker is replaced after
+    'max_uses' scripts, when a script fails or when it died.
+    """
+
+    worker_class = BashWorker
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, max_uses=DEFAULT_MAX_USES,
+                 helpers=None):
+        self.size = size
+        self.max_uses = max_uses
+        self.helpers = helpers
+        self._idle = []
+        self._count = 0
+        self._condition = threading.Condition()
+
+    def start(self, script, env, job_dir, block=True):
+        """
+        Run script with env on a warm worker and return its WarmProcess.
+        job_dir is a private, empty directory for the job's control files.
+
+        When all 'size' workers are busy, waits for one to be released,
+        or returns None without block. Callers draining the output of
+        running jobs themselves (e.g. an ExecutionEngine) must not block:
+        those jobs could not finish and release their workers.
+        """
+        worker = self._acquire(block)
+        if worker is None:
+            return None
+        try:
+            return WarmProcess(self, worker, script, env, job_dir)
+        except BaseException:
+            self.release(worker, reuse=False)
+            raise
+
+    def release(self, worker, reuse):
+        with self._condition:
+            if reuse and worker.alive and worker.uses < self.max_uses:
+                self._idle.append(worker)
+                worker = None
+            else:
+                self._count -= 1
+            self._condition.notify()
+        if worker is not None:
+            worker.close()
+
+    def close(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._count -= len(idle)
+        for worker in idle:
+            worker.close()
+
+    def _acquire(self, block=True):
+        with self._condition:
+            while True:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.alive:
+                        return worker
+                    self._count -= 1
+                if self._count < self.size:
+                    self._count += 1
+                    break
+                if not block:
+                    return None
+                self._condition.wait()
+        try:
+            return self.worker_class(self.helpers)
+        except BaseException:
+            with self._condition:
+                self._count -= 1
+                self._condition.notify()
+            raise
+
+
+def bash_version():
+    """
+    The major version of /bin/bash, or None if it could not be told.
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            output = subprocess.check_output(
+                ['/bin/bash', '-c', 'echo "${BASH_VERSINFO[0]}"'],
+                stderr=devnull, close_fds=True)
+        return int(output)
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+_pool = None
+_supported = None
+_pool_lock = threading.Lock()
+
+
+def get_bash_pool():
+    """
+    Return the process wide BashWorkerPool, or None if /bin/bash is older
+    than MIN_BASH_VERSION: it would run scripts with the worker's $0
+    (e.g. bash 4.2 of CentOS 7), so they run cold instead.
+    """
+    global _pool, _supported
+    with _pool_lock:
+        if _supported is None:
+            version = bash_version()
+            _supported = version is not None and version >= MIN_BASH_VERSION
+        if not _supported:
+            return None
+        if _pool is None:
+            _pool = BashWorkerPool(
+                int(os.environ.get(POOL_SIZE_ENV, DEFAULT_POOL_SIZE)))
+            atexit.register(_pool.close)
+        return _pool
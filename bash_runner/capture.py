@@ -0,0 +1,204 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import tempfile
+
+# Output kept in memory before spilling the rest to a temporary file.
+DEFAULT_MAX_MEMORY = 8 * 1024 * 1024
+
+# Bytes of the beginning/end of a stream retained for error messages.
+DEFAULT_HEAD_SIZE = 4 * 1024
+DEFAULT_TAIL_SIZE = 4 * 1024
+
+
+class OutputCapture(object):
+    """
+    Accumulates the output of a stream.
+
+    Chunks are kept in a list until max_memory bytes were written, at which
+    point everything is moved to an anonymous temporary file and further
+    chunks are appended to it. The first head_size and last tail_size bytes
+    are always kept in memory so a summary can be produced without reading
+    the spilled file back.
+    """
+
+    def __init__(self,
+                 max_memory=DEFAULT_MAX_MEMORY,
+                 head_size=DEFAULT_HEAD_SIZE,
+                 tail_size=DEFAULT_TAIL_SIZE):
+        self.max_memory = max_memory
+        self.head_size = head_size
+        self.tail_size = tail_size
+        self.size = 0
+        self._chunks = []
+        self._spill = None
+        self._head = bytearray()
+        self._tail = bytearray()
+
+    @property
+    def spilled(self):
+        return self._spill is not None
+
+    def write(self, chunk):
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if len(self._head) < self.head_size:
+            self._head.extend(chunk[:self.head_size - len(self._head)])
+        self._tail.extend(chunk)
+        if len(self._tail) > 2 * self.tail_size:
+            del self._tail[:-self.tail_size]
+
+        if self._spill is not None:
+            self._spill.write(chunk)
+            return
+        self._chunks.append(chunk)
+        if self.size > self.max_memory:
+            self._spill = tempfile.TemporaryFile(prefix='cloudify-bash-')
+            self._spill.writelines(self._chunks)
+            self._chunks = None
+
+    def summary(self):
+        """
+        Return the full output if it is small, otherwise its head and tail
+        with a marker for the omitted part.
+        """
+        if self.size <= self.head_size + self.tail_size:
+            return self._contents()
+        tail = str(self._tail[-self.tail_size:])
+        omitted = self.size - len(self._head) - len(tail)
+        return '{0}\n... [{1} bytes omitted] ...\n{2}'.format(
+            str(self._head), omitted, tail)
+
+    def tail(self, size=DEFAULT_TAIL_SIZE):
+        """
+        The last size bytes written, at most tail_size.
+        """
+        return str(self._tail[-min(size, self.tail_size):])
+
+    def result(self):
+        """
+        Return a CapturedOutput over everything written so far.
+        No further writes are expected once this is called.
+        """
+        if self._spill is not None:
+            self._spill.flush()
+            self._spill.seek(0)
+        return CapturedOutput(self._chunks, self._spill, self.size,
+                              self.summary())
+
+    def _contents(self):
+        if self._spill is None:
+            return ''.join(self._chunks)
+        self._spill.flush()
+        self._spill.seek(0)
+        contents = self._spill.read()
+        self._spill.seek(0, 2)
+        return contents
+
+
+class CapturedOutput(object):
+    """
+    File-like, lazily materialized output of a script.
+
+    Small outputs are served from memory. Outputs that exceeded the
+    capture limit are read back from the spill file on demand, so callers
+    that only iterate or read in blocks never hold the whole output.
+    str() and splitlines() load the full contents for callers that expect
+    a plain string. 'usage' is the ResourceUsage of the script that wrote
+    the output, when known.
+    """
+
+    def __init__(self, chunks, spill, size, summary):
+        self.usage = None
+        self._chunks = chunks
+        self._spill = spill
+        self._size = size
+        self._summary = summary
+        self._value = None
+        self._offset = 0
+
+    @classmethod
+    def from_string(cls, value):
+        return cls([value], None, len(value), value)
+
+    @property
+    def spilled(self):
+        return self._spill is not None
+
+    def summary(self):
+        return self._summary
+
+    def read(self, size=-1):
+        if self._spill is not None:
+            return self._spill.read(size)
+        value = self._materialize()
+        if size is None or size < 0:
+            end = len(value)
+        else:
+            end = min(self._offset + size, len(value))
+        data = value[self._offset:end]
+        self._offset = end
+        return data
+
+    def readline(self):
+        if self._spill is not None:
+            return self._spill.readline()
+        value = self._materialize()
+        end = value.find('\n', self._offset)
+        end = len(value) if end < 0 else end + 1
+        data = value[self._offset:end]
+        self._offset = end
+        return data
+
+    def seek(self, offset, whence=0):
+        if self._spill is not None:
+            self._spill.seek(offset, whence)
+        elif whence == 0:
+            self._offset = offset
+        elif whence == 1:
+            self._offset += offset
+        else:
+            self._offset = self._size + offset
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def splitlines(self, keepends=False):
+        return str(self).splitlines(keepends)
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        self._chunks = None
+        self._value = None
+
+    def __len__(self):
+        return self._size
+
+    def __str__(self):
+        if self._spill is None:
+            return self._materialize()
+        position = self._spill.tell()
+        self._spill.seek(0)
+        value = self._spill.read()
+        self._spill.seek(position)
+        return value
+
+    def _materialize(self):
+        if self._value is None:
+            self._value = ''.join(self._chunks)
+            self._chunks = [self._value]
+        return self._value
@@ -0,0 +1,301 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import atexit
+import binascii
+import errno
+import hashlib
+import os
+import SocketServer
+import threading
+
+from cloudify.constants import MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+
+from bash_runner.http_pool import DEFAULT_POOL_SIZE
+from bash_runner.http_pool import get_connection_pool
+from bash_runner.parallel import ScriptJob
+from bash_runner.parallel import run_jobs
+from bash_runner.script_cache import get_script_cache
+from bash_runner.zero_copy import copy_fd
+
+# Environment variable enabling the process wide service, set to 'true'.
+# Off by default: large resources that are not cached yet download
+# faster with wget, see benchmarks/downloads.py.
+ENABLE_ENV = 'CLOUDIFY_BASH_DOWNLOAD_SERVICE'
+
+# Environment variables the file_server.sh helpers find the service by.
+SERVICE_ENV = 'CLOUDIFY_DOWNLOAD_SERVICE'
+TOKEN_ENV = 'CLOUDIFY_DOWNLOAD_TOKEN'
+
+# Target of a request item that streams the resource back to the script.
+STREAM_TARGET = '-'
+
+_STREAM_BUFFER_SIZE = 64 * 1024
+
+# downloaded files get the mode wget would create them with
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class DownloadService(object):
+    """
+    Downloads blueprint resources on behalf of scripts.
+
+    cfy_download_resource and cfy_download_resources (file_server.sh)
+    connect to a loopback TCP port with bash's /dev/tcp, so a download
+    forks nothing. Resources go through the agent's ScriptCache: they are
+    revalidated with conditional GETs over keep-alive connections,
+    interrupted transfers are resumed and digests can be checked. The
+    resources of one request are downloaded in parallel.
+
+    Request, one line each:
+
+        <token>
+        <working directory of the script>
+        <resource path> TAB <target path> TAB <sha256 or empty>
+        ...
+        <empty line>
+
+    Reply: 'OK', or 'ERROR <messages>'. A token is registered per script,
+    see register(), and selects the blueprint whose resources it may get.
+
+    A single item with the target '-' streams the resource instead: the
+    body of the file server's response is passed on without touching the
+    disk, spliced from one socket to the other unless a digest has to be
+    checked. Reply: 'OK <length>', the content, then 'OK' or
+    'ERROR <message>' once it was sent in full.
+    """
+
+    def __init__(self, cache, concurrency=DEFAULT_POOL_SIZE):
+        self.cache = cache
+        self.concurrency = concurrency
+        self._blueprints = {}
+        self._lock = threading.Lock()
+        service = self
+
+        class Handler(SocketServer.StreamRequestHandler):
+            def handle(self):
+                service._handle(self.rfile, self.wfile, self.connection)
+
+        self._server = _Server(('127.0.0.1', 0), Handler)
+        self.address = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='download-service')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def register(self, blueprint_id):
+        """
+        Allow downloads of blueprint_id's resources. Returns the
+        environment variables to pass to the script.
+        """
+        token = binascii.hexlify(os.urandom(16))
+        with self._lock:
+            self._blueprints[token] = blueprint_id
+        return {
+            SERVICE_ENV: '{0}/{1}'.format(*self.address),
+            TOKEN_ENV: token
+        }
+
+    def unregister(self, env):
+        with self._lock:
+            self._blueprints.pop(env[TOKEN_ENV], None)
+
+    def download(self, blueprint_id, items):
+        """
+        Download (resource path, target path, sha256 or None) items, in
+        parallel. Returns a list of error messages.
+        """
+        base_url = os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY]
+        jobs = [ScriptJob(str(index), item)
+                for index, item in enumerate(items)]
+
+        def download_one(job):
+            resource_path, target, sha256 = job.path
+            path = self.cache.get(blueprint_id, resource_path, base_url,
+                                  sha256=sha256)
+            _install(path, target)
+
+        _, errors, _ = run_jobs(jobs, download_one,
+                                concurrency=self.concurrency,
+                                fail_fast=False)
+        return ['{0}: {1}'.format(items[int(name)][0], error)
+                for name, error in errors]
+
+    def stream(self, blueprint_id, resource_path, sha256, connection):
+        """
+        Send resource_path to the connected socket, framed as described
+        above. Errors before the length was sent are raised; after it,
+        the trailer is left out and the script notices the short reply.
+        """
+        base_url = os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY]
+        url = '{0}/{1}/{2}'.format(base_url, blueprint_id, resource_path)
+        pool, request_path = get_connection_pool(url)
+        digest = None
+        with pool.request(request_path) as response:
+            length = response.length
+            if response.status == 200 and length is not None:
+                connection.sendall('OK {0}\n'.format(length))
+                try:
+                    copied, digest = _relay(response, connection, length,
+                                            sha256 is not None,
+                                            pool.timeout)
+                except (IOError, OSError):
+                    return
+        if response.status != 200 or length is None:
+            # e.g. chunked: stream the cached copy, whose length is known
+            # and whose digest get() checks
+            path = self.cache.get(blueprint_id, resource_path, base_url,
+                                  sha256=sha256)
+            with open(path, 'rb') as f:
+                length = os.fstat(f.fileno()).st_size
+                connection.sendall('OK {0}\n'.format(length))
+                try:
+                    copied = copy_fd(f.fileno(), connection.fileno(),
+                                     length)
+                except (IOError, OSError):
+                    return
+        if copied != length:
+            return
+        if digest is not None and digest != sha256.lower():
+            connection.sendall('ERROR {0}: expected SHA-256 {1}, got {2}\n'
+                               .format(url, sha256, digest))
+        else:
+            connection.sendall('OK\n')
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, rfile, wfile, connection):
+        token = rfile.readline().strip()
+        cwd = rfile.readline().rstrip('\n')
+        items = []
+        for line in iter(rfile.readline, ''):
+            line = line.rstrip('\n')
+            if not line:
+                break
+            resource_path, target, sha256 = (line.split('\t') + ['', ''])[:3]
+            if target != STREAM_TARGET:
+                target = os.path.join(cwd, target)
+            items.append((resource_path, target, sha256 or None))
+        with self._lock:
+            blueprint_id = self._blueprints.get(token)
+        if blueprint_id is None:
+            wfile.write('ERROR unknown token\n')
+            return
+        streams = [item for item in items if item[1] == STREAM_TARGET]
+        if streams:
+            if len(items) != 1:
+                wfile.write('ERROR a stream must be the only item\n')
+                return
+            resource_path, _, sha256 = streams[0]
+            try:
+                self.stream(blueprint_id, resource_path, sha256, connection)
+            except Exception as e:
+                wfile.write('ERROR {0}\n'.format(str(e).replace('\n', ' ')))
+            return
+        errors = self.download(blueprint_id, items)
+        if errors:
+            wfile.write('ERROR {0}\n'.format(
+                '; '.join(errors).replace('\n', ' ')))
+        else:
+            wfile.write('OK\n')
+
+
+def _relay(response, connection, length, hashed, timeout):
+    """
+    Pass length bytes of response's body on to connection. Returns the
+    number of bytes passed and, if hashed, their SHA-256 digest.
+    """
+    if not hashed:
+        return response.copy_to(connection.fileno(), length,
+                                timeout), None
+    digest = hashlib.sha256()
+    copied = 0
+    while copied < length:
+        data = response.read(min(length - copied, _STREAM_BUFFER_SIZE))
+        if not data:
+            break
+        digest.update(data)
+        connection.sendall(data)
+        copied += len(data)
+    return copied, digest.hexdigest()
+
+
+class _Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+
+
+def _install(source, target):
+    # a hard link to the cached object, so the content is only written
+    # once (the cache notices a script changing it in place), or else a
+    # copy. Created next to the target and renamed, so a concurrent
+    # reader never sees part of it.
+    directory = os.path.dirname(target) or '.'
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    temp_path = os.path.join(directory, '.cfy-download-{0}'.format(
+        binascii.hexlify(os.urandom(8))))
+    try:
+        try:
+            os.link(source, temp_path)
+        except OSError as e:
+            # another file system, or one without hard links
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            _copy(source, temp_path)
+        os.chmod(temp_path, 0666 & ~_UMASK)
+        os.rename(temp_path, target)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _copy(source, target):
+    fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+    with os.fdopen(fd, 'wb') as f, open(source, 'rb') as s:
+        copy_fd(s.fileno(), f.fileno(), os.fstat(s.fileno()).st_size)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_download_service():
+    """
+    Return the process wide DownloadService, or None if it is not enabled
+    (see ENABLE_ENV), the script cache is disabled or the file server is
+    not known; file_server.sh falls back to wget then.
+    """
+    global _service
+    if os.environ.get(ENABLE_ENV, '').lower() != 'true':
+        return None
+    cache = get_script_cache()
+    if cache is None or \
+            not os.environ.get(MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY):
+        return None
+    with _service_lock:
+        if _service is None:
+            _service = DownloadService(cache)
+            atexit.register(_service.close)
+        elif _service.cache is not cache:
+            _service.cache = cache
+        return _service
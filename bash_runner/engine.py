@@ -0,0 +1,734 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import collections
+import json
+import logging
+import os
+import pipes
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+from bash_runner.accounting import ResourceUsage
+from bash_runner.accounting import get_hooks
+from bash_runner.capture import DEFAULT_MAX_MEMORY
+from bash_runner.capture import OutputCapture
+from bash_runner.downloader import get_download_service
+from bash_runner.environment import setup_environment
+from bash_runner.interpreters import get_warm_pool
+from bash_runner.limits import ResourceLimits
+from bash_runner.limits import Sandbox
+from bash_runner.limits import get_cgroup_parent
+from bash_runner.log_sender import DEFAULT_STREAM_INTERVAL
+from bash_runner.log_sender import DEFAULT_STREAM_SIZE
+from bash_runner.log_sender import LineBatch
+from bash_runner.log_sender import get_log_sender
+from bash_runner.pump import OutputPump
+from bash_runner.retry import ATTEMPT_TAIL_SIZE
+from bash_runner.retry import Attempt
+from bash_runner.retry import RetryPolicy
+from bash_runner.runtime_properties import DEFAULT_FLUSH_INTERVAL
+from bash_runner.runtime_properties import get_property_buffer
+from bash_runner.spawn import CTX_FD
+from bash_runner.spawn import signal_process_group
+from bash_runner.spawn import spawn
+
+# Seconds a timed out script gets between SIGTERM and SIGKILL.
+DEFAULT_KILL_GRACE = 10
+
+# Environment variable holding the side channel's file descriptor.
+CTX_FD_ENV = 'CLOUDIFY_CTX_FD'
+
+# Seconds between checks of a script that closed its output but did not
+# exit yet, and between attempts to signal a warm job without a pid yet.
+_POLL_INTERVAL = 0.05
+
+# First check interval of a script that closed its output: usually it is
+# just exiting, and the interval doubles up to _POLL_INTERVAL.
+_MIN_POLL_INTERVAL = 0.001
+
+
+# Levels of the '[LEVEL] ' prefixes printed by the logging.sh helpers.
+LOG_LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARN': logging.WARNING,
+    'ERROR': logging.ERROR
+}
+
+# Levels of side channel log records, see ctx.sh.
+_RECORD_LOG_LEVELS = dict(LOG_LEVELS, WARNING=logging.WARNING)
+
+
+def strip_level(line, level):
+    return line.replace('[{0}] '.format(level), '', 1)
+
+
+def is_debug_log(line):
+    return line.startswith('[DEBUG]')
+
+
+def is_info_log(line):
+    return line.startswith('[INFO]')
+
+
+def is_warn_log(line):
+    return line.startswith('[WARN]')
+
+
+def is_error_log(line):
+    return line.startswith('[ERROR]')
+
+
+def parse_log_line(line):
+    """
+    Return the (logging level, message) of a line printed by a logging.sh
+    helper, or (None, line) for any other line.
+    """
+    if line.startswith('['):
+        end = line.find('] ', 1)
+        if end != -1:
+            level = LOG_LEVELS.get(line[1:end])
+            if level is not None:
+                return level, line[end + 2:]
+    return None, line
+
+
+def format_command(command):
+    if isinstance(command, basestring):
+        return command
+    return ' '.join(pipes.quote(arg) for arg in command)
+
+
+class Execution(object):
+    """
+    A command run by an ExecutionEngine.
+
+    command is either an argv list, executed directly, or a string,
+    executed with /bin/sh -c. With warm, a ['/bin/bash', script] command
+    runs on the agent's warm bash worker pool, and a script of the
+    agent's own Python interpreter on its warm Python worker pool (see
+    get_warm_pool), or cold when all workers are busy. The command leads
+    its own process group; when timeout seconds passed, the group is sent
+    SIGTERM, then SIGKILL after kill_grace seconds. Output keeps being
+    drained meanwhile, and the pipes are given up kill_grace seconds
+    after SIGKILL, in case a process that left the group still holds
+    them.
+
+    Besides stdout and stderr, the command gets a side channel: file
+    descriptor CTX_FD, named by $CLOUDIFY_CTX_FD, taking one JSON record
+    per line (see ctx.sh):
+
+        {"type": "log", "level": "info", "message": "..."}
+            logged at the given level.
+        {"type": "runtime_property", "key": "...", "value": ...}
+            collected in 'runtime_properties' and set on the context when
+            the command finished, or stored with ctx.update() once
+            property_flush_interval seconds passed (None to wait for the
+            end of the operation). See RuntimePropertyBuffer.
+        {"type": "return", "value": ...}
+            kept as 'return_value'.
+
+    The side channel is read until the command exited and closed stdout
+    and stderr, not until every process holding it exited, so commands
+    may leave services running in the background.
+
+    Once the command exited, 'usage' holds its ResourceUsage, which is
+    also logged and set as the 'usage' of its result or ProcessException.
+    hooks are ExecutionHooks notified of the command, by default the
+    registered ones (see register_hooks). Without hooks, lines are not
+    passed to any.
+
+    limits (a ResourceLimits, or a dict of its arguments) are applied
+    before the command is executed, see Sandbox, logging why memory and
+    process limits are not applied with a cgroup. Such commands are never
+    run warm. A command failing because it exceeded one raises
+    ResourceLimitException.
+
+    With stream, all of stdout (at INFO) and stderr (at ERROR) is logged
+    as the command writes it, in one record per stream_interval seconds
+    or stream_size bytes (see LineBatch), rather than a record per line.
+    '[LEVEL] ' lines are still logged at their level.
+
+    retry (a RetryPolicy, a dict of its arguments or a number of retries)
+    runs a failed command again after a backoff, with the environment
+    built for the first attempt. Timeouts (which apply to each attempt)
+    and exceeded limits are not retried. 'attempts' lists an Attempt per
+    run, also set on the final ProcessException. Runtime properties of a
+    retried command are those of its last attempt, set on the context
+    once it finished rather than flushed while it runs.
+
+    Node property values over offload_size bytes (None to keep all of
+    them in the environment) are written to files in the command's work
+    directory, see setup_environment.
+    """
+
+    def __init__(self, command, ctx, log_all=False,
+                 max_output_memory=DEFAULT_MAX_MEMORY, logger=None,
+                 warm=False, timeout=None, kill_grace=DEFAULT_KILL_GRACE,
+                 property_flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 hooks=None, limits=None, stream=False,
+                 stream_interval=DEFAULT_STREAM_INTERVAL,
+                 stream_size=DEFAULT_STREAM_SIZE, retry=None,
+                 offload_size=None):
+        self.command = command
+        self.ctx = ctx
+        self.log_all = log_all
+        self.logger = logger or ctx.logger
+        self.warm = warm
+        self.timeout = timeout
+        self.kill_grace = kill_grace
+        self.property_flush_interval = property_flush_interval
+        self.hooks = get_hooks() if hooks is None else tuple(hooks)
+        self.limits = ResourceLimits.from_dict(limits or {})
+        self.stream = stream
+        self.stream_interval = stream_interval
+        self.stream_size = stream_size
+        self.retry = RetryPolicy.from_dict(retry or {})
+        self.offload_size = offload_size
+        self.attempts = []
+        self.process = None
+        self.started = None
+        self.elapsed = None
+        self.done = False
+        self.return_value = None
+        self.runtime_properties = {}
+        self.usage = None
+        self.stdout = OutputCapture(max_memory=max_output_memory)
+        self.stderr = OutputCapture(max_memory=max_output_memory)
+        self._properties = get_property_buffer(ctx)
+        self._open_fds = set()
+        self._ctx_fd = None
+        self._log_lines = 0
+        self._batches = ()
+        self._retry_at = None
+        self._retry_matched = False
+        self._env = None
+        self._exit_poll_interval = _MIN_POLL_INTERVAL
+        self._deadline = None
+        self._signals = [signal.SIGTERM, signal.SIGKILL]
+        self._work_dir = None
+        self._sandbox = None
+        self._download = None
+        self._result = None
+        self._exc_info = None
+
+    def result(self):
+        """
+        Return the command's stdout as a CapturedOutput, or raise the
+        ProcessException (or error starting it) the command failed with.
+        """
+        if not self.done:
+            raise RuntimeError('{0} did not finish'.format(
+                format_command(self.command)))
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def _start(self, pump, log_sender):
+        log_sender.info('Running command: {0}'.format(
+            format_command(self.command)), self.logger)
+        # per operation scratch space, e.g. for properties offloaded from
+        # the environment. Removed once the script exited.
+        self._work_dir = tempfile.mkdtemp(prefix='cloudify-bash-')
+        try:
+            if self.offload_size is None:
+                env = setup_environment(self.ctx)
+            else:
+                env = setup_environment(self.ctx,
+                                        offload_dir=self._work_dir,
+                                        max_value_size=self.offload_size)
+            env[CTX_FD_ENV] = str(CTX_FD)
+            download_service = get_download_service()
+            if download_service is not None:
+                download_env = download_service.register(
+                    self.ctx.blueprint_id)
+                self._download = (download_service, download_env)
+                env.update(download_env)
+        except Exception:
+            self._fail(sys.exc_info())
+            return
+        self._env = env
+        self._spawn(pump, log_sender)
+
+    def _spawn(self, pump, log_sender):
+        # later attempts start from the same environment, not one changed
+        # by the hooks of an earlier one
+        env = dict(self._env) if self.retry else self._env
+        try:
+            if isinstance(self.command, basestring):
+                argv = ['/bin/sh', '-c', self.command]
+            else:
+                argv = list(self.command)
+            if self.hooks:
+                self._call_hooks('pre_spawn', log_sender, argv, env)
+            pool = get_warm_pool(argv) if self.warm else None
+            self.process = None
+            if self.limits:
+                self._sandbox = Sandbox(self.limits)
+                if self._sandbox.fallback is not None:
+                    # a warning if cgroups were configured but unusable
+                    log_sender.emit(
+                        logging.INFO if get_cgroup_parent() is None
+                        else logging.WARNING,
+                        'Limiting memory and processes of each process '
+                        'with setrlimit(): {0}'.format(
+                            self._sandbox.fallback), self.logger)
+                self.process = spawn(argv, env, side_channel=True,
+                                     setup=self._sandbox.enter)
+            elif pool is not None:
+                job_dir = self._work_dir
+                if self.attempts:
+                    # the job's control files need an empty directory
+                    job_dir = os.path.join(job_dir, 'attempt-{0}'.format(
+                        len(self.attempts) + 1))
+                    os.mkdir(job_dir)
+                # waiting for a worker would stop draining the jobs
+                # holding them: with none idle, the command runs cold
+                self.process = pool.start(argv[1], env, job_dir,
+                                          block=False)
+            if self.process is None:
+                self.process = spawn(argv, env, side_channel=True)
+        except Exception:
+            self._fail(sys.exc_info())
+            return
+        self.started = time.time()
+        if self.timeout is not None:
+            self._deadline = self.started + self.timeout
+
+        if self.stream:
+            stdout_batch, stderr_batch = self._batches = tuple(
+                LineBatch(log_sender, level, self.logger,
+                          self.stream_interval, self.stream_size)
+                for level in (logging.INFO, logging.ERROR))
+
+        def on_stdout_line(line):
+            if self.retry.patterns and not self._retry_matched:
+                self._retry_matched = self.retry.matches(line)
+            level, message = parse_log_line(line)
+            if level is not None:
+                self._log_lines += 1
+                if self.stream:
+                    # keep the order of the lines before it
+                    stdout_batch.flush()
+                log_sender.emit(level, message, self.logger)
+            elif self.stream:
+                self._log_lines += 1
+                stdout_batch.add(line)
+            elif self.log_all:
+                self._log_lines += 1
+                log_sender.info(line, self.logger)
+
+        def on_stderr_line(line):
+            if self.retry.patterns and not self._retry_matched:
+                self._retry_matched = self.retry.matches(line)
+            self._log_lines += 1
+            if self.stream:
+                stderr_batch.add(line)
+            else:
+                log_sender.error(line, self.logger)
+
+        def on_record(line):
+            self._handle_record(line, log_sender)
+
+        for name, stream, on_chunk, on_line in (
+                ('stdout', self.process.stdout, self.stdout.write,
+                 on_stdout_line),
+                ('stderr', self.process.stderr, self.stderr.write,
+                 on_stderr_line),
+                ('ctx', self.process.ctx, None, on_record)):
+            if self.hooks:
+                on_line = self._hooked(name, on_line, log_sender)
+            fd = stream.fileno()
+            self._open_fds.add(fd)
+            if name == 'ctx':
+                self._ctx_fd = fd
+            pump.register(fd,
+                          on_chunk=on_chunk,
+                          on_line=on_line,
+                          on_eof=lambda fd=fd: self._open_fds.discard(fd))
+
+    def _handle_record(self, line, log_sender):
+        if not line.strip():
+            return
+        try:
+            # strict=False: shell helpers do not escape every control
+            # character.
+            record = json.loads(line, strict=False)
+            record_type = record['type']
+            if record_type == 'log':
+                level = _RECORD_LOG_LEVELS[
+                    str(record.get('level', 'info')).upper()]
+                self._log_lines += 1
+                log_sender.emit(level, record['message'], self.logger)
+            elif record_type == 'runtime_property':
+                self.runtime_properties[record['key']] = record['value']
+                if not self.retry:
+                    self._properties.set(record['key'], record['value'])
+            elif record_type == 'return':
+                self.return_value = record['value']
+            else:
+                raise ValueError('unknown type {0}'.format(record_type))
+        except (ValueError, KeyError, TypeError) as e:
+            log_sender.emit(logging.WARNING,
+                            'Invalid ctx record ({0}): {1}'.format(e, line),
+                            self.logger)
+
+    def _hooked(self, stream, on_line, log_sender):
+        def hooked(line):
+            self._call_hooks('on_line', log_sender, stream, line)
+            on_line(line)
+        return hooked
+
+    def _call_hooks(self, method, log_sender, *args):
+        for hooks in self.hooks:
+            try:
+                getattr(hooks, method)(self, *args)
+            except Exception as e:
+                log_sender.emit(logging.WARNING,
+                                'Execution hook {0}.{1} failed: {2}'
+                                .format(type(hooks).__name__, method, e),
+                                self.logger)
+
+    def _update(self, now, pump, log_sender):
+        """
+        Handle the timeout and completion. Returns the seconds until this
+        execution needs to be updated again, or None if only output can
+        change its state.
+        """
+        if self._retry_at is not None:
+            if now < self._retry_at:
+                return self._retry_at - now
+            self._retry_at = None
+            self._spawn(pump, log_sender)
+            return 0
+        running = self._running(pump)
+        if running and self._deadline is not None \
+                and now >= self._deadline:
+            self._expire(now, pump)
+            running = self._running(pump)
+        if not running:
+            self._finish(log_sender)
+            return 0
+        if self._output_open():
+            wait = None
+        else:
+            wait = self._exit_poll_interval
+            self._exit_poll_interval = min(2 * wait, _POLL_INTERVAL)
+        if self._deadline is not None:
+            remaining = self._deadline - now
+            wait = remaining if wait is None else min(wait, remaining)
+        try:
+            remaining = self._properties.flush_if_due(
+                now, self.property_flush_interval)
+        except Exception as e:
+            log_sender.emit(logging.WARNING,
+                            'Failed storing runtime properties: {0}'
+                            .format(e), self.logger)
+            remaining = None
+        if remaining is not None:
+            wait = remaining if wait is None else min(wait, remaining)
+        for batch in self._batches:
+            remaining = batch.due(now)
+            if remaining is not None:
+                wait = remaining if wait is None else min(wait, remaining)
+        return wait
+
+    def _output_open(self):
+        return bool(self._open_fds) and \
+            self._open_fds != set([self._ctx_fd])
+
+    def _running(self, pump):
+        # the exit status is only checked once stdout and stderr reached
+        # EOF. The side channel is not waited for: processes the command
+        # left in the background (e.g. a service started with nohup)
+        # inherit it, and may keep it open as long as they run.
+        if self._output_open() or self.process.poll() is None:
+            return True
+        if self._ctx_fd in self._open_fds:
+            pump.drain(self._ctx_fd)
+            self._open_fds.discard(self._ctx_fd)
+        return False
+
+    def _expire(self, now, pump):
+        if not self._signals:
+            for fd in self._open_fds:
+                pump.unregister(fd)
+            self._open_fds.clear()
+            self._deadline = None
+            return
+        if self.elapsed is None:
+            self.elapsed = now - self.started
+        if signal_process_group(self.process, self._signals[0]):
+            self._signals.pop(0)
+            self._deadline = now + self.kill_grace
+        else:
+            # a warm job that did not report its pid yet
+            self._deadline = now + _POLL_INTERVAL
+
+    def _finish(self, log_sender):
+        self.process.stdout.close()
+        self.process.stderr.close()
+        self.process.ctx.close()
+        for batch in self._batches:
+            batch.flush()
+        return_code = self.process.wait()
+        self.usage = ResourceUsage(time.time() - self.started,
+                                   self.process.rusage,
+                                   self.stdout.size, self.stderr.size,
+                                   self._log_lines)
+        if self.hooks:
+            self._call_hooks('post_exit', log_sender, self.usage)
+        if not self.retry:
+            self._properties.apply()
+        command = format_command(self.command)
+        if self.elapsed is not None:
+            log_sender.info('Command timed out after {0:.1f} seconds '
+                            '(return_code={1}, {2}): {3}'
+                            .format(self.elapsed, return_code,
+                                    self.usage.summary(), command),
+                            self.logger)
+            error = ProcessTimeoutException(
+                self.command, return_code, self.stdout.result(),
+                self.stderr.result(), self.timeout, self.elapsed)
+        else:
+            log_sender.info('Done running command (return_code={0}, {1}): '
+                            '{2}'.format(return_code, self.usage.summary(),
+                                         command), self.logger)
+            breach = None
+            if return_code != 0 and self._sandbox is not None:
+                breach = self._sandbox.breach(return_code)
+            if return_code == 0:
+                self._result = self.stdout.result()
+                self._result.usage = self.usage
+                error = None
+            elif breach is not None:
+                error = ResourceLimitException(
+                    self.command, return_code, self.stdout.result(),
+                    self.stderr.result(), breach,
+                    getattr(self.limits, breach))
+            else:
+                error = ProcessException(self.command, return_code,
+                                         self.stdout.result(),
+                                         self.stderr.result())
+        if self.retry:
+            self.attempts.append(Attempt(
+                len(self.attempts) + 1, self.started, self.usage.wall_time,
+                return_code, self.stdout.tail(ATTEMPT_TAIL_SIZE),
+                self.stderr.tail(ATTEMPT_TAIL_SIZE)))
+        if error is not None and self.retry and \
+                type(error) is ProcessException and \
+                len(self.attempts) <= self.retry.retries and \
+                self.retry.retryable(return_code, self._retry_matched):
+            self._schedule_retry(error, log_sender)
+            return
+        if self.retry:
+            # the last attempt's, those of earlier ones were dropped
+            for key, value in self.runtime_properties.iteritems():
+                self._properties.set(key, value)
+            self._properties.apply()
+        if error is not None:
+            error.usage = self.usage
+            if len(self.attempts) > 1:
+                error.attempts = self.attempts
+                error.args = ('{0}\nFailed {1} attempts:\n{2}'.format(
+                    error.args[0], len(self.attempts),
+                    '\n'.join(a.summary() for a in self.attempts)),)
+            self._fail((type(error), error, None))
+            return
+        self._cleanup()
+        self.done = True
+
+    def _schedule_retry(self, error, log_sender):
+        delay = self.retry.delay(len(self.attempts))
+        log_sender.info('Retrying in {0:.1f} seconds (attempt {1} of {2} '
+                        'failed with return_code={3}): {4}'
+                        .format(delay, len(self.attempts),
+                                self.retry.retries + 1, error.exit_code,
+                                format_command(self.command)),
+                        self.logger)
+        error.stdout.close()
+        error.stderr.close()
+        if self._sandbox is not None:
+            self._sandbox.close()
+            self._sandbox = None
+        max_memory = self.stdout.max_memory
+        self.stdout = OutputCapture(max_memory=max_memory)
+        self.stderr = OutputCapture(max_memory=max_memory)
+        self.process = None
+        self.return_value = None
+        self.runtime_properties = {}
+        self._open_fds = set()
+        self._ctx_fd = None
+        self._log_lines = 0
+        self._retry_matched = False
+        self._exit_poll_interval = _MIN_POLL_INTERVAL
+        self._deadline = None
+        self._signals = [signal.SIGTERM, signal.SIGKILL]
+        self._retry_at = time.time() + delay
+
+    def _fail(self, exc_info):
+        self._exc_info = exc_info
+        self._cleanup()
+        self.done = True
+
+    def _cleanup(self):
+        if self._sandbox is not None:
+            self._sandbox.close()
+            self._sandbox = None
+        if self._download is not None:
+            download_service, download_env = self._download
+            download_service.unregister(download_env)
+            self._download = None
+        if self._work_dir is not None:
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._work_dir = None
+
+
+class ExecutionEngine(object):
+    """
+    Runs many commands from a single thread.
+
+    All running commands share one OutputPump, which multiplexes their
+    pipes, and every engine the process wide AsyncLogSender (see
+    get_log_sender), so the number of threads grows neither with the
+    number of commands nor with the number of operations. At most
+    'concurrency' commands run at once (None for no limit), the rest
+    wait in submission order.
+    """
+
+    def __init__(self, logger, concurrency=None):
+        self.logger = logger
+        self.concurrency = concurrency
+        self._pump = OutputPump()
+        self._log_sender = get_log_sender()
+        self._queued = collections.deque()
+        self._running = []
+
+    def submit(self, command, ctx, **kwargs):
+        """
+        Queue command, see Execution for the keyword arguments.
+        Returns its Execution.
+        """
+        execution = Execution(command, ctx, **kwargs)
+        self._queued.append(execution)
+        return execution
+
+    def run(self):
+        """
+        Run until every submitted command finished.
+        """
+        while self._queued or self._running:
+            self._start_queued()
+            timeout = None
+            now = time.time()
+            for execution in list(self._running):
+                wait = execution._update(now, self._pump, self._log_sender)
+                if execution.done:
+                    self._running.remove(execution)
+                if wait is not None:
+                    timeout = wait if timeout is None else min(timeout, wait)
+            if self._running and not (self._queued and timeout == 0):
+                # ship what was logged so far rather than holding the last
+                # record back for coalescing while the scripts are quiet
+                self._log_sender.flush()
+                self._pump.poll(max(timeout, 0)
+                                if timeout is not None else None)
+
+    def close(self):
+        """
+        Release the pump and wait for the remaining log lines to be
+        shipped.
+        """
+        self._pump.close()
+        self._log_sender.wait(self.logger)
+
+    def _start_queued(self):
+        while self._queued and (self.concurrency is None or
+                                len(self._running) < self.concurrency):
+            execution = self._queued.popleft()
+            execution._start(self._pump, self._log_sender)
+            if not execution.done:
+                self._running.append(execution)
+
+
+def execute_many(commands, ctx, concurrency=None, logger=None, **kwargs):
+    """
+    Run commands concurrently on a single thread and return their
+    Executions, in the order of 'commands'. Keyword arguments apply to
+    every command, see Execution. Failures do not stop other commands,
+    call result() on each Execution to get its output or exception.
+    """
+    engine = ExecutionEngine(logger or ctx.logger, concurrency)
+    try:
+        executions = [engine.submit(command, ctx, logger=logger, **kwargs)
+                      for command in commands]
+        engine.run()
+    finally:
+        engine.close()
+    return executions
+
+
+class ProcessException(Exception):
+    """
+    Raised when a script exits with a non zero return code.
+    'stdout' and 'stderr' are CapturedOutput instances; the exception
+    message only holds the head and tail of stderr. 'usage' is the
+    script's ResourceUsage and 'attempts' the Attempts of a retried
+    script (see RetryPolicy), the last one being the failure at hand.
+    """
+    def __init__(self, command, exit_code, stdout, stderr):
+        Exception.__init__(self, stderr.summary())
+        self.command = command
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.usage = None
+        self.attempts = []
+
+
+class ProcessTimeoutException(ProcessException):
+    """
+    Raised when a script was killed because it ran longer than its
+    timeout. 'elapsed' is the number of seconds it ran until it was
+    signalled and 'exit_code' the return code it exited with then.
+    """
+    def __init__(self, command, exit_code, stdout, stderr, timeout,
+                 elapsed):
+        ProcessException.__init__(self, command, exit_code, stdout, stderr)
+        self.timeout = timeout
+        self.elapsed = elapsed
+        summary = stderr.summary()
+        self.args = ('Timed out after {0:.1f} seconds (timeout: {1}){2}'
+                     .format(elapsed, timeout,
+                             '\n' + summary if summary else ''),)
+
+
+class ResourceLimitException(ProcessException):
+    """
+    Raised when a script failed because it exceeded one of its
+    ResourceLimits: 'limit' is the name of the limit (e.g. 'cpu_seconds')
+    and 'value' its setting.
+    """
+    def __init__(self, command, exit_code, stdout, stderr, limit, value):
+        ProcessException.__init__(self, command, exit_code, stdout, stderr)
+        self.limit = limit
+        self.value = value
+        summary = stderr.summary()
+        self.args = ('Exceeded the {0} limit ({1}){2}'
+                     .format(limit, value,
+                             '\n' + summary if summary else ''),)
@@ -0,0 +1,222 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import collections
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from os.path import dirname
+
+from cloudify import utils
+from cloudify.utils import get_manager_ip
+
+from bash_runner import resources
+from bash_runner.helpers import CHAINED_BASH_ENV
+from bash_runner.helpers import HELPERS_DIR_ENV
+from bash_runner.helpers import PRELOAD_ENV
+from bash_runner.helpers import get_helper_bundle
+from bash_runner.helpers import get_helper_loader
+
+# Number of (deployment, node, properties) environments kept per process.
+MAX_CACHED_ENVIRONMENTS = 256
+
+DEFAULT_SEPARATOR = '_'
+
+# Encoded property values larger than this are written to a file instead
+# of the environment, when the caller offloads values (see
+# setup_environment). Linux rejects single strings over 128KB at exec
+# time (E2BIG), and the whole environment shares ARG_MAX with argv.
+DEFAULT_MAX_VALUE_SIZE = 32 * 1024
+
+# Suffix of the variable holding the path of an offloaded property.
+OFFLOADED_SUFFIX = '_FILE'
+
+_lock = threading.Lock()
+_static_block = (None, None)
+_node_blocks = collections.OrderedDict()
+
+
+def _iter_flattened(d, parent_key='', separator=DEFAULT_SEPARATOR):
+    stack = [(parent_key, d)]
+    while stack:
+        prefix, container = stack.pop()
+        if isinstance(container, collections.Mapping):
+            items = container.iteritems()
+        else:
+            items = enumerate(container)
+        for k, v in items:
+            if not isinstance(k, basestring):
+                k = str(k)
+            new_key = prefix + separator + k if prefix else k
+            if isinstance(v, collections.Mapping):
+                stack.append((new_key, v))
+            elif isinstance(v, list):
+                # the list itself is kept for scripts that parse it,
+                # and each item gets an indexed key.
+                yield new_key, v
+                stack.append((new_key, v))
+            else:
+                yield new_key, v
+
+
+def flatten(d, parent_key='', separator=DEFAULT_SEPARATOR):
+    """
+    Flatten nested mappings and lists into a single level dict.
+    Nested keys are joined with 'separator' and list items are keyed by
+    their index, e.g. {'a': {'b': [1]}} -> {'a_b': [1], 'a_b_0': 1}.
+    """
+    return dict(_iter_flattened(d, parent_key, separator))
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, str):
+        return value
+    return repr(value)
+
+
+def _get_static_block():
+    """
+    Variables that only depend on the agent's configuration. Built once
+    per process and rebuilt only if the manager settings change.
+
+    With PRELOAD_ENV, BASH_ENV is the loader of the helper bundle, so
+    every cfy_* function is defined in scripts before they start. The
+    agent's own BASH_ENV is sourced by the loader. Otherwise scripts
+    inherit the agent's BASH_ENV.
+    """
+    global _static_block
+    key = (get_manager_ip(),
+           utils.get_manager_file_server_blueprints_root_url(),
+           os.environ.get('BASH_ENV'),
+           os.environ.get(HELPERS_DIR_ENV),
+           os.environ.get(PRELOAD_ENV, '').lower() == 'true')
+    cached_key, block = _static_block
+    if cached_key == key:
+        return key, block
+
+    resources_path = dirname(resources.__file__)
+    block = {
+        'CLOUDIFY_MANAGER_IP': key[0].encode('utf-8'),
+        'CLOUDIFY_LOGGING': os.path.join(resources_path, "logging.sh"),
+        'CLOUDIFY_CTX': os.path.join(resources_path, "ctx.sh"),
+        'CLOUDIFY_FILE_SERVER': os.path.join(resources_path,
+                                             "file_server.sh")
+    }
+    try:
+        bundle = get_helper_bundle()
+        loader = get_helper_loader()
+    except (IOError, OSError):
+        # scripts source the libraries themselves, as they always could
+        bundle = None
+    if bundle is not None:
+        block['CLOUDIFY_HELPERS'] = bundle
+        if key[4]:
+            block['BASH_ENV'] = loader
+            if key[2] and key[2] not in (bundle, loader):
+                block[CHAINED_BASH_ENV] = key[2]
+    _static_block = (key, block)
+    return key, block
+
+
+def _properties_fingerprint(properties):
+    return hashlib.sha1(json.dumps(properties, sort_keys=True,
+                                   default=repr)).hexdigest()
+
+
+def _get_node_block(ctx, separator, max_value_size):
+    """
+    Variables of a node: the static block, the node's identifiers and its
+    flattened properties, memoized on (deployment, node, properties).
+    Returns a (variables, large values) tuple.
+    """
+    with _lock:
+        static_key, static_block = _get_static_block()
+        key = (static_key, ctx.blueprint_id, ctx.deployment_id, ctx.node_id,
+               _properties_fingerprint(ctx.properties), separator,
+               max_value_size)
+        cached = _node_blocks.pop(key, None)
+        if cached is None:
+            block = dict(static_block)
+            large = {}
+            # See in context.py
+            # https://github.com/CloudifySource
+            # /cosmo-celery-common/blob/develop/cloudify/context.py
+            block['CLOUDIFY_NODE_ID'] = ctx.node_id.encode('utf-8')
+            block['CLOUDIFY_BLUEPRINT_ID'] = ctx.blueprint_id.encode('utf-8')
+            block['CLOUDIFY_DEPLOYMENT_ID'] = \
+                ctx.deployment_id.encode('utf-8')
+            url = '{0}/{1}'.format(static_key[1], ctx.blueprint_id)
+            block['CLOUDIFY_FILE_SERVER_BLUEPRINT_ROOT'] = url.encode('utf-8')
+
+            # inject each property as an environment variable.
+            for k, value in _iter_flattened(ctx.properties,
+                                            separator=separator):
+                value = _encode(value)
+                if max_value_size is not None \
+                        and len(value) > max_value_size:
+                    block.pop(k, None)
+                    large[k] = value
+                else:
+                    large.pop(k, None)
+                    block[k] = value
+            for k in large:
+                offloaded = k + OFFLOADED_SUFFIX
+                if offloaded in block or offloaded in large:
+                    raise ValueError(
+                        'Property {0} is over {1} bytes and would be '
+                        'passed as {2}, which is a property of its own'
+                        .format(k, max_value_size, offloaded))
+
+            cached = (block, large)
+            while len(_node_blocks) >= MAX_CACHED_ENVIRONMENTS:
+                _node_blocks.popitem(last=False)
+        _node_blocks[key] = cached
+        return cached
+
+
+def setup_environment(ctx, offload_dir=None, separator=DEFAULT_SEPARATOR,
+                      max_value_size=DEFAULT_MAX_VALUE_SIZE):
+    """
+    Add some useful environment variables to the environment
+
+    Properties are flattened with flatten(). If offload_dir is given,
+    property values larger than max_value_size bytes are written to files
+    in it and '<key>_FILE' holds the file's path instead of '<key>'
+    holding the value, so the size of the environment (and the cost of
+    exec) does not grow with the property payload. ValueError is raised
+    if '<key>_FILE' is a property of its own.
+    """
+
+    env = os.environ.copy()
+    env['CLOUDIFY_EXECUTION_ID'] = ctx.execution_id.encode('utf-8')
+    if offload_dir is None:
+        max_value_size = None
+    block, large = _get_node_block(ctx, separator, max_value_size)
+    env.update(block)
+    for key, value in large.iteritems():
+        env[key + OFFLOADED_SUFFIX] = _offload(offload_dir, key, value)
+    return env
+
+
+def _offload(offload_dir, key, value):
+    fd, path = tempfile.mkstemp(dir=offload_dir,
+                                prefix=re.sub(r'[^\w.-]', '_', key) + '-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(value)
+    return path
@@ -0,0 +1,175 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import hashlib
+import os
+import pipes
+import re
+import tempfile
+import threading
+from os.path import dirname
+
+from bash_runner import resources
+from bash_runner.state import ensure_private_directory
+from bash_runner.state import get_state_dir
+from bash_runner.state import is_private_file
+
+# Environment variable setting the directory bundles are written to, by
+# default 'helpers' in the state directory (see get_state_dir). It must be
+# private to the agent's user, see check_private_directory.
+HELPERS_DIR_ENV = 'CLOUDIFY_BASH_HELPERS_DIR'
+
+# Environment variable making the loader the BASH_ENV of scripts (see
+# setup_environment), set to 'true'. Off by default: it saves scripts
+# using the helpers nothing measurable (benchmarks/helpers.py), and
+# changes the environment of every script and bash it starts.
+PRELOAD_ENV = 'CLOUDIFY_BASH_PRELOAD_HELPERS'
+
+# The helper libraries, in the order they are bundled.
+HELPER_FILES = ('logging.sh', 'ctx.sh', 'file_server.sh')
+
+# Variable of scripts' environment the loader sources at its end, holding
+# the agent's own BASH_ENV, if any.
+CHAINED_BASH_ENV = 'CLOUDIFY_BASH_ENV'
+
+# '[ -n "${__cfy_<name>_loaded}" ] && return 0', which each library
+# starts with. In a bundle, returning would skip the libraries after it.
+_GUARD = re.compile(r'^\[ -n "\$\{__cfy_\w+_loaded\}" \] && return 0\n',
+                    re.MULTILINE)
+
+# The public functions a bundle defines, which the loader stubs.
+_FUNCTION = re.compile(r'^function (cfy_\w+)\(\)', re.MULTILINE)
+
+# Comment and blank lines, left out of bundles: bash would read and skip
+# them in every script. The libraries have no here-documents.
+_COMMENTS = re.compile(r'^[ \t]*(#.*)?\n', re.MULTILINE)
+
+
+def helper_paths():
+    resources_path = dirname(resources.__file__)
+    return [os.path.join(resources_path, name) for name in HELPER_FILES]
+
+
+def build_bundle():
+    """
+    The content of the helper bundle and its version (the digest of the
+    libraries): every library without its comments or its guard, so
+    sourcing the bundle always defines every function, and still marks
+    each library loaded.
+    """
+    parts = []
+    for path in helper_paths():
+        with open(path) as f:
+            content = f.read()
+        parts.append(_COMMENTS.sub('', _GUARD.sub('', content, 1)))
+    body = ''.join(parts)
+    version = hashlib.sha256(body).hexdigest()[:16]
+    return ('# Cloudify bash plugin helpers, version {0}\n'
+            '# Generated from {1}, do not edit.\n'
+            '__cfy_helpers_version={0}\n'
+            '{2}'
+            .format(version, ', '.join(HELPER_FILES), body)), version
+
+
+def build_loader(bundle, bundle_path, version):
+    """
+    The content of the loader of a bundle, the file scripts get as
+    BASH_ENV: a one line stub per public function, which sources the
+    bundle and calls the function it defined. Bash then only parses the
+    bundle in scripts using the helpers. The agent's own BASH_ENV, if
+    any, is sourced at its end.
+    """
+    stubs = ''.join('{0}(){{ . "$__cfy_helpers"; {0} "$@"; }}\n'.format(name)
+                    for name in _FUNCTION.findall(bundle))
+    return ('# Cloudify bash plugin helpers loader, version {0}\n'
+            '# Generated, do not edit.\n'
+            '__cfy_helpers_version={0}\n'
+            '__cfy_helpers={1}\n'
+            '{2}'
+            'if [ -n "${{{3}}}" ]; then . "${{{3}}}"; fi\n'
+            .format(version, pipes.quote(bundle_path), stubs,
+                    CHAINED_BASH_ENV))
+
+
+_bundles = {}
+_bundles_lock = threading.Lock()
+
+
+def get_helper_bundle():
+    """
+    Return the path of the helper bundle, a single file defining every
+    cfy_* function. It is written once per plugin version, under a name
+    holding the version, and looked up once per process. Files found
+    there are only reused if they are the agent's own and hold what it
+    would write: every script sources them.
+
+    Warm bash workers source it at startup. Scripts may get its loader
+    as BASH_ENV (see get_helper_loader). Scripts that still source
+    $CLOUDIFY_LOGGING and the other libraries themselves find them
+    loaded.
+    """
+    return _get_paths()[0]
+
+
+def get_helper_loader():
+    """
+    Return the path of the loader of the helper bundle, written next to
+    it (see build_loader). With PRELOAD_ENV, setup_environment makes it
+    the BASH_ENV of scripts, so every cfy_* function is defined in them
+    before they start, at the cost of reading a few stubs.
+    """
+    return _get_paths()[1]
+
+
+def _get_paths():
+    directory = os.environ.get(HELPERS_DIR_ENV) or \
+        os.path.join(get_state_dir(), 'helpers')
+    with _bundles_lock:
+        paths = _bundles.get(directory)
+        if paths is None:
+            ensure_private_directory(directory)
+            content, version = build_bundle()
+            path = os.path.join(directory,
+                                'cfy-helpers-{0}.sh'.format(version))
+            loader_path = os.path.join(
+                directory, 'cfy-helpers-{0}-loader.sh'.format(version))
+            _ensure_content(path, content)
+            _ensure_content(loader_path,
+                            build_loader(content, path, version))
+            paths = _bundles[directory] = (path, loader_path)
+        return paths
+
+
+def _ensure_content(path, content):
+    if is_private_file(path):
+        with open(path) as f:
+            if f.read() == content:
+                return
+    _write(path, content)
+
+
+def _write(path, content):
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(temp_path, 0644)
+        os.rename(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,187 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import httplib
+import socket
+import threading
+import urlparse
+
+from bash_runner.zero_copy import copy_fd
+from bash_runner.zero_copy import copy_stream
+
+DEFAULT_POOL_SIZE = 4
+
+DEFAULT_TIMEOUT = 60
+
+
+class HTTPError(Exception):
+    """
+    Raised for responses with an unexpected status.
+    """
+    def __init__(self, url, status, reason):
+        Exception.__init__(self, 'GET {0} failed: {1} {2}'.format(
+            url, status, reason))
+        self.url = url
+        self.status = status
+
+
+class ConnectionPool(object):
+    """
+    Keep-alive HTTP connections to one server.
+
+    Up to 'size' idle connections are kept for reuse, more may be open at
+    once. A request on a reused connection the server closed meanwhile is
+    retried once on a new connection.
+    """
+
+    def __init__(self, scheme, netloc, size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.size = size
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def request(self, path, headers=None):
+        """
+        Send a GET request and return its PooledResponse.
+        """
+        while True:
+            connection, reused = self._acquire()
+            try:
+                connection.request('GET', path, headers=headers or {})
+                response = connection.getresponse()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            return PooledResponse(self, connection, response)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+            self.connections_opened += 1
+        if self.scheme == 'https':
+            connection = httplib.HTTPSConnection(self.netloc,
+                                                 timeout=self.timeout)
+        else:
+            connection = httplib.HTTPConnection(self.netloc,
+                                                timeout=self.timeout)
+        return connection, False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+
+class PooledResponse(object):
+    """
+    An httplib response whose connection returns to its pool on close(),
+    if the body was read to the end.
+    """
+
+    def __init__(self, pool, connection, response):
+        self.status = response.status
+        self.reason = response.reason
+        self._pool = pool
+        self._connection = connection
+        self._response = response
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    @property
+    def length(self):
+        """
+        Bytes of the body left to read, None if unknown (e.g. chunked).
+        """
+        if self._response.chunked:
+            return None
+        return self._response.length
+
+    def read(self, amount=None):
+        return self._response.read(amount)
+
+    def fileno(self):
+        """
+        The connection's socket, positioned at the unread part of the
+        body: responses are parsed unbuffered. Reading from it directly
+        leaves the connection unusable for further requests. Over https
+        the socket carries the encrypted stream, see copy_to.
+        """
+        return self._response.fileno()
+
+    def copy_to(self, fd, length, timeout=None):
+        """
+        Copy up to length bytes of the body to fd and return the number
+        copied. Over plain HTTP they are spliced from the socket, which
+        leaves the connection unusable as fileno() does, over https they
+        are read through TLS.
+        """
+        if self._pool.scheme == 'https':
+            return copy_stream(self.read, fd, length, timeout)
+        return copy_fd(self.fileno(), fd, length, timeout)
+
+    def close(self):
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        if self._response.length == 0:
+            # e.g. a 304, whose empty body was not read
+            self._response.read()
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._release(connection)
+        else:
+            self._response.close()
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(url):
+    """
+    Return the process wide ConnectionPool of url's server and the path
+    (with query) to request from it.
+    """
+    parsed = urlparse.urlsplit(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        path = '{0}?{1}'.format(path, parsed.query)
+    key = (parsed.scheme, parsed.netloc)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(*key)
+        return pool, path
@@ -0,0 +1,105 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import os
+import shlex
+import sys
+from distutils.spawn import find_executable
+
+from bash_runner.bash_pool import get_bash_pool
+from bash_runner.python_pool import get_python_pool
+
+# Interpreters of scripts without a shebang, by file extension. Names
+# are looked up in the agent's PATH.
+EXTENSIONS = {
+    '.sh': '/bin/bash',
+    '.bash': '/bin/bash',
+    '.py': 'python',
+    '.pl': 'perl',
+    '.rb': 'ruby'
+}
+
+# Interpreter of scripts nothing else tells about.
+DEFAULT_INTERPRETER = '/bin/bash'
+
+# Shells whose scripts run with bash, as every script of this plugin used
+# to: they source the helper libraries, which need bash, and may rely on
+# its extensions. Like then, their shebang's argument (e.g. '-e') is
+# ignored.
+_BASH_ALIASES = ('sh', 'bash')
+
+# Bytes read from the start of a script looking for a shebang (Linux
+# reads at most 128, older kernels 80).
+_SHEBANG_SIZE = 256
+
+
+def interpreter_command(script, interpreter=None):
+    """
+    The argv running script: with interpreter if given (a command line,
+    e.g. 'python -u'), otherwise with the interpreter of its shebang or,
+    failing that, of its extension (see EXTENSIONS), or bash.
+
+    Interpreters are executed directly: '#!/usr/bin/env <name>' and bare
+    names are looked up in the agent's PATH, a shebang's argument is
+    passed on as the kernel would (a single argument). Scripts of sh and
+    bash run as '/bin/bash script', without their shebang's argument.
+    """
+    if interpreter:
+        argv = shlex.split(interpreter)
+    else:
+        argv = _shebang(script)
+        if argv is None:
+            _, extension = os.path.splitext(script)
+            argv = [EXTENSIONS.get(extension.lower(), DEFAULT_INTERPRETER)]
+    if os.path.basename(argv[0]) == 'env' and len(argv) == 2 and \
+            '=' not in argv[1] and not argv[1].startswith('-'):
+        argv = argv[1:]
+    if os.path.basename(argv[0]) in _BASH_ALIASES:
+        argv = [DEFAULT_INTERPRETER] + (argv[1:] if interpreter else [])
+    elif os.sep not in argv[0]:
+        argv[0] = find_executable(argv[0]) or argv[0]
+    return argv + [script]
+
+
+def _shebang(script):
+    with open(script, 'rb') as f:
+        head = f.read(_SHEBANG_SIZE)
+    if not head.startswith('#!'):
+        return None
+    line = head[2:].split('\n', 1)[0].strip()
+    if not line:
+        return None
+    return line.split(None, 1)
+
+
+def get_warm_pool(argv):
+    """
+    The pool of warm workers that can run argv, or None. Warm workers run
+    scripts of bash (['/bin/bash', script], with bash 5 or later, see
+    get_bash_pool) and of the agent's own Python interpreter.
+    """
+    if len(argv) != 2:
+        return None
+    if argv[0] == '/bin/bash':
+        return get_bash_pool()
+    if _same_file(argv[0], sys.executable):
+        return get_python_pool()
+    return None
+
+
+def _same_file(path, other):
+    try:
+        return os.path.samefile(path, other)
+    except OSError:
+        return False
@@ -0,0 +1,389 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import ctypes
+import ctypes.util
+import errno
+import itertools
+import os
+import platform
+import resource
+import signal
+import threading
+
+# Environment variable naming the cgroup v2 directory under which scripts
+# get cgroups of their own. Unset (or 'none'), setrlimit() is used. It
+# can not be the agent's own cgroup: cgroup v2 only gives controllers to
+# the children of cgroups without processes of their own. It must be an
+# empty cgroup delegated to the agent's user, e.g. a child of the
+# agent's systemd unit (Delegate=yes) the agent does not run in.
+CGROUP_ENV = 'CLOUDIFY_BASH_CGROUP'
+CGROUP_NONE = 'none'
+
+# Prefix of the cgroups created for scripts.
+CGROUP_PREFIX = 'cloudify-bash-'
+
+# Names of the limits a script may exceed, see Sandbox.breach().
+CPU_SECONDS = 'cpu_seconds'
+ADDRESS_SPACE = 'address_space'
+PROCESSES = 'processes'
+
+_IONICE_CLASSES = {
+    'realtime': 1,
+    'best-effort': 2,
+    'idle': 3
+}
+
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+
+_IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'armv7l': 314,
+    'ppc64le': 273,
+    's390x': 282
+}
+
+
+class ResourceLimits(object):
+    """
+    Limits of a script and everything it starts. None leaves a limit
+    unset.
+
+        cpu_seconds - CPU time of each process (RLIMIT_CPU). Exceeding
+                      it kills the process with SIGXCPU.
+
+        address_space - Bytes of memory. With a cgroup, the memory.max
+                        of the whole script, otherwise the virtual
+                        address space of each process (RLIMIT_AS).
+
+        open_files - Open file descriptors of each process
+                     (RLIMIT_NOFILE).
+
+        processes - With a cgroup, the pids.max of the whole script.
+                    Otherwise RLIMIT_NPROC, which counts every process
+                    of the agent's user and does not apply to root.
+
+        nice - Added to the agent's niceness.
+
+        ionice - I/O scheduling class: 'idle', 'best-effort' or
+                 'realtime', optionally followed by ':<level>' (0-7).
+    """
+
+    FIELDS = ('cpu_seconds', 'address_space', 'open_files', 'processes',
+              'nice', 'ionice')
+
+    def __init__(self, cpu_seconds=None, address_space=None,
+                 open_files=None, processes=None, nice=None, ionice=None):
+        self.cpu_seconds = _non_negative('cpu_seconds', cpu_seconds)
+        self.address_space = _non_negative('address_space', address_space)
+        self.open_files = _non_negative('open_files', open_files)
+        self.processes = _non_negative('processes', processes)
+        self.nice = None if nice is None else int(nice)
+        self.ionice = None if ionice is None else _parse_ionice(ionice)
+
+    @classmethod
+    def from_dict(cls, limits):
+        """
+        ResourceLimits from an operation input: a dict of the keyword
+        arguments, or an instance, returned as is.
+        """
+        if isinstance(limits, cls):
+            return limits
+        unknown = set(limits) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError('Unknown resource limits: {0}'.format(
+                ', '.join(sorted(unknown))))
+        return cls(**dict((str(k), v) for k, v in limits.iteritems()))
+
+    def __nonzero__(self):
+        return any(getattr(self, name) is not None for name in self.FIELDS)
+
+
+def _non_negative(name, value):
+    if value is None:
+        return None
+    value = int(value)
+    if value < 0:
+        raise ValueError('{0} must not be negative: {1}'.format(name, value))
+    return value
+
+
+def _parse_ionice(value):
+    name, _, level = str(value).partition(':')
+    if name not in _IONICE_CLASSES:
+        raise ValueError('Unknown ionice class: {0}'.format(name))
+    level = int(level) if level else 0
+    if not 0 <= level <= 7:
+        raise ValueError('ionice level must be between 0 and 7: {0}'
+                         .format(level))
+    return _IONICE_CLASSES[name] << _IOPRIO_CLASS_SHIFT | level
+
+
+class Sandbox(object):
+    """
+    Applies a script's ResourceLimits.
+
+    enter() runs in the child, between fork and exec: it joins the
+    script's cgroup, if any, then sets the rlimits and priorities. The
+    limits are inherited by everything the script starts. Whatever still
+    runs when the script exited stays in its cgroup, which is removed
+    once empty (see CgroupParent).
+
+    'fallback' tells why the address_space and processes limits are set
+    per process with setrlimit() rather than with a cgroup, or is None.
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.cgroup = None
+        self.fallback = None
+        if limits.ionice is not None and _ioprio_set is None:
+            raise RuntimeError('ionice is not supported on {0}'.format(
+                platform.machine()))
+        if limits.address_space is not None or limits.processes is not None:
+            parent = get_cgroup_parent()
+            if parent is None:
+                self.fallback = '{0} is not set'.format(CGROUP_ENV)
+            else:
+                try:
+                    self.cgroup = parent.create(limits)
+                except CgroupUnavailable as e:
+                    self.fallback = str(e)
+        self._rlimits = []
+        if limits.cpu_seconds is not None:
+            # the hard limit a second later: SIGKILL, if SIGXCPU is ignored
+            self._rlimits.append((resource.RLIMIT_CPU,
+                                  (limits.cpu_seconds,
+                                   limits.cpu_seconds + 1)))
+        if limits.open_files is not None:
+            self._rlimits.append((resource.RLIMIT_NOFILE,
+                                  (limits.open_files, limits.open_files)))
+        if self.cgroup is None:
+            if limits.address_space is not None:
+                self._rlimits.append((resource.RLIMIT_AS,
+                                      (limits.address_space,
+                                       limits.address_space)))
+            if limits.processes is not None:
+                self._rlimits.append((resource.RLIMIT_NPROC,
+                                      (limits.processes, limits.processes)))
+
+    def enter(self):
+        if self.cgroup is not None:
+            self.cgroup.attach()
+        for limit, values in self._rlimits:
+            resource.setrlimit(limit, values)
+        if self.limits.nice is not None:
+            os.nice(self.limits.nice)
+        if self.limits.ionice is not None:
+            if _ioprio_set(_IOPRIO_WHO_PROCESS, 0, self.limits.ionice) != 0:
+                code = ctypes.get_errno()
+                raise OSError(code, os.strerror(code))
+
+    def breach(self, return_code):
+        """
+        The name of the limit a script that exited with return_code
+        exceeded, or None. Only detectable breaches are reported: CPU
+        time (SIGXCPU, in the script or as its last command's status)
+        and, with a cgroup, memory and processes.
+        """
+        if self.limits.cpu_seconds is not None and \
+                return_code in (-signal.SIGXCPU, 128 + signal.SIGXCPU):
+            return CPU_SECONDS
+        if self.cgroup is not None:
+            return self.cgroup.breach()
+        return None
+
+    def close(self):
+        if self.cgroup is not None:
+            self.cgroup.close()
+            self.cgroup = None
+
+
+class Cgroup(object):
+    """
+    The cgroup v2 directory of one script.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def attach(self):
+        # '0' is the writing process itself
+        _write(os.path.join(self.path, 'cgroup.procs'), '0')
+
+    def breach(self):
+        if _event(os.path.join(self.path, 'memory.events'), 'oom_kill'):
+            return ADDRESS_SPACE
+        if _event(os.path.join(self.path, 'pids.events'), 'max'):
+            return PROCESSES
+        return None
+
+    def close(self):
+        try:
+            os.rmdir(self.path)
+        except OSError as e:
+            # EBUSY: processes left running; removed by a later sweep
+            if e.errno not in (errno.EBUSY, errno.ENOENT, errno.ENOTEMPTY):
+                raise
+
+
+class CgroupParent(object):
+    """
+    A cgroup v2 directory under which each limited script gets a cgroup
+    of its own: the memory limit becomes its memory.max and the process
+    limit its pids.max, which cover the whole script. Creating one
+    removes those of earlier scripts that became empty.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._names = itertools.count()
+
+    def create(self, limits):
+        """
+        Return a Cgroup with the memory and processes limits, or None if
+        neither is set. Raises CgroupUnavailable if the controllers are
+        not available here.
+        """
+        controllers = []
+        if limits.address_space is not None:
+            controllers.append('memory')
+        if limits.processes is not None:
+            controllers.append('pids')
+        if not controllers:
+            return None
+        self._enable(controllers)
+        self._sweep()
+        path = os.path.join(self.path, '{0}{1}-{2}'.format(
+            CGROUP_PREFIX, os.getpid(), next(self._names)))
+        os.mkdir(path)
+        cgroup = Cgroup(path)
+        try:
+            if limits.address_space is not None:
+                _write(os.path.join(path, 'memory.max'),
+                       str(limits.address_space))
+                # otherwise the limit only moves memory to swap
+                swap_max = os.path.join(path, 'memory.swap.max')
+                if os.path.exists(swap_max):
+                    _write(swap_max, '0')
+            if limits.processes is not None:
+                _write(os.path.join(path, 'pids.max'), str(limits.processes))
+        except BaseException:
+            cgroup.close()
+            raise
+        return cgroup
+
+    def _enable(self, controllers):
+        subtree_control = os.path.join(self.path, 'cgroup.subtree_control')
+        try:
+            enabled = _read(subtree_control).split()
+            missing = [c for c in controllers if c not in enabled]
+            if missing:
+                _write(subtree_control,
+                       ' '.join('+' + c for c in missing))
+                enabled = _read(subtree_control).split()
+        except (IOError, OSError) as e:
+            if e.errno == errno.EBUSY:
+                raise CgroupUnavailable(
+                    '{0} holds processes, it can not delegate controllers'
+                    .format(self.path))
+            raise CgroupUnavailable('Cannot enable the {0} controllers of '
+                                    '{1}: {2}'.format(', '.join(controllers),
+                                                      self.path, e))
+        missing = [c for c in controllers if c not in enabled]
+        if missing:
+            raise CgroupUnavailable('{0} has no {1} controllers'.format(
+                self.path, ', '.join(missing)))
+
+    def _sweep(self):
+        for name in os.listdir(self.path):
+            if name.startswith(CGROUP_PREFIX):
+                path = os.path.join(self.path, name)
+                if _event(os.path.join(path, 'cgroup.events'), 'populated'):
+                    continue
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    continue
+
+
+class CgroupUnavailable(Exception):
+    """
+    Raised when scripts can not get cgroups with the controllers their
+    limits need.
+    """
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _write(path, value):
+    with open(path, 'w') as f:
+        f.write(value)
+
+
+def _event(path, name):
+    """
+    The count of name in a cgroup events file, 0 if missing.
+    """
+    try:
+        for line in _read(path).splitlines():
+            key, _, value = line.partition(' ')
+            if key == name:
+                return int(value)
+    except (IOError, OSError, ValueError):
+        pass
+    return 0
+
+
+_cgroup_parents = {}
+_cgroup_lock = threading.Lock()
+
+
+def get_cgroup_parent():
+    """
+    Return the process wide CgroupParent configured by CGROUP_ENV, or
+    None for the setrlimit() fallback.
+    """
+    path = os.environ.get(CGROUP_ENV)
+    if not path or path == CGROUP_NONE:
+        return None
+    with _cgroup_lock:
+        if path not in _cgroup_parents:
+            _cgroup_parents[path] = CgroupParent(path)
+        return _cgroup_parents[path]
+
+
+def _load_ioprio_set():
+    number = _IOPRIO_SET_SYSCALLS.get(platform.machine())
+    name = ctypes.util.find_library('c')
+    if number is None or not name:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+
+    def ioprio_set(which, who, priority):
+        return libc.syscall(number, which, who, priority)
+    return ioprio_set
+
+
+_ioprio_set = _load_ioprio_set()
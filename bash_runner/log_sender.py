@@ -0,0 +1,317 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import atexit
+import logging
+import os
+import Queue
+import threading
+import time
+
+# Records waiting to be shipped before new lines start being dropped.
+DEFAULT_QUEUE_SIZE = 10000
+
+# Maximum number of records the sender thread takes per wakeup.
+DEFAULT_BATCH_SIZE = 200
+
+# Seconds close() and wait() wait for the sender thread to drain the
+# queue.
+DEFAULT_CLOSE_TIMEOUT = 30
+
+# A LineBatch is shipped once its first line waited this many seconds,
+DEFAULT_STREAM_INTERVAL = 0.25
+
+# or once it holds this many bytes.
+DEFAULT_STREAM_SIZE = 64 * 1024
+
+_STOP = object()
+
+
+class _Marker(object):
+    """
+    Queued by wait(): set once the records queued before it were shipped.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.shipped = threading.Event()
+
+
+class AsyncLogSender(object):
+    """
+    Forwards script log lines to a logger from a background thread.
+
+    The reading loop only pays for a non blocking queue put, so a slow
+    logger (e.g. one shipping records over AMQP) can never stop it from
+    draining the script's pipes. Along the way:
+
+        - consecutive identical lines are coalesced into a single record,
+          until flush() ships it.
+        - lines over 'rate_limit' per second (token bucket, 'burst' deep)
+          are dropped.
+        - lines arriving while the queue is full are dropped.
+        - the sender thread takes up to 'batch_size' queued records per
+          wakeup, and ships each with its own logger call: records are
+          only joined by a LineBatch (see Execution's stream).
+        - dropped lines are reported with a single warning per batch, to
+          the logger of its last record.
+
+    A single sender can serve several scripts, from several threads: a
+    record goes to the logger passed to emit(), or to 'logger' by default.
+    The agent uses one for the whole process, see get_log_sender().
+
+    Counters: 'emitted' lines handed to the logger, 'dropped' lines,
+    'coalesced' duplicate lines and 'batches' logger calls.
+    """
+
+    def __init__(self,
+                 logger,
+                 queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE,
+                 rate_limit=None,
+                 burst=None):
+        self.logger = logger
+        self.batch_size = batch_size
+        self.rate_limit = rate_limit
+        self.burst = burst or rate_limit
+        self.emitted = 0
+        self.coalesced = 0
+        self.batches = 0
+        # written by the reading threads and the sender thread respectively
+        self._dropped = 0
+        self._failed = 0
+        self._reported_dropped = 0
+        self._allowance = self.burst
+        self._last_check = time.time()
+        self._pending = None
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run,
+                                        name='bash-runner-log-sender')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def info(self, message, logger=None):
+        self.emit(logging.INFO, message, logger)
+
+    def error(self, message, logger=None):
+        self.emit(logging.ERROR, message, logger)
+
+    def emit(self, level, message, logger=None):
+        logger = logger or self.logger
+        with self._lock:
+            pending = self._pending
+            if pending is not None and pending[0] == level \
+                    and pending[1] == message and pending[3] is logger:
+                pending[2] += 1
+                self.coalesced += 1
+                return
+            if pending is not None:
+                self._enqueue(pending)
+            self._pending = [level, message, 1, logger]
+
+    def flush(self):
+        """
+        Queue the record held back for coalescing, so it is shipped
+        without waiting for the next line.
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._enqueue(self._pending)
+                self._pending = None
+
+    def wait(self, logger=None, timeout=DEFAULT_CLOSE_TIMEOUT):
+        """
+        Flush and wait up to timeout seconds for the records queued so far
+        to be shipped, reporting lines dropped meanwhile to logger.
+        Returns whether they were.
+        """
+        self.flush()
+        marker = _Marker(logger)
+        deadline = time.time() + timeout
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except Queue.Full:
+            return False
+        marker.shipped.wait(max(deadline - time.time(), 0))
+        return marker.shipped.is_set()
+
+    @property
+    def dropped(self):
+        return self._dropped + self._failed
+
+    def stats(self):
+        return {
+            'emitted': self.emitted,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'batches': self.batches
+        }
+
+    def close(self, timeout=DEFAULT_CLOSE_TIMEOUT):
+        """
+        Ship everything still pending and stop the sender thread. Records
+        that do not fit in the queue within timeout seconds are dropped.
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            record, self._pending = self._pending, None
+        if record is not None:
+            try:
+                self._queue.put(record, timeout=timeout)
+            except Queue.Full:
+                self._dropped += record[2]
+        try:
+            self._queue.put(_STOP, timeout=max(deadline - time.time(), 0))
+        except Queue.Full:
+            # the thread is stuck in a logger call. It is a daemon thread,
+            # so it does not outlive the process either way.
+            pass
+        self._thread.join(max(deadline - time.time(), 0))
+        self._report_dropped()
+
+    def _enqueue(self, record):
+        if self.rate_limit and not self._take_token():
+            self._dropped += record[2]
+            return
+        try:
+            self._queue.put_nowait(record)
+        except Queue.Full:
+            self._dropped += record[2]
+
+    def _take_token(self):
+        now = time.time()
+        self._allowance = min(
+            self.burst,
+            self._allowance + (now - self._last_check) * self.rate_limit)
+        self._last_check = now
+        if self._allowance < 1:
+            return False
+        self._allowance -= 1
+        return True
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Queue.Empty:
+                    break
+            logger = None
+            for record in batch:
+                if record is _STOP:
+                    stop = True
+                    break
+                if isinstance(record, _Marker):
+                    self._report_dropped(record.logger)
+                    record.shipped.set()
+                    continue
+                level, message, repeats, logger = record
+                if repeats > 1:
+                    message = '{0} (repeated {1} times)'.format(message,
+                                                                repeats)
+                self._log(logger, level, message, repeats)
+            self._report_dropped(logger)
+
+    def _log(self, logger, level, message, lines):
+        self.batches += 1
+        try:
+            logger.log(level, message)
+            self.emitted += lines
+        except Exception:
+            # a failing logger must not kill the sender thread, the lines
+            # are accounted for as dropped instead.
+            self._failed += lines
+
+    def _report_dropped(self, logger=None):
+        dropped = self.dropped
+        if dropped > self._reported_dropped:
+            logger = logger or self.logger
+            try:
+                logger.warning('{0} script log lines were dropped'.format(
+                    dropped - self._reported_dropped))
+            except Exception:
+                pass
+            self._reported_dropped = dropped
+
+
+_sender = None
+_sender_pid = None
+_sender_lock = threading.Lock()
+
+
+def get_log_sender():
+    """
+    Return the process wide AsyncLogSender, started on first use. A
+    single thread ships every script's lines, so a logger keeping a
+    connection per thread (e.g. the AMQP client of cloudify's context
+    logger) opens one for the agent rather than one per operation.
+    """
+    global _sender, _sender_pid
+    with _sender_lock:
+        # the thread of a forking parent does not run in the child
+        if _sender is None or _sender_pid != os.getpid():
+            _sender = AsyncLogSender(logging.getLogger(__name__))
+            _sender_pid = os.getpid()
+            atexit.register(_sender.close)
+        return _sender
+
+
+class LineBatch(object):
+    """
+    Collects the lines of one output stream and hands them to an
+    AsyncLogSender as a single record, keeping the line boundaries: once
+    the first line waited 'interval' seconds or the lines reach 'size'
+    bytes. Callers check due() to honour the interval.
+    """
+
+    def __init__(self, sender, level, logger=None,
+                 interval=DEFAULT_STREAM_INTERVAL, size=DEFAULT_STREAM_SIZE):
+        self.sender = sender
+        self.level = level
+        self.logger = logger
+        self.interval = interval
+        self.size = size
+        self._lines = []
+        self._bytes = 0
+        self._deadline = None
+
+    def add(self, line):
+        if not self._lines:
+            self._deadline = time.time() + self.interval
+        self._lines.append(line)
+        self._bytes += len(line) + 1
+        if self._bytes >= self.size:
+            self.flush()
+
+    def due(self, now):
+        """
+        Ship the lines if their time came. Returns the seconds until
+        they are due, or None without lines.
+        """
+        if not self._lines:
+            return None
+        if now >= self._deadline:
+            self.flush()
+            return None
+        return self._deadline - now
+
+    def flush(self):
+        if self._lines:
+            self.sender.emit(self.level, '\n'.join(self._lines), self.logger)
+            self._lines = []
+            self._bytes = 0
+            self._deadline = None
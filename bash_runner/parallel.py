@@ -0,0 +1,158 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import collections
+import Queue
+import threading
+
+DEFAULT_CONCURRENCY = 4
+
+
+class ScriptJob(object):
+    """
+    A single script in a run_many() request.
+    """
+
+    def __init__(self, name, path, depends_on=None):
+        self.name = name
+        self.path = path
+        self.depends_on = list(depends_on or [])
+
+    def __repr__(self):
+        return 'ScriptJob({0})'.format(self.name)
+
+
+def parse_jobs(scripts):
+    """
+    Build ScriptJobs from a list whose items are either a script path or
+    a dict with 'path' and optional 'name' (defaults to the path) and
+    'depends_on' (list of names). Raises RuntimeError on duplicate names,
+    unknown dependencies and dependency cycles.
+    """
+    jobs = []
+    names = set()
+    for script in scripts:
+        if isinstance(script, basestring):
+            job = ScriptJob(script, script)
+        else:
+            job = ScriptJob(script.get('name', script['path']),
+                            script['path'],
+                            script.get('depends_on'))
+        if job.name in names:
+            raise RuntimeError('Duplicate script name: {0}'.format(job.name))
+        names.add(job.name)
+        jobs.append(job)
+
+    for job in jobs:
+        for dependency in job.depends_on:
+            if dependency not in names:
+                raise RuntimeError('Script {0} depends on unknown script {1}'
+                                   .format(job.name, dependency))
+    _check_cycles(jobs)
+    return jobs
+
+
+def _check_cycles(jobs):
+    remaining = dict((job.name, set(job.depends_on)) for job in jobs)
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise RuntimeError('Dependency cycle between scripts: {0}'
+                               .format(', '.join(sorted(remaining))))
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def run_jobs(jobs, target, concurrency=DEFAULT_CONCURRENCY, fail_fast=True):
+    """
+    Run target(job) for every job on a pool of at most 'concurrency'
+    threads. A job starts once all of its dependencies succeeded.
+
+    With fail_fast, no new job is started after the first failure (jobs
+    already running are allowed to finish). Otherwise every job whose
+    dependencies succeeded is run.
+
+    Returns a (results, errors, skipped) tuple: a dict of job name to
+    target's return value, a list of (name, exception) in completion
+    order and the names of jobs that never ran.
+    """
+    by_name = dict((job.name, job) for job in jobs)
+    waiting_on = dict((job.name, set(job.depends_on)) for job in jobs)
+    dependents = dict((job.name, []) for job in jobs)
+    for job in jobs:
+        for dependency in job.depends_on:
+            dependents[dependency].append(job.name)
+
+    work = Queue.Queue()
+    done = Queue.Queue()
+
+    def worker():
+        while True:
+            job = work.get()
+            if job is None:
+                return
+            try:
+                done.put((job, target(job), None))
+            except Exception as e:
+                done.put((job, None, e))
+
+    workers = max(1, min(concurrency, len(jobs)))
+    threads = []
+    for _ in range(workers):
+        thread = threading.Thread(target=worker,
+                                  name='bash-runner-worker')
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    results = {}
+    errors = []
+    started = set()
+    ready = collections.deque(job for job in jobs
+                              if not waiting_on[job.name])
+    running = 0
+    stopped = False
+
+    try:
+        while True:
+            # only hand out as many jobs as there are idle workers, so
+            # fail_fast can still hold back everything not yet started.
+            while ready and running < workers and not stopped:
+                job = ready.popleft()
+                work.put(job)
+                started.add(job.name)
+                running += 1
+            if not running:
+                break
+            job, result, error = done.get()
+            running -= 1
+            if error is not None:
+                errors.append((job.name, error))
+                stopped = stopped or fail_fast
+                continue
+            results[job.name] = result
+            for name in dependents[job.name]:
+                waiting_on[name].discard(job.name)
+                if not waiting_on[name]:
+                    ready.append(by_name[name])
+    finally:
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+
+    skipped = [j.name for j in jobs if j.name not in started]
+    return results, errors, skipped
@@ -0,0 +1,216 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import errno
+import os
+import select
+
+# Size of a single os.read() call. Large enough that a flooding script
+# is drained in a handful of syscalls per wakeup instead of one per line.
+CHUNK_SIZE = 64 * 1024
+
+
+class LineSplitter(object):
+    """
+    Incrementally splits a stream of chunks into lines.
+
+    Partial lines are kept in a single bytearray that is reused between
+    chunks, so no intermediate strings are built for the common case of
+    a chunk that ends on a line boundary.
+    """
+
+    def __init__(self):
+        self._partial = bytearray()
+
+    def feed(self, chunk):
+        """
+        Consume a chunk and return the list of lines it completes.
+        Returned lines do not include the trailing newline.
+        """
+        lines = chunk.split('\n')
+        tail = lines.pop()
+        if lines and self._partial:
+            self._partial.extend(lines[0])
+            lines[0] = str(self._partial)
+            del self._partial[:]
+        if tail:
+            self._partial.extend(tail)
+        return lines
+
+    def flush(self):
+        """
+        Return the pending partial line (if any) and reset the buffer.
+        """
+        if not self._partial:
+            return None
+        line = str(self._partial)
+        del self._partial[:]
+        return line
+
+
+class _Poller(object):
+    """
+    Thin wrapper over epoll/poll/select exposing a single
+    register/unregister/poll interface. The timeout is in seconds
+    (None means block until an event arrives).
+    """
+
+    def __init__(self):
+        if hasattr(select, 'epoll'):
+            self._impl = select.epoll()
+            self._mask = select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR
+            self._scale = 1
+        elif hasattr(select, 'poll'):
+            self._impl = select.poll()
+            self._mask = select.POLLIN | select.POLLHUP | select.POLLERR
+            self._scale = 1000
+        else:
+            self._impl = None
+            self._fds = set()
+
+    def register(self, fd):
+        if self._impl is None:
+            self._fds.add(fd)
+        else:
+            self._impl.register(fd, self._mask)
+
+    def unregister(self, fd):
+        if self._impl is None:
+            self._fds.discard(fd)
+        else:
+            self._impl.unregister(fd)
+
+    def poll(self, timeout=None):
+        if self._impl is None:
+            return select.select(list(self._fds), [], [], timeout)[0]
+        if timeout is None:
+            timeout = -1
+        else:
+            timeout *= self._scale
+        return [fd for fd, event in self._impl.poll(timeout)]
+
+    def close(self):
+        if self._impl is not None and hasattr(self._impl, 'close'):
+            self._impl.close()
+
+
+def _readable(fd):
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        poller.register(fd, select.POLLIN | select.POLLHUP | select.POLLERR)
+        return bool(poller.poll(0))
+    return bool(select.select([fd], [], [], 0)[0])
+
+
+class OutputPump(object):
+    """
+    Event driven reader for child process pipes.
+
+    Each registered file descriptor is drained in CHUNK_SIZE reads whenever
+    the poller reports it readable. Callbacks receive raw chunks, and
+    optionally complete lines, as they arrive. A file descriptor is
+    unregistered as soon as it reaches EOF, so a closed stream never causes
+    the loop to spin.
+    """
+
+    def __init__(self):
+        self._poller = _Poller()
+        self._handlers = {}
+
+    def register(self, fd, on_chunk=None, on_line=None, on_eof=None):
+        """
+        Start pumping fd.
+
+            on_chunk - called with every raw chunk read from fd.
+            on_line - called with every complete line (without the
+                      trailing newline). A trailing partial line is
+                      delivered when fd reaches EOF.
+            on_eof - called once fd reached EOF and was unregistered.
+        """
+        splitter = LineSplitter() if on_line else None
+        self._handlers[fd] = (on_chunk, on_line, splitter, on_eof)
+        self._poller.register(fd)
+
+    def unregister(self, fd):
+        on_chunk, on_line, splitter, on_eof = self._handlers.pop(fd)
+        self._poller.unregister(fd)
+        if splitter is not None:
+            line = splitter.flush()
+            if line is not None:
+                on_line(line)
+
+    def drain(self, fd):
+        """
+        Dispatch what can be read from fd without waiting, then
+        unregister it, e.g. once the writer exited but a process it left
+        running still holds the pipe open.
+        """
+        while fd in self._handlers and _readable(fd):
+            self._read(fd)
+        if fd in self._handlers:
+            self.unregister(fd)
+
+    @property
+    def active(self):
+        return bool(self._handlers)
+
+    def poll(self, timeout=None):
+        """
+        Wait up to timeout seconds for data and dispatch it.
+        Returns the number of file descriptors that were serviced.
+        """
+        try:
+            ready = self._poller.poll(timeout)
+        except (select.error, IOError, OSError) as e:
+            if e.args[0] == errno.EINTR:
+                return 0
+            raise
+        for fd in ready:
+            if fd in self._handlers:
+                self._read(fd)
+        return len(ready)
+
+    def run(self):
+        """
+        Pump until every registered file descriptor reached EOF.
+        """
+        while self.active:
+            self.poll()
+
+    def close(self):
+        for fd in list(self._handlers):
+            self.unregister(fd)
+        self._poller.close()
+
+    def _read(self, fd):
+        try:
+            chunk = os.read(fd, CHUNK_SIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            if e.errno != errno.EIO:
+                raise
+            chunk = ''
+        if not chunk:
+            on_eof = self._handlers[fd][3]
+            self.unregister(fd)
+            if on_eof is not None:
+                on_eof()
+            return
+        on_chunk, on_line, splitter, on_eof = self._handlers[fd]
+        if on_chunk is not None:
+            on_chunk(chunk)
+        if splitter is not None:
+            for line in splitter.feed(chunk):
+                on_line(line)
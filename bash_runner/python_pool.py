@@ -0,0 +1,160 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import atexit
+import os
+import sys
+import threading
+
+from bash_runner.bash_pool import BashWorker
+from bash_runner.bash_pool import BashWorkerPool
+from bash_runner.bash_pool import DEFAULT_POOL_SIZE
+
+# Environment variable setting the number of warm Python workers per
+# agent.
+POOL_SIZE_ENV = 'CLOUDIFY_PYTHON_POOL_SIZE'
+
+# Modules a worker imports once at startup, so scripts find them loaded.
+DEFAULT_PRELOAD = ('json', 'logging', 'shutil', 'subprocess', 'tempfile',
+                   'urllib2')
+
+# Speaks the protocol of the bash worker (see bash_pool.WORKER_PROGRAM)
+# with the same job directories. Every job runs in a fork of the worker,
+# which has the interpreter started and the preloaded modules imported,
+# so nothing a script does outlives it:
+#
+#   - the fork leads its own process group.
+#   - stdin is /dev/null, stdout, stderr and the side channel (fd 3) are
+#     the job's FIFOs.
+#   - the job's environment delta is applied to os.environ.
+#   - the script runs as __main__ with sys.argv[0] and sys.path[0] set
+#     as 'python <script>' would, and its exit code is that of
+#     sys.exit(), 1 for an uncaught exception (printed to stderr).
+#     A job killed by a signal reports 128 + the signal, as bash does.
+#
+# The modules to preload are passed as arguments.
+WORKER_PROGRAM = r'''
+import os
+import runpy
+import sys
+import traceback
+
+for name in sys.argv[1:]:
+    __import__(name)
+del name
+
+
+def run(job):
+    os.setpgid(0, 0)
+    with open(os.path.join(job, '.script')) as f:
+        script = f.readline().rstrip('\n')
+    for fd, name, flags in ((0, os.devnull, os.O_RDONLY),
+                            (1, '.stdout', os.O_WRONLY),
+                            (2, '.stderr', os.O_WRONLY),
+                            (3, '.ctx', os.O_WRONLY)):
+        target = os.open(os.path.join(job, name), flags)
+        if target != fd:
+            os.dup2(target, fd)
+            os.close(target)
+    with open(os.path.join(job, '.env'), 'rb') as f:
+        entries = f.read().split('\0')[:-1]
+    for entry in entries:
+        key, equals, value = entry.partition('=')
+        if equals:
+            os.environ[key] = value
+        else:
+            os.environ.pop(key, None)
+    sys.argv = [script]
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    try:
+        runpy.run_path(script, run_name='__main__')
+        code = 0
+    except SystemExit as e:
+        code = e.code
+        if code is None:
+            code = 0
+        elif not isinstance(code, int):
+            sys.stderr.write('{0}\n'.format(code))
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    return code
+
+
+for line in iter(sys.stdin.readline, ''):
+    job = line.rstrip('\n')
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = run(job)
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code & 0xff)
+    try:
+        # also here: the agent may signal the group as soon as it is told
+        os.setpgid(pid, pid)
+    except OSError:
+        pass
+    sys.stdout.write('pid {0}\n'.format(pid))
+    sys.stdout.flush()
+    _, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        status = 128 + os.WTERMSIG(status)
+    else:
+        status = os.WEXITSTATUS(status)
+    sys.stdout.write('{0}\n'.format(status))
+    sys.stdout.flush()
+'''
+
+
+class PythonWorker(BashWorker):
+    """
+    A long lived Python process running scripts in forks of itself, with
+    the protocol and job directories of a BashWorker. It runs the agent's
+    interpreter, with 'helpers' being the modules to preload.
+    """
+
+    def command(self, helpers):
+        return ([sys.executable, '-c', WORKER_PROGRAM] +
+                list(DEFAULT_PRELOAD if helpers is None else helpers))
+
+
+class PythonWorkerPool(BashWorkerPool):
+    """
+    Pool of warm Python workers, see BashWorkerPool.
+    """
+
+    worker_class = PythonWorker
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_python_pool():
+    """
+    Return the process wide PythonWorkerPool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PythonWorkerPool(
+                int(os.environ.get(POOL_SIZE_ENV, DEFAULT_POOL_SIZE)))
+            atexit.register(_pool.close)
+        return _pool
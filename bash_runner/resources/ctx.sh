@@ -0,0 +1,60 @@
+#!/bin/bash
+# already loaded, e.g. preloaded by a warm bash worker
+[ -n "${__cfy_ctx_loaded}" ] && return 0
+__cfy_ctx_loaded=1
+# Helpers writing JSON records to the plugin's side channel, the file
+# descriptor named by $CLOUDIFY_CTX_FD. Unlike the logging.sh helpers they
+# leave stdout to the script, and messages need no prefix parsing. Like
+# them, builtins and parameter expansion only, so they never fork.
+
+# Set REPLY to $1 as a JSON string literal.
+function __cfy_json_string(){
+    local s=${1//\\/\\\\}
+    s=${s//\"/\\\"}
+    s=${s//$'\n'/\\n}
+    s=${s//$'\r'/\\r}
+    s=${s//$'\t'/\\t}
+    REPLY="\"${s}\""
+}
+
+# cfy_ctx_send RECORD: write a raw JSON record, one line.
+function cfy_ctx_send(){
+    [ -n "${CLOUDIFY_CTX_FD}" ] || return 0
+    builtin printf '%s\n' "$1" >&"${CLOUDIFY_CTX_FD}"
+}
+
+# cfy_log LEVEL MESSAGE...: log at debug, info, warn or error.
+function cfy_log(){
+    local level=$1
+    shift
+    __cfy_json_string "[${0##*/}] $*"
+    cfy_ctx_send "{\"type\": \"log\", \"level\": \"${level}\", \"message\": ${REPLY}}"
+}
+
+# cfy_set_property KEY VALUE: set the string runtime property KEY of the
+# node instance. Updates are buffered by the plugin, only the last value
+# of a key is kept, and stored together when the operation ends.
+function cfy_set_property(){
+    local key
+    __cfy_json_string "$1"
+    key=${REPLY}
+    __cfy_json_string "$2"
+    cfy_ctx_send "{\"type\": \"runtime_property\", \"key\": ${key}, \"value\": ${REPLY}}"
+}
+
+# cfy_set_property_json KEY JSON: same, with a JSON value.
+function cfy_set_property_json(){
+    __cfy_json_string "$1"
+    cfy_ctx_send "{\"type\": \"runtime_property\", \"key\": ${REPLY}, \"value\": $2}"
+}
+
+# cfy_return VALUE: make the operation return the string VALUE.
+function cfy_return(){
+    __cfy_json_string "$1"
+    cfy_ctx_send "{\"type\": \"return\", \"value\": ${REPLY}}"
+}
+
+# cfy_return_json JSON: make the operation return a JSON value.
+function cfy_return_json(){
+    cfy_ctx_send "{\"type\": \"return\", \"value\": $1}"
+}
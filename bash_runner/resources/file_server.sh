@@ -1,2 +1,121 @@
 #!/bin/bash
-function cfy_download_resource() { wget ${CLOUDIFY_FILE_SERVER_BLUEPRINT_ROOT}/$@; }
+# already loaded, e.g. preloaded by a warm bash worker
+[ -n "${__cfy_file_server_loaded}" ] && return 0
+__cfy_file_server_loaded=1
+# Blueprint resources are fetched by the plugin's download service when
+# it is available ($CLOUDIFY_DOWNLOAD_SERVICE, set for scripts of agents
+# running with CLOUDIFY_BASH_DOWNLOAD_SERVICE=true): the request goes
+# over bash's /dev/tcp, so nothing forks, and the plugin keeps
+# connections to the file server alive, revalidates its cached copies,
+# resumes interrupted transfers and checks digests. Otherwise wget is
+# used.
+
+# __cfy_download ITEM...: ask the download service for items of the form
+# 'resource<TAB>target<TAB>sha256'. Returns 2 if there is no service.
+function __cfy_download(){
+    local fd reply
+    [ -n "${CLOUDIFY_DOWNLOAD_SERVICE}" ] || return 2
+    { exec {fd}<>"/dev/tcp/${CLOUDIFY_DOWNLOAD_SERVICE}"; } 2>/dev/null \
+        || return 2
+    builtin printf '%s\n' "${CLOUDIFY_DOWNLOAD_TOKEN}" "${PWD}" "$@" '' \
+        >&"${fd}"
+    read -r reply <&"${fd}"
+    exec {fd}>&-
+    [ "${reply}" = OK ] && return 0
+    builtin printf '%s\n' "${reply#ERROR }" >&2
+    return 1
+}
+
+# __cfy_download_stream RESOURCE SHA256: write RESOURCE to stdout, as the
+# download service sends it: 'OK <length>', the content, 'OK'. Returns 2
+# if there is no service.
+function __cfy_download_stream(){
+    local fd reply
+    [ -n "${CLOUDIFY_DOWNLOAD_SERVICE}" ] || return 2
+    { exec {fd}<>"/dev/tcp/${CLOUDIFY_DOWNLOAD_SERVICE}"; } 2>/dev/null \
+        || return 2
+    builtin printf '%s\n' "${CLOUDIFY_DOWNLOAD_TOKEN}" "${PWD}" \
+        "$1"$'\t-\t'"$2" '' >&"${fd}"
+    read -r reply <&"${fd}"
+    if [ "${reply%% *}" = OK ]; then
+        # head reads no further than the content, leaving the trailer
+        head -c "${reply#OK }" <&"${fd}"
+        reply=
+        read -r reply <&"${fd}"
+    fi
+    exec {fd}>&-
+    [ "${reply}" = OK ] && return 0
+    reply=${reply:-ERROR download interrupted}
+    builtin printf '%s\n' "${reply#ERROR }" >&2
+    return 1
+}
+
+# cfy_download_resource RESOURCE [-O TARGET] [--sha256 DIGEST] [WGET OPTION...]
+# Download RESOURCE to TARGET, or to its name in the current directory,
+# which is replaced if it exists. '-O -' writes it to stdout. With
+# --sha256 the content must have that digest. Other wget options are
+# left to wget.
+#
+# cfy_download_resource --pipe RESOURCE [--sha256 DIGEST]
+# Same as '-O -': stream RESOURCE to stdout, e.g. into
+# 'cfy_download_resource --pipe app.tgz | tar xz', without writing it to
+# the disk first. With --sha256, a mismatch is only reported after the
+# content was written.
+function cfy_download_resource(){
+    local resource target= sha256= other= status
+    local -a wget_args=()
+    if [ "$1" = --pipe ]; then
+        target=-
+        wget_args+=(-O -)
+        shift
+    fi
+    resource=$1
+    shift
+    while [ $# -gt 0 ]; do
+        case "$1" in
+            -O) target=$2; wget_args+=(-O "$2"); shift 2 ;;
+            --sha256) sha256=$2; shift 2 ;;
+            *) other=1; wget_args+=("$1"); shift ;;
+        esac
+    done
+    if [ -z "${other}" ]; then
+        if [ "${target}" = - ]; then
+            __cfy_download_stream "${resource}" "${sha256}"
+        else
+            __cfy_download "${resource}"$'\t'"${target:-${resource##*/}}"$'\t'"${sha256}"
+        fi
+        status=$?
+        [ "${status}" -ne 2 ] && return "${status}"
+    fi
+    if [ "${target}" = - ]; then
+        wget_args+=(-q)
+    fi
+    wget "${CLOUDIFY_FILE_SERVER_BLUEPRINT_ROOT}/${resource}" \
+        "${wget_args[@]}" || return
+    if [ -n "${sha256}" ] && [ "${target}" != - ]; then
+        builtin printf '%s  %s\n' "${sha256}" \
+            "${target:-${resource##*/}}" | sha256sum -c --quiet
+    fi
+}
+
+# cfy_download_resources [-P DIR] RESOURCE...
+# Download several resources in parallel, each to its name in DIR (the
+# current directory by default).
+function cfy_download_resources(){
+    local dir=. resource status
+    local -a items=()
+    if [ "$1" = -P ]; then
+        dir=$2
+        shift 2
+    fi
+    for resource in "$@"; do
+        items+=("${resource}"$'\t'"${dir}/${resource##*/}"$'\t')
+    done
+    __cfy_download "${items[@]}"
+    status=$?
+    [ "${status}" -ne 2 ] && return "${status}"
+    for resource in "$@"; do
+        wget -O "${dir}/${resource##*/}" \
+            "${CLOUDIFY_FILE_SERVER_BLUEPRINT_ROOT}/${resource}" || return
+    done
+}
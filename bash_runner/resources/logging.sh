@@ -1,4 +1,13 @@
 #!/bin/bash
-function cfy_info(){ builtin echo [INFO] [$(basename $0)] $@; }
-function cfy_error(){ builtin echo [ERROR] [$(basename $0)] $@; }
-
+# already loaded, e.g. preloaded by a warm bash worker
+[ -n "${__cfy_logging_loaded}" ] && return 0
+__cfy_logging_loaded=1
+# Each helper prints '[LEVEL] [<script name>] <message>', which the plugin
+# forwards to the operation's logger. Builtins and parameter expansion
+# only, so logging in a loop never forks. The name is expanded on each
+# call since a warm bash worker runs several scripts with this library
+# loaded once.
+function cfy_debug(){ builtin printf '[DEBUG] [%s] %s\n' "${0##*/}" "$*"; }
+function cfy_info(){ builtin printf '[INFO] [%s] %s\n' "${0##*/}" "$*"; }
+function cfy_warn(){ builtin printf '[WARN] [%s] %s\n' "${0##*/}" "$*"; }
+function cfy_error(){ builtin printf '[ERROR] [%s] %s\n' "${0##*/}" "$*"; }
@@ -0,0 +1,136 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import random
+import re
+
+# Seconds before the first retry, doubled for each further one up to
+# DEFAULT_MAX_BACKOFF.
+DEFAULT_BACKOFF = 1
+DEFAULT_MAX_BACKOFF = 60
+
+# Share of each delay that is random, so scripts failing together (e.g.
+# on a mirror going down) do not retry in lockstep.
+DEFAULT_JITTER = 0.5
+
+# Bytes of stdout and stderr kept for each failed attempt.
+ATTEMPT_TAIL_SIZE = 1024
+
+
+class RetryPolicy(object):
+    """
+    When and how often a failed script runs again.
+
+        retries - Attempts after the first one. 0 never retries.
+
+        exit_codes - Return codes that are retried.
+
+        patterns - Regular expressions searched in each stdout and
+                   stderr line; a failure is retried if one matched
+                   (e.g. 'Could not get lock').
+
+        backoff - Seconds before the first retry, doubled for each
+                  further one, up to max_backoff.
+
+        jitter - Share (0 to 1) of each delay that is random.
+
+    Without exit_codes and patterns every failure is retried, otherwise
+    those matching either.
+    """
+
+    FIELDS = ('retries', 'exit_codes', 'patterns', 'backoff', 'max_backoff',
+              'jitter')
+
+    def __init__(self, retries=0, exit_codes=None, patterns=None,
+                 backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF,
+                 jitter=DEFAULT_JITTER):
+        self.retries = int(retries)
+        if self.retries < 0:
+            raise ValueError('retries must not be negative: {0}'
+                             .format(retries))
+        self.exit_codes = frozenset(int(code) for code in exit_codes or ())
+        self.patterns = [re.compile(pattern) for pattern in patterns or ()]
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.jitter = float(jitter)
+        if not 0 <= self.jitter <= 1:
+            raise ValueError('jitter must be between 0 and 1: {0}'
+                             .format(jitter))
+
+    @classmethod
+    def from_dict(cls, policy):
+        """
+        RetryPolicy from an operation input: a dict of the keyword
+        arguments, the number of retries, or an instance, returned as is.
+        """
+        if isinstance(policy, cls):
+            return policy
+        if isinstance(policy, (int, long)):
+            return cls(retries=policy)
+        unknown = set(policy) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError('Unknown retry settings: {0}'.format(
+                ', '.join(sorted(unknown))))
+        return cls(**dict((str(k), v) for k, v in policy.iteritems()))
+
+    def __nonzero__(self):
+        return self.retries > 0
+
+    def matches(self, line):
+        for pattern in self.patterns:
+            if pattern.search(line):
+                return True
+        return False
+
+    def retryable(self, exit_code, matched):
+        """
+        Whether a failure with exit_code is retried, matched telling if
+        one of the patterns was found in its output.
+        """
+        if not self.exit_codes and not self.patterns:
+            return True
+        return exit_code in self.exit_codes or matched
+
+    def delay(self, retry):
+        """
+        Seconds to wait before the retry-th retry (from 1).
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** (retry - 1))
+        return delay * (1 - self.jitter * random.random())
+
+
+class Attempt(object):
+    """
+    One run of a script: 'number' (from 1), when it 'started', its
+    'wall_time', 'exit_code' and the tails of its output, 'stdout_tail'
+    and 'stderr_tail'.
+    """
+
+    def __init__(self, number, started, wall_time, exit_code, stdout_tail,
+                 stderr_tail):
+        self.number = number
+        self.started = started
+        self.wall_time = wall_time
+        self.exit_code = exit_code
+        self.stdout_tail = stdout_tail
+        self.stderr_tail = stderr_tail
+
+    def summary(self):
+        last_line = self.stderr_tail.rstrip('\n').rpartition('\n')[2]
+        return 'attempt {0}: return_code={1} after {2:.1f}s{3}'.format(
+            self.number, self.exit_code, self.wall_time,
+            ': ' + last_line if last_line else '')
+
+    def __repr__(self):
+        return 'Attempt({0})'.format(self.summary())
@@ -0,0 +1,109 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import threading
+import time
+import weakref
+
+# Seconds a runtime property set by a running script may wait before it
+# is stored. Scripts finishing earlier are stored once, by the operation.
+DEFAULT_FLUSH_INTERVAL = 30
+
+_MISSING = object()
+
+
+class RuntimePropertyBuffer(object):
+    """
+    Runtime property updates of the scripts running for one context.
+
+    set() only records the latest value of a key. apply() copies the
+    values that differ from the node instance's current ones into the
+    context, which stores them in Cloudify's storage when the operation
+    ends, in a single update. flush() does so right away with
+    ctx.update(), which flush_if_due() calls for updates older than an
+    interval, so long running scripts publish their properties while
+    they run. Scripts of several threads may share a buffer.
+    """
+
+    def __init__(self, ctx):
+        # a proxy, so the buffers registry does not keep contexts alive
+        self.ctx = weakref.proxy(ctx)
+        self._pending = {}
+        self._pending_since = None
+        self._lock = threading.RLock()
+
+    def set(self, key, value):
+        with self._lock:
+            if self._pending_since is None:
+                self._pending_since = time.time()
+            self._pending[key] = value
+
+    def apply(self):
+        """
+        Set the pending values on the context. Returns the number of
+        properties that changed.
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+            current = self.ctx.runtime_properties
+            changed = 0
+            for key, value in self._pending.iteritems():
+                if current.get(key, _MISSING) != value:
+                    self.ctx[key] = value
+                    changed += 1
+            self._pending.clear()
+            self._pending_since = None
+            return changed
+
+    def flush(self):
+        """
+        Apply the pending values and store them, unless none changed.
+        """
+        with self._lock:
+            if self.apply():
+                self.ctx.update()
+
+    def flush_if_due(self, now, interval):
+        """
+        Flush if the oldest pending value was set at least 'interval'
+        seconds ago (None never flushes). Returns the seconds until the
+        next flush is due, or None if none is.
+        """
+        with self._lock:
+            if interval is None or self._pending_since is None:
+                return None
+            remaining = self._pending_since + interval - now
+            if remaining > 0:
+                return remaining
+            # after a failed update the values stay set on the context,
+            # which stores them when the operation ends
+            self.flush()
+            return None
+
+
+_buffers = weakref.WeakKeyDictionary()
+_buffers_lock = threading.Lock()
+
+
+def get_property_buffer(ctx):
+    """
+    Return the RuntimePropertyBuffer of ctx, shared by all scripts running
+    for it in this process.
+    """
+    with _buffers_lock:
+        buffer = _buffers.get(ctx)
+        if buffer is None:
+            buffer = _buffers[ctx] = RuntimePropertyBuffer(ctx)
+        return buffer
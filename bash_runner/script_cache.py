@@ -0,0 +1,491 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from bash_runner.http_pool import HTTPError
+from bash_runner.http_pool import get_connection_pool
+from bash_runner.state import ensure_private_directory
+from bash_runner.state import get_state_dir
+
+# Environment variables configuring the process wide cache. The directory
+# is 'scripts' in the state directory (see get_state_dir) by default, and
+# setting it to an empty string disables caching.
+CACHE_DIR_ENV = 'CLOUDIFY_BASH_SCRIPT_CACHE_DIR'
+CACHE_SIZE_ENV = 'CLOUDIFY_BASH_SCRIPT_CACHE_SIZE'
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# Resources of at least this size are downloaded in parallel ranges, if
+# the server supports them and more than one part is asked for. One by
+# default: benchmarks/downloads.py did not show ranges beating a single
+# stream.
+DEFAULT_PARALLEL_MIN_SIZE = 64 * 1024 * 1024
+DEFAULT_PARALLEL_PARTS = 1
+
+# Objects used more recently than this (in seconds) are never evicted, so
+# a path handed out by get() stays valid while the script starts.
+EVICTION_GRACE = 60
+
+_COPY_BUFFER_SIZE = 64 * 1024
+
+
+class ScriptCache(object):
+    """
+    On disk, content addressed cache of blueprint resources.
+
+    Layout under 'root':
+
+        index/<sha1(blueprint_id, resource_path)>.json
+            the digest, ETag and Last-Modified of the last download.
+        objects/<sha256 of content>/<resource basename>
+            the content itself. The basename is kept so scripts still see
+            their own name in $0. Objects may be hard linked elsewhere
+            (see DownloadService): one whose size or mtime no longer
+            match the index entry is downloaded again.
+
+        objects/.partial-<key>
+            an interrupted download, resumed with a Range request while
+            the server's validator (ETag or Last-Modified, kept in
+            .partial-<key>.validator) still matches.
+
+    Every get() revalidates the entry with a conditional GET
+    (If-None-Match/If-Modified-Since), over the process wide keep-alive
+    connections of http_pool. Servers that do not support conditional
+    requests are handled by hashing the body: identical content maps to
+    the existing object. All files are written to a temporary name and
+    renamed into place, so concurrent workers (threads or processes)
+    sharing a root never see partial files. Objects are evicted least
+    recently used first once the cache exceeds 'max_size'.
+
+    With 'parallel_parts' over one, resources of at least
+    'parallel_min_size' bytes are fetched as that many ranges on as many
+    connections at once, written in place with splice(). Such downloads
+    are not resumed.
+
+    The agent executes what the cache returns, so 'root' must be private
+    to the agent's user (see check_private_directory): OSError is raised
+    otherwise.
+    """
+
+    def __init__(self, root, max_size=DEFAULT_MAX_SIZE,
+                 parallel_min_size=DEFAULT_PARALLEL_MIN_SIZE,
+                 parallel_parts=DEFAULT_PARALLEL_PARTS):
+        self.root = root
+        self.max_size = max_size
+        self.parallel_min_size = parallel_min_size
+        self.parallel_parts = parallel_parts
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index_dir = os.path.join(root, 'index')
+        self._objects_dir = os.path.join(root, 'objects')
+        self._lock = threading.Lock()
+        ensure_private_directory(root)
+        _makedirs(self._index_dir)
+        _makedirs(self._objects_dir)
+
+    def get(self, blueprint_id, resource_path, base_url, sha256=None):
+        """
+        Return a local path holding the current content of resource_path,
+        downloading it from '<base_url>/<blueprint_id>/<resource_path>'
+        only if it changed. With sha256, the content must have that
+        digest, and a cached object that has it is returned without
+        asking the server; ChecksumMismatch is raised otherwise.
+        """
+        if sha256 is not None:
+            sha256 = sha256.lower()
+        key = hashlib.sha1('{0}\0{1}'.format(blueprint_id, resource_path)
+                           .encode('utf-8')).hexdigest()
+        entry = self._read_entry(key)
+        cached = None
+        if entry is not None:
+            cached = self._object_path(entry['digest'], resource_path)
+            if not _unchanged(cached, entry):
+                entry = cached = None
+        url = '{0}/{1}/{2}'.format(base_url, blueprint_id, resource_path)
+        if cached is not None and entry['digest'] == sha256:
+            self._touch(cached)
+            self._count('hits')
+            return cached
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        pool, request_path = get_connection_pool(url)
+        with _Partial(self._objects_dir, key) as partial:
+            while True:
+                resume_headers = dict(headers)
+                if partial.offset:
+                    resume_headers['Range'] = 'bytes={0}-'.format(
+                        partial.offset)
+                    resume_headers['If-Range'] = partial.validator
+                with pool.request(request_path, resume_headers) as response:
+                    if response.status == 304 and cached is not None:
+                        if sha256 is not None:
+                            raise ChecksumMismatch(url, sha256,
+                                                   entry['digest'])
+                        self._touch(cached)
+                        self._count('hits')
+                        return cached
+                    validator = (response.getheader('ETag') or
+                                 response.getheader('Last-Modified'))
+                    if response.status == 206 and partial.offset and \
+                            _range_start(response) == partial.offset:
+                        pass
+                    elif response.status == 200:
+                        partial.discard()
+                        if self._parallel(response, validator):
+                            digest = partial.receive_parts(
+                                response, pool, request_path, url,
+                                validator, self.parallel_parts)
+                            break
+                        partial.set_validator(validator)
+                    elif response.status in (206, 416) and partial.offset:
+                        # not the range we asked for: start over
+                        partial.discard()
+                        continue
+                    else:
+                        raise HTTPError(url, response.status,
+                                        response.reason)
+                    digest = partial.receive(response)
+                    break
+            if sha256 is not None and digest != sha256:
+                partial.discard()
+                raise ChecksumMismatch(url, sha256, digest)
+            path = self._object_path(digest, resource_path)
+            _makedirs(os.path.dirname(path))
+            partial.commit(path)
+        self._touch(path)
+        stat = os.stat(path)
+        self._write_entry(key, {
+            'digest': digest,
+            'etag': response.getheader('ETag'),
+            'last_modified': response.getheader('Last-Modified'),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime
+        })
+        if path == cached:
+            self._count('hits')
+        else:
+            self._count('misses')
+            self.evict()
+        return path
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def evict(self):
+        """
+        Remove least recently used objects until the cache fits max_size.
+        """
+        objects = []
+        total = 0
+        for digest in os.listdir(self._objects_dir):
+            directory = os.path.join(self._objects_dir, digest)
+            try:
+                size = sum(os.path.getsize(os.path.join(directory, name))
+                           for name in os.listdir(directory))
+                objects.append((os.path.getmtime(directory), size,
+                                directory))
+            except OSError:
+                # a temporary file, or evicted by a concurrent worker
+                continue
+            total += size
+        if total <= self.max_size:
+            return
+        now = time.time()
+        for mtime, size, directory in sorted(objects):
+            if total <= self.max_size:
+                break
+            if now - mtime < EVICTION_GRACE:
+                continue
+            shutil.rmtree(directory, ignore_errors=True)
+            total -= size
+            self._count('evictions')
+
+    def _parallel(self, response, validator):
+        return (self.parallel_parts > 1 and validator is not None and
+                response.getheader('Accept-Ranges') == 'bytes' and
+                response.length is not None and
+                response.length >= self.parallel_min_size)
+
+    def _object_path(self, digest, resource_path):
+        return os.path.join(self._objects_dir, digest,
+                            os.path.basename(resource_path))
+
+    def _touch(self, path):
+        try:
+            os.utime(os.path.dirname(path), None)
+        except OSError:
+            pass
+
+    def _read_entry(self, key):
+        try:
+            with open(os.path.join(self._index_dir, key + '.json')) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def _write_entry(self, key, entry):
+        fd, temp_path = tempfile.mkstemp(dir=self._index_dir,
+                                         prefix='.entry-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.rename(temp_path, os.path.join(self._index_dir,
+                                              key + '.json'))
+        except BaseException:
+            _remove(temp_path)
+            raise
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_script_cache():
+    """
+    Return the process wide ScriptCache, or None if caching is disabled.
+    """
+    global _cache
+    root = os.environ.get(CACHE_DIR_ENV)
+    if root is None:
+        root = os.path.join(get_state_dir(), 'scripts')
+    if not root:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.root != root:
+            max_size = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_MAX_SIZE))
+            _cache = ScriptCache(root, max_size)
+        return _cache
+
+
+class ChecksumMismatch(Exception):
+    """
+    Raised when a download does not have the expected SHA-256 digest.
+    """
+    def __init__(self, url, expected, actual):
+        Exception.__init__(self, '{0}: expected SHA-256 {1}, got {2}'.format(
+            url, expected, actual))
+        self.url = url
+        self.expected = expected
+        self.actual = actual
+
+
+class _Partial(object):
+    """
+    The download of one resource into objects/.partial-<key>. Only the
+    worker holding its lock resumes it, others download to a temporary
+    file of their own. Partial content stays for a later get() if the
+    transfer fails, as long as the server sent a validator.
+    """
+
+    def __init__(self, objects_dir, key):
+        self.path = os.path.join(objects_dir, '.partial-' + key)
+        self.validator = None
+        self.offset = 0
+        self._file = None
+        self._resumable = True
+        self._objects_dir = objects_dir
+
+    def __enter__(self):
+        while True:
+            f = open(self.path, 'ab+')
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                f.close()
+                fd, self.path = tempfile.mkstemp(dir=self._objects_dir,
+                                                 prefix='.download-')
+                self._file = os.fdopen(fd, 'ab+')
+                self._resumable = False
+                return self
+            # the previous holder may have renamed or removed it meanwhile
+            try:
+                if os.stat(self.path).st_ino == os.fstat(f.fileno()).st_ino:
+                    break
+            except OSError:
+                pass
+            f.close()
+        self._file = f
+        try:
+            with open(self._validator_path()) as v:
+                self.validator = v.read() or None
+        except IOError:
+            pass
+        if self.validator is not None:
+            f.seek(0, os.SEEK_END)
+            self.offset = f.tell()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._file is None:
+            return
+        # removed while still locked, see __enter__
+        if self.validator is None or not self._resumable:
+            self.set_validator(None)
+            _remove(self.path)
+        self._file.close()
+
+    def discard(self):
+        self.offset = 0
+        self.set_validator(None)
+        self._file.seek(0)
+        self._file.truncate()
+
+    def set_validator(self, validator):
+        self.validator = validator
+        if not self._resumable:
+            return
+        if validator is None:
+            _remove(self._validator_path())
+            return
+        with open(self._validator_path(), 'w') as f:
+            f.write(validator)
+
+    def receive(self, response):
+        """
+        Append the response body, return the content's SHA-256 digest.
+        """
+        digest = hashlib.sha256()
+        self._file.seek(0)
+        while True:
+            data = self._file.read(_COPY_BUFFER_SIZE)
+            if not data:
+                break
+            digest.update(data)
+        self._file.seek(0, os.SEEK_END)
+        while True:
+            data = response.read(_COPY_BUFFER_SIZE)
+            if not data:
+                break
+            digest.update(data)
+            self._file.write(data)
+        self._file.flush()
+        return digest.hexdigest()
+
+    def receive_parts(self, response, pool, request_path, url, validator,
+                      parts):
+        """
+        Download the body of the 200 response in 'parts' ranges: the
+        first from response itself, the others on connections of their
+        own. Returns the content's SHA-256 digest.
+        """
+        length = response.length
+        self._file.truncate(length)
+        size = -(-length // parts)
+        errors = []
+
+        def fetch(start, end, response=None):
+            try:
+                if response is None:
+                    response = pool.request(request_path, {
+                        'Range': 'bytes={0}-{1}'.format(start, end - 1),
+                        'If-Range': validator
+                    })
+                with response, open(self.path, 'r+b') as f:
+                    if start and (response.status != 206 or
+                                  _range_start(response) != start):
+                        raise HTTPError(url, response.status,
+                                        response.reason)
+                    f.seek(start)
+                    copied = response.copy_to(f.fileno(), end - start,
+                                              pool.timeout)
+                    if copied != end - start:
+                        raise IOError('{0}: transfer interrupted'.format(
+                            url))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=fetch,
+                                    args=(start, min(start + size, length)))
+                   for start in xrange(size, length, size)]
+        for thread in threads:
+            thread.start()
+        fetch(0, min(size, length), response)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        digest = hashlib.sha256()
+        self._file.seek(0)
+        while True:
+            data = self._file.read(_COPY_BUFFER_SIZE)
+            if not data:
+                break
+            digest.update(data)
+        return digest.hexdigest()
+
+    def commit(self, path):
+        os.rename(self.path, path)
+        self.set_validator(None)
+        self._file.close()
+        self._file = None
+
+    def _validator_path(self):
+        return self.path + '.validator'
+
+
+def _unchanged(path, entry):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    # entries written before sizes were recorded have neither
+    return (entry.get('size', stat.st_size) == stat.st_size and
+            entry.get('mtime', stat.st_mtime) == stat.st_mtime)
+
+
+def _range_start(response):
+    # 'bytes <start>-<end>/<length>'
+    try:
+        return int(response.getheader('Content-Range', '')
+                   .split()[1].split('-')[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
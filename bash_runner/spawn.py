@@ -0,0 +1,349 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import os
+import signal
+import subprocess
+import threading
+
+# Environment variable selecting how scripts are spawned on an agent:
+# 'posix_spawn', 'fork' or 'auto' (posix_spawn when libc provides it).
+SPAWN_METHOD_ENV = 'CLOUDIFY_BASH_SPAWN_METHOD'
+
+SPAWN_AUTO = 'auto'
+SPAWN_POSIX = 'posix_spawn'
+SPAWN_FORK = 'fork'
+
+# Opaque glibc structures, allocated larger than any known layout.
+_FILE_ACTIONS_SIZE = 256
+_SPAWNATTR_SIZE = 1024
+
+# posix_spawnattr_setflags() flag, the same value on glibc and musl.
+_POSIX_SPAWN_SETPGROUP = 0x02
+
+# File descriptor of the side channel in the child, see spawn().
+CTX_FD = 3
+
+# Serializes pipe creation and spawning, so a script spawned from another
+# thread never inherits the pipes of this one.
+_spawn_lock = threading.Lock()
+
+
+def _load_libc():
+    name = ctypes.util.find_library('c')
+    if not name:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'posix_spawnp'):
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+def posix_spawn_available():
+    return _libc is not None
+
+
+def _closefrom_available():
+    # glibc >= 2.34
+    return hasattr(_libc, 'posix_spawn_file_actions_addclosefrom_np')
+
+
+def spawn(argv, env, method=None, side_channel=False, setup=None):
+    """
+    Start argv with env, its stdout and stderr connected to pipes.
+    The child leads a new process group, so it can be signalled together
+    with everything it started (see signal_process_group).
+
+    With side_channel, the write end of a third pipe is the child's file
+    descriptor CTX_FD, and the read end is the returned object's 'ctx'
+    file ('ctx' is None otherwise).
+
+    setup is called in the child right before exec, e.g. to apply
+    resource limits. Only the fork method runs Python code in the child,
+    so it is used whenever setup is given.
+
+    With posix_spawn, the child is created by libc's posix_spawnp (a
+    vfork-style clone on Linux), so the cost does not grow with the
+    memory size of the agent process and no Python code runs in the child.
+    The fork method uses subprocess.Popen with close_fds. Both return an
+    object with the Popen attributes execute() relies on, and 'rusage':
+    the child's resource.struct_rusage as reported by wait4(), once it
+    was reaped.
+    """
+    if setup is not None:
+        method = SPAWN_FORK
+    method = method or os.environ.get(SPAWN_METHOD_ENV, SPAWN_AUTO)
+    if method == SPAWN_AUTO:
+        method = SPAWN_POSIX if posix_spawn_available() else SPAWN_FORK
+    if method == SPAWN_POSIX:
+        if not posix_spawn_available():
+            raise RuntimeError('posix_spawn is not available')
+        return SpawnedProcess(argv, env, side_channel)
+    if method != SPAWN_FORK:
+        raise RuntimeError('Unknown spawn method: {0}'.format(method))
+    with _spawn_lock:
+        if not side_channel:
+            def setup_plain_child():
+                os.setpgrp()
+                if setup is not None:
+                    setup()
+
+            process = _Popen(argv,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE,
+                             close_fds=True,
+                             preexec_fn=setup_plain_child,
+                             env=env)
+            process.ctx = None
+            return process
+
+        ctx_read, ctx_write = _child_pipe()
+
+        def setup_child():
+            # Popen's close_fds would run after this, and close CTX_FD
+            os.setpgrp()
+            os.dup2(ctx_write, CTX_FD)
+            for fd in _inherited_fds():
+                if fd != CTX_FD:
+                    os.close(fd)
+            if setup is not None:
+                setup()
+
+        try:
+            process = _Popen(argv,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE,
+                             preexec_fn=setup_child,
+                             env=env)
+        except BaseException:
+            os.close(ctx_read)
+            raise
+        finally:
+            os.close(ctx_write)
+        process.ctx = os.fdopen(ctx_read, 'rb')
+        return process
+
+
+class _Popen(subprocess.Popen):
+    """
+    subprocess.Popen reaping the child with wait4(), to keep its
+    resource usage.
+    """
+
+    rusage = None
+
+    def _wait4(self, pid, options):
+        pid, status, rusage = os.wait4(pid, options)
+        if pid:
+            self.rusage = rusage
+        return pid, status
+
+    def _internal_poll(self, _deadstate=None, **kwargs):
+        kwargs['_waitpid'] = self._wait4
+        return subprocess.Popen._internal_poll(self, _deadstate, **kwargs)
+
+    def wait(self):
+        while self.returncode is None:
+            try:
+                pid, status = self._wait4(self.pid, 0)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno != errno.ECHILD:
+                    raise
+                # reaped elsewhere, as subprocess.Popen.wait assumes
+                pid, status = self.pid, 0
+            if pid == self.pid:
+                self._handle_exitstatus(status)
+        return self.returncode
+
+
+def signal_process_group(process, sig=signal.SIGTERM):
+    """
+    Send sig to the process group led by process. Returns False if the
+    process has no pid yet (a warm job that did not start).
+    """
+    if process.pid is None:
+        return False
+    try:
+        os.killpg(process.pid, sig)
+    except OSError as e:
+        # the whole group already exited
+        if e.errno != errno.ESRCH:
+            raise
+    return True
+
+
+def _set_cloexec(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+
+def _child_pipe():
+    """
+    A pipe whose ends are closed on exec and numbered above CTX_FD, so
+    duplicating the write end to any of the child's descriptors up to
+    CTX_FD never is a no-op leaving it close-on-exec.
+    """
+    fds = []
+    for fd in os.pipe():
+        if fd <= CTX_FD:
+            moved = fcntl.fcntl(fd, fcntl.F_DUPFD, CTX_FD + 1)
+            os.close(fd)
+            fd = moved
+        _set_cloexec(fd)
+        fds.append(fd)
+    return fds
+
+
+def _inherited_fds():
+    """
+    File descriptors above stderr the child would inherit.
+    """
+    try:
+        fds = [int(fd) for fd in os.listdir('/proc/self/fd')]
+    except OSError:
+        fds = range(3, os.sysconf('SC_OPEN_MAX'))
+    inherited = []
+    for fd in fds:
+        if fd < 3:
+            continue
+        try:
+            if not fcntl.fcntl(fd, fcntl.F_GETFD) & fcntl.FD_CLOEXEC:
+                inherited.append(fd)
+        except IOError:
+            # closed meanwhile, or the listing's own descriptor
+            continue
+    return inherited
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _check(result):
+    if result != 0:
+        raise OSError(result, os.strerror(result))
+
+
+class SpawnedProcess(object):
+    """
+    A child started with posix_spawnp, exposing the subset of the
+    subprocess.Popen interface execute() uses.
+    """
+
+    def __init__(self, argv, env, side_channel=False):
+        self.args = argv
+        self.returncode = None
+        self.rusage = None
+        argv = [_encode(arg) for arg in argv]
+        c_argv = (ctypes.c_char_p * (len(argv) + 1))(*(argv + [None]))
+        env_items = ['{0}={1}'.format(_encode(k), _encode(v))
+                     for k, v in env.iteritems()]
+        c_env = (ctypes.c_char_p * (len(env_items) + 1))(
+            *(env_items + [None]))
+
+        actions = ctypes.create_string_buffer(_FILE_ACTIONS_SIZE)
+        attributes = ctypes.create_string_buffer(_SPAWNATTR_SIZE)
+        pid = ctypes.c_int()
+        _check(_libc.posix_spawn_file_actions_init(actions))
+        _check(_libc.posix_spawnattr_init(attributes))
+        parent_fds = []
+        child_fds = []
+        try:
+            _check(_libc.posix_spawnattr_setpgroup(attributes, 0))
+            _check(_libc.posix_spawnattr_setflags(
+                attributes, ctypes.c_short(_POSIX_SPAWN_SETPGROUP)))
+            targets = [1, 2, CTX_FD] if side_channel else [1, 2]
+            with _spawn_lock:
+                if not _closefrom_available():
+                    # before the dup2 actions, which may reuse the numbers
+                    for fd in _inherited_fds():
+                        _check(_libc.posix_spawn_file_actions_addclose(
+                            actions, fd))
+                for target in targets:
+                    read_fd, write_fd = _child_pipe()
+                    parent_fds.append(read_fd)
+                    child_fds.append(write_fd)
+                    _check(_libc.posix_spawn_file_actions_adddup2(
+                        actions, write_fd, target))
+                if _closefrom_available():
+                    # closing in the child costs the parent nothing,
+                    # however many descriptors it has open (e.g. the
+                    # pipes of other running scripts).
+                    _check(_libc.posix_spawn_file_actions_addclosefrom_np(
+                        actions, targets[-1] + 1))
+                _check(_libc.posix_spawnp(ctypes.byref(pid), argv[0],
+                                          actions, attributes,
+                                          c_argv, c_env))
+        except BaseException:
+            for fd in parent_fds + child_fds:
+                os.close(fd)
+            raise
+        finally:
+            _libc.posix_spawn_file_actions_destroy(actions)
+            _libc.posix_spawnattr_destroy(attributes)
+
+        for fd in child_fds:
+            os.close(fd)
+        self.pid = pid.value
+        streams = [os.fdopen(fd, 'rb') for fd in parent_fds]
+        self.stdout, self.stderr = streams[:2]
+        self.ctx = streams[2] if side_channel else None
+
+    def _handle_status(self, status, rusage):
+        self.rusage = rusage
+        if os.WIFSIGNALED(status):
+            self.returncode = -os.WTERMSIG(status)
+        else:
+            self.returncode = os.WEXITSTATUS(status)
+
+    def poll(self):
+        if self.returncode is None:
+            try:
+                pid, status, rusage = os.wait4(self.pid, os.WNOHANG)
+            except OSError as e:
+                if e.errno != errno.EINTR:
+                    raise
+                return None
+            if pid == self.pid:
+                self._handle_status(status, rusage)
+        return self.returncode
+
+    def wait(self):
+        while self.returncode is None:
+            try:
+                pid, status, rusage = os.wait4(self.pid, 0)
+            except OSError as e:
+                if e.errno != errno.EINTR:
+                    raise
+                continue
+            self._handle_status(status, rusage)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            os.kill(self.pid, sig)
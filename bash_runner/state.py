@@ -0,0 +1,115 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import atexit
+import errno
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+# Directory under which the plugin keeps the files it reuses across
+# operations (helper bundles, script and step caches), by default. It is
+# named after the agent's user, and only used if that user owns it and
+# nobody else can write to it.
+DEFAULT_STATE_DIR = os.path.join(tempfile.gettempdir(),
+                                 'cloudify-bash-plugin-{0}'.format(
+                                     os.geteuid()))
+
+
+def ensure_private_directory(path):
+    """
+    Create path (mode 0700) if missing and check that it is private: see
+    check_private_directory.
+    """
+    try:
+        os.makedirs(path, 0700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    check_private_directory(path)
+
+
+def check_private_directory(path):
+    """
+    Raise OSError unless path is a directory owned by the agent's user,
+    which no other user can write to, and no other user can replace: each
+    of its parents must be owned by that user or root, and either not be
+    writable by others or be sticky (e.g. /tmp).
+
+    Files the plugin sources or executes later on are kept there, so a
+    directory someone else prepared (e.g. in /tmp) must not be trusted.
+    """
+    # the directory itself must not be a symbolic link, which whoever
+    # owns it could point elsewhere later
+    path = os.path.abspath(path)
+    parent = os.path.realpath(os.path.dirname(path))
+    path = os.path.join(parent, os.path.basename(path))
+    _check(path, os.lstat(path), private=True)
+    while True:
+        _check(parent, os.lstat(parent), private=False)
+        if parent == os.path.dirname(parent):
+            break
+        parent = os.path.dirname(parent)
+
+
+def _check(path, st, private):
+    uid = os.geteuid()
+    if not stat.S_ISDIR(st.st_mode):
+        reason = 'not a directory'
+    elif st.st_uid != uid and (private or st.st_uid != 0):
+        reason = 'owned by uid {0}'.format(st.st_uid)
+    elif st.st_mode & (stat.S_IWGRP | stat.S_IWOTH) and \
+            (private or not st.st_mode & stat.S_ISVTX):
+        reason = 'writable by other users'
+    else:
+        return
+    raise OSError(errno.EPERM, 'Not a private directory ({0})'.format(reason),
+                  path)
+
+
+def is_private_file(path):
+    """
+    Whether path is a regular file owned by the agent's user that no
+    other user can write to.
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISREG(st.st_mode) and st.st_uid == os.geteuid() and \
+        not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+_state_dir = None
+_state_dir_lock = threading.Lock()
+
+
+def get_state_dir():
+    """
+    Return the process wide state directory: DEFAULT_STATE_DIR if it is
+    private, otherwise (e.g. another user created it first) a new private
+    directory of this process.
+    """
+    global _state_dir
+    with _state_dir_lock:
+        if _state_dir is None:
+            try:
+                ensure_private_directory(DEFAULT_STATE_DIR)
+                _state_dir = DEFAULT_STATE_DIR
+            except OSError:
+                _state_dir = tempfile.mkdtemp(prefix='cloudify-bash-plugin-')
+                atexit.register(shutil.rmtree, _state_dir, True)
+        return _state_dir
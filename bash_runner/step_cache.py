@@ -0,0 +1,212 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import errno
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from bash_runner.capture import DEFAULT_MAX_MEMORY
+from bash_runner.capture import OutputCapture
+from bash_runner.environment import flatten
+from bash_runner.state import ensure_private_directory
+from bash_runner.state import get_state_dir
+
+# Environment variable setting the directory of the process wide step
+# cache, by default 'steps' in the state directory (see get_state_dir).
+# An empty string disables skipping.
+STEP_CACHE_DIR_ENV = 'CLOUDIFY_BASH_STEP_CACHE_DIR'
+
+_BUFFER_SIZE = 64 * 1024
+
+
+class StepCache(object):
+    """
+    Results of the last successful run of each operation of each node
+    instance, so a script can be skipped when it would run unchanged.
+
+    Layout under 'root':
+
+        <deployment_id>/<node_id>/<operation>.json
+            the fingerprint of the run, when it finished, its return
+            value and the runtime properties it set.
+        <deployment_id>/<node_id>/<operation>.stdout
+            its stdout.
+
+    A fingerprint covers the script's content, the node's flattened
+    properties (which make up the script's environment) and the
+    operation, so changing any of them runs the script again. Files are
+    written to temporary names and renamed into place.
+
+    A record skips a script and sets runtime properties, so 'root' must
+    be private to the agent's user (see check_private_directory): OSError
+    is raised otherwise.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        ensure_private_directory(root)
+
+    def fingerprint(self, ctx, script_path):
+        digest = hashlib.sha256()
+        with open(script_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_BUFFER_SIZE), ''):
+                digest.update(chunk)
+        digest.update('\0')
+        digest.update(json.dumps(flatten(ctx.properties), sort_keys=True,
+                                 default=repr))
+        digest.update('\0')
+        digest.update(ctx.operation or '')
+        return digest.hexdigest()
+
+    def lookup(self, ctx, fingerprint, ttl=None):
+        """
+        Return the Step stored for ctx's operation if it has the given
+        fingerprint and, with a ttl, finished at most ttl seconds ago.
+        Returns None otherwise.
+        """
+        path = self._path(ctx)
+        try:
+            with open(path + '.json') as f:
+                record = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if record.get('fingerprint') != fingerprint:
+            return None
+        if ttl is not None and time.time() - record['finished'] > ttl:
+            return None
+        if not os.path.exists(path + '.stdout'):
+            return None
+        return Step(record, path + '.stdout')
+
+    def store(self, ctx, fingerprint, stdout, return_value,
+              runtime_properties):
+        """
+        Record a successful run. stdout is its CapturedOutput, read from
+        its start and left positioned there.
+        """
+        path = self._path(ctx)
+        _makedirs(os.path.dirname(path))
+        stdout.seek(0)
+        try:
+            _write_atomically(path + '.stdout',
+                              iter(lambda: stdout.read(_BUFFER_SIZE), ''))
+        finally:
+            stdout.seek(0)
+        record = {
+            'fingerprint': fingerprint,
+            'finished': time.time(),
+            'return_value': return_value,
+            'runtime_properties': runtime_properties
+        }
+        _write_atomically(path + '.json', [json.dumps(record)])
+
+    def invalidate(self, ctx):
+        """
+        Forget the run of ctx's operation, e.g. after it failed.
+        """
+        path = self._path(ctx)
+        for suffix in ('.json', '.stdout'):
+            try:
+                os.remove(path + suffix)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def _path(self, ctx):
+        return os.path.join(self.root, _safe(ctx.deployment_id),
+                            _safe(ctx.node_id), _safe(ctx.operation))
+
+
+class Step(object):
+    """
+    A run found in the StepCache.
+    """
+
+    def __init__(self, record, stdout_path):
+        self.fingerprint = record['fingerprint']
+        self.finished = record['finished']
+        self.return_value = record.get('return_value')
+        self.runtime_properties = record.get('runtime_properties') or {}
+        self._stdout_path = stdout_path
+
+    def apply(self, ctx):
+        """
+        Set the runtime properties the run set again, e.g. after a heal
+        reset them.
+        """
+        for key, value in self.runtime_properties.iteritems():
+            ctx[key] = value
+
+    def stdout(self, max_memory=DEFAULT_MAX_MEMORY):
+        """
+        The stored stdout, as a CapturedOutput.
+        """
+        capture = OutputCapture(max_memory=max_memory)
+        with open(self._stdout_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_BUFFER_SIZE), ''):
+                capture.write(chunk)
+        return capture.result()
+
+
+def _safe(name):
+    # identifiers may hold characters that are not valid in file names
+    return (name or '_').replace('/', '_').replace('\0', '_')
+
+
+def _write_atomically(path, chunks):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                     prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.rename(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_step_cache():
+    """
+    Return the process wide StepCache, or None if skipping is disabled.
+    """
+    global _cache
+    root = os.environ.get(STEP_CACHE_DIR_ENV)
+    if root is None:
+        root = os.path.join(get_state_dir(), 'steps')
+    if not root:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.root != root:
+            _cache = StepCache(root)
+        return _cache
@@ -12,26 +12,47 @@
 #    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
-import collections
-import subprocess
-import fcntl
-import select
+import logging
 import os
-import errno
-from os.path import dirname
+import time
 
-from cloudify import utils
-from cloudify.utils import get_manager_ip
+from cloudify.constants import MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
 from cloudify.decorators import operation
 
-from bash_runner import resources
+from bash_runner.capture import DEFAULT_MAX_MEMORY
+from bash_runner.engine import DEFAULT_KILL_GRACE
+from bash_runner.engine import ExecutionEngine
+from bash_runner.engine import ProcessException
+from bash_runner.engine import ProcessTimeoutException  # NOQA
+from bash_runner.engine import ResourceLimitException  # NOQA
+from bash_runner.engine import execute_many
+from bash_runner.engine import format_command  # NOQA
+from bash_runner.engine import is_debug_log  # NOQA
+from bash_runner.engine import is_error_log  # NOQA
+from bash_runner.engine import is_info_log  # NOQA
+from bash_runner.engine import is_warn_log  # NOQA
+from bash_runner.engine import strip_level  # NOQA
+from bash_runner.environment import flatten  # NOQA
+from bash_runner.environment import setup_environment  # NOQA
+from bash_runner.interpreters import interpreter_command
+from bash_runner.parallel import DEFAULT_CONCURRENCY
+from bash_runner.parallel import parse_jobs
+from bash_runner.parallel import run_jobs
+from bash_runner.runtime_properties import DEFAULT_FLUSH_INTERVAL
+from bash_runner.script_cache import get_script_cache
+from bash_runner.step_cache import get_step_cache
 
 
 @operation
-def run(ctx, script_path=None, log_all=False, **kwargs):
+def run(ctx, script_path=None, log_all=False,
+        max_output_memory=DEFAULT_MAX_MEMORY, warm=False, timeout=None,
+        kill_grace=DEFAULT_KILL_GRACE,
+        property_flush_interval=DEFAULT_FLUSH_INTERVAL, limits=None,
+        skip_unchanged=False, skip_ttl=None, force=False, stream=False,
+        retry=None, interpreter=None, offload_size=None, **kwargs):
 
     """
-    Execute bash scripts.
+    Execute scripts: bash scripts, or scripts of any interpreter.
 
         Parameters:
 
@@ -40,178 +61,495 @@ def run(ctx, script_path=None, log_all=False, **kwargs):
             script_path - The path to the script relative
                           to the blueprints root directory.
                           Will only be used if the 'scripts' argument is None.
+
+            log_all - Log every stdout line, each as a record of its own.
+                      By default only '[LEVEL] ' lines (see logging.sh)
+                      and stderr are logged.
+
+            stream - Log all of stdout and stderr as the script writes
+                     it, in a record per quarter second or 64KB, keeping
+                     operators up to date without a record per line.
+
+            max_output_memory - Bytes of script output kept in memory.
+                                Output beyond this size is spilled to a
+                                temporary file.
+
+            offload_size - Node property values larger than this many
+                           bytes are written to a file, and
+                           '<key>_FILE' holds its path instead of '<key>'
+                           holding the value, e.g. for values Linux would
+                           not exec with (over 128KB). Disabled by
+                           default. A property named '<key>_FILE' of its
+                           own fails the operation then.
+
+            interpreter - Command line of the interpreter running the
+                          script, e.g. 'python -u'. By default the
+                          script's shebang, or else its extension
+                          (.sh, .py, .pl, .rb), picks the interpreter,
+                          falling back to bash. Interpreters are
+                          executed directly. See interpreter_command.
+
+            warm - Run the script on a pre-started worker of this agent
+                   instead of a new process: bash scripts on a bash
+                   worker, scripts of the agent's own Python interpreter
+                   in a fork of a Python worker, with the same
+                   environment and side channel. Saves the interpreter
+                   startup cost for short scripts.
+
+            timeout - Seconds the script may run. On expiry, the script's
+                      process group gets SIGTERM, and SIGKILL if it is
+                      still running 'kill_grace' seconds later.
+                      No limit by default.
+
+            property_flush_interval - Runtime properties the script sets
+                                      with cfy_set_property (see ctx.sh)
+                                      are stored once the operation ends.
+                                      While the script runs, pending
+                                      updates are stored every this many
+                                      seconds. None disables that.
+
+            limits - Resource limits of the script and everything it
+                     starts, a dictionary with any of the keys:
+                     cpu_seconds, address_space (bytes), open_files,
+                     processes, nice and ionice ('idle', 'best-effort'
+                     or 'realtime', optionally with ':<level>').
+                     A cgroup v2 backend limits the memory and processes
+                     of the whole script when available, setrlimit() is
+                     used otherwise. See ResourceLimits.
+
+            skip_unchanged - Skip the script if its last successful run
+                             for this node instance and operation had the
+                             same script content and node properties.
+                             The runtime properties and return value of
+                             that run are used again. Runs are kept on
+                             the agent, see StepCache.
+
+            skip_ttl - Seconds a successful run may be reused for.
+                       No limit by default.
+
+            force - Run the script even if it is unchanged, and record
+                    this run for later ones.
+
+            retry - Run the script again when it fails, rather than
+                    failing the operation. The number of retries, or a
+                    dictionary with any of the keys: retries,
+                    exit_codes (list of return codes to retry),
+                    patterns (list of regular expressions; failures
+                    whose stdout or stderr has a matching line are
+                    retried), backoff (seconds before the first retry,
+                    doubled for each further one, default 1),
+                    max_backoff (default 60) and jitter (share of each
+                    delay that is random, default 0.5). Without
+                    exit_codes and patterns any failure is retried.
+                    Timeouts apply to each attempt and are not retried.
+                    See RetryPolicy.
+
+        Returns:
+
+            The value the script passed to cfy_return or cfy_return_json
+            (see ctx.sh), if any.
+
         Exceptions:
 
             If both 'scripts' and 'script_path' is None.
             A runtime exception will be raised since there is no
             script to run.
+
+            A ProcessTimeoutException is raised if the script timed out.
+
+            A ProcessException of a retried script lists every attempt
+            in its message and its 'attempts' (see Attempt).
+
+            A ResourceLimitException is raised if the script failed
+            because it exceeded one of its limits.
     """
 
     sh = get_script_to_run(ctx, script_path)
     if sh is None:
         return None
-    bash(sh, ctx, log_all)
+    stdout, return_value = _run_script(
+        sh, ctx, log_all, skip_unchanged, skip_ttl, force, interpreter,
+        max_output_memory=max_output_memory,
+        warm=warm, timeout=timeout, kill_grace=kill_grace,
+        property_flush_interval=property_flush_interval,
+        limits=limits, stream=stream, retry=retry,
+        offload_size=offload_size)
+    stdout.close()
+    if return_value is not None:
+        return return_value
     return "[{0}] succeeded. return code 0".format(os.path.basename(sh))
 
 
-def get_script_to_run(ctx, script_path=None):
-    if script_path:
-        return ctx.download_resource(script_path)
-    if 'scripts' in ctx.properties:
-        operation_simple_name = ctx.operation.split('.')[-1:].pop()
-        scripts = ctx.properties['scripts']
-        if operation_simple_name not in scripts:
-            ctx.logger.info("No script mapping found for operation {0}. "
-                            "Nothing to do.".format(operation_simple_name))
-            return None
-        return ctx.download_resource(scripts[operation_simple_name])
-
-    raise RuntimeError('No script to run')
-
-
-def run_and_return_output(ctx, script_path=None, log_all=False, **kwargs):
-    sh = get_script_to_run(ctx, script_path)
-    if sh is None:
-        return None
-    return bash(sh, ctx, log_all)
+@operation
+def run_many(ctx, scripts=None, concurrency=DEFAULT_CONCURRENCY,
+             fail_fast=True, log_all=False,
+             max_output_memory=DEFAULT_MAX_MEMORY, warm=False, timeout=None,
+             kill_grace=DEFAULT_KILL_GRACE,
+             property_flush_interval=DEFAULT_FLUSH_INTERVAL, limits=None,
+             stream=False, retry=None, interpreter=None, offload_size=None,
+             **kwargs):
 
+    """
+    Execute several bash scripts concurrently.
 
-def strip_level(line, level):
-    return line.replace('[{0}] '.format(level), '', 1)
+        Parameters:
 
+            scripts - A list of scripts to run. Each item is either a
+                      script path relative to the blueprints root
+                      directory, or a dictionary with a 'path' key and
+                      optional 'name' (defaults to the path) and
+                      'depends_on' (list of script names) keys.
+                      Defaults to the list mapped to the current operation
+                      in the 'scripts' property.
 
-def is_info_log(line):
-    return line.startswith('[INFO]')
+            concurrency - Maximum number of scripts running at once.
 
+            fail_fast - Stop starting new scripts after the first failure.
+                        Otherwise every script whose dependencies
+                        succeeded is run and all failures are reported.
 
-def is_error_log(line):
-    return line.startswith('[ERROR]')
+            timeout - Seconds each script may run, see 'run'.
 
+            property_flush_interval - See 'run'. Updates of all scripts
+                                      are stored together.
 
-def bash(path, ctx, log_all):
-    return execute("/bin/bash {0}".format(path), ctx, log_all)
+            limits - Resource limits of each script, see 'run'.
 
+            stream - Stream the output of each script, see 'run'.
 
-def execute(command, ctx, log_all):
-    ctx.logger.info('Running command: %s' % command)
-    env = setup_environment(ctx)
-    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE,
-                               env=env)
-    make_async(process.stdout)
-    make_async(process.stderr)
+            retry - Retries of each failing script, see 'run'. Other
+                    scripts keep running meanwhile.
 
-    stdout = str()
-    stderr = str()
-    return_code = None
+            interpreter - Interpreter of every script, see 'run'.
 
-    while True:
-        # Wait for data to become available
-        select.select([process.stdout, process.stderr], [], [])
+            offload_size - See 'run'.
 
-        return_code = process.poll()
+        Exceptions:
 
-        # Try reading some data from each
-        stdout_piece = read_async(process.stdout)
-        stderr_piece = read_async(process.stderr)
+            An AggregateProcessException is raised if any script failed.
+    """
 
-        if stdout_piece:
-            if is_info_log(stdout_piece) or log_all:
-                ctx.logger.info(strip_level(stdout_piece,
-                                            'INFO'))
-            if is_error_log(stdout_piece):
-                ctx.logger.error(strip_level(stdout_piece,
-                                             'ERROR'))
-        if stderr_piece:
-            ctx.logger.error(stderr_piece)
+    if scripts is None:
+        operation_simple_name = ctx.operation.split('.')[-1:].pop()
+        scripts = ctx.properties.get('scripts', {}).get(operation_simple_name)
+        if not scripts:
+            ctx.logger.info("No script mapping found for operation {0}. "
+                            "Nothing to do.".format(operation_simple_name))
+            return None
 
-        stdout += stdout_piece
-        stderr += stderr_piece
+    def run_job(job):
+        sh = download_script(ctx, job.path)
+        logger = PrefixLogger(ctx.logger, '[{0}] '.format(job.name))
+        execute(interpreter_command(sh, interpreter), ctx, log_all,
+                max_output_memory=max_output_memory,
+                logger=logger, warm=warm, timeout=timeout,
+                kill_grace=kill_grace,
+                property_flush_interval=property_flush_interval,
+                limits=limits, stream=stream, retry=retry,
+                offload_size=offload_size).close()
+
+    jobs = parse_jobs(scripts)
+    results, errors, skipped = run_jobs(jobs, run_job,
+                                        concurrency=concurrency,
+                                        fail_fast=fail_fast)
+    if errors:
+        raise AggregateProcessException(errors, skipped)
+    return "[{0}] succeeded. return code 0".format(
+        ', '.join(job.name for job in jobs))
+
+
+def run_batch(ctxs, script_path=None, concurrency=DEFAULT_CONCURRENCY,
+              log_all=False, max_output_memory=DEFAULT_MAX_MEMORY,
+              warm=False, timeout=None, kill_grace=DEFAULT_KILL_GRACE,
+              property_flush_interval=DEFAULT_FLUSH_INTERVAL, limits=None,
+              stream=False, retry=None, interpreter=None,
+              offload_size=None):
 
-        if return_code is not None and not stdout_piece and not stderr_piece:
-            break
+    """
+    Run the same operation for many node instances at once, e.g. the
+    instances of a node scaled out on this agent.
 
-    ctx.logger.info('Done running command (return_code=%d): %s'
-                    % (return_code, command))
-    if return_code == 0:
-        return stdout
-    else:
-        raise ProcessException(command, return_code, stdout, stderr)
+        Parameters:
 
+            ctxs - The contexts of the node instances.
 
-# Helper function to add the O_NONBLOCK flag to a file descriptor
-def make_async(fd):
-    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) |
-                os.O_NONBLOCK)
+            script_path - See 'run'. Each distinct script (per blueprint)
+                          is downloaded once for all instances.
 
+            concurrency - Maximum number of scripts running at once.
 
-# Helper function to read some data from a file descriptor,
-# ignoring EAGAIN errors
-def read_async(fd):
-    try:
-        return fd.readline()
-    except IOError, e:
-        if e.errno != errno.EAGAIN:
-            raise e
-        else:
-            return ''
+            The other parameters are those of 'run', applying to every
+            instance.
 
+        Returns:
 
-def flatten(d, parent_key=''):
-    items = []
-    for k, v in d.items():
-        new_key = parent_key + '_' + k if parent_key else k
-        if isinstance(v, collections.MutableMapping):
-            items.extend(flatten(v, new_key).items())
-        else:
-            items.append((new_key, v))
-    return dict(items)
+            A list with a dictionary per context, in the order of ctxs:
 
+                node_id - The node instance's id.
+                status - 'succeeded', 'failed', or 'skipped' when no
+                         script is mapped to the operation.
+                return_value - What the script passed to cfy_return.
+                exit_code - The script's return code, if it ran.
+                error - The error message of a failed instance.
+                usage - The script's ResourceUsage, as a dictionary.
 
-def setup_environment(ctx):
+            A failing instance does not stop the others and nothing is
+            raised for it. The runtime properties a script set are stored
+            (ctx.update()) before its result is returned, as they would
+            be at the end of an operation.
     """
-    Add some useful environment variables to the environment
-    """
-
-    env = os.environ.copy()
-    # See in context.py
-    # https://github.com/CloudifySource
-    # /cosmo-celery-common/blob/develop/cloudify/context.py
-    env['CLOUDIFY_NODE_ID'] = ctx.node_id.encode('utf-8')
-    env['CLOUDIFY_BLUEPRINT_ID'] = ctx.blueprint_id.encode('utf-8')
-    env['CLOUDIFY_DEPLOYMENT_ID'] = ctx.deployment_id.encode('utf-8')
-    env['CLOUDIFY_MANAGER_IP'] = get_manager_ip().encode('utf-8')
-    env['CLOUDIFY_EXECUTION_ID'] = ctx.execution_id.encode('utf-8')
 
-    logging_script_path = os.path.join(dirname(resources.__file__),
-                                       "logging.sh")
+    results = []
+    if not ctxs:
+        return results
+    commands = {}
+    executions = []
+    engine = ExecutionEngine(ctxs[0].logger, concurrency)
+    try:
+        for ctx in ctxs:
+            result = {
+                'node_id': ctx.node_id,
+                'status': 'skipped',
+                'return_value': None,
+                'exit_code': None,
+                'error': None,
+                'usage': None
+            }
+            results.append(result)
+            try:
+                resource = _script_resource(ctx, script_path)
+            except RuntimeError as e:
+                _batch_failed(result, e)
+                continue
+            if resource is None:
+                continue
+            key = (ctx.blueprint_id, resource)
+            if key not in commands:
+                try:
+                    commands[key] = interpreter_command(
+                        download_script(ctx, resource), interpreter)
+                except Exception as e:
+                    commands[key] = e
+            if isinstance(commands[key], Exception):
+                _batch_failed(result, commands[key])
+                continue
+            executions.append((result, engine.submit(
+                commands[key], ctx,
+                log_all=log_all,
+                max_output_memory=max_output_memory,
+                warm=warm,
+                timeout=timeout,
+                kill_grace=kill_grace,
+                property_flush_interval=property_flush_interval,
+                limits=limits,
+                stream=stream,
+                retry=retry,
+                offload_size=offload_size)))
+        engine.run()
+    finally:
+        engine.close()
+
+    for result, execution in executions:
+        if execution.usage is not None:
+            result['usage'] = execution.usage.as_dict()
+        try:
+            if execution.runtime_properties:
+                # the execution only set them on the context, which is
+                # not the context of an operation about to end
+                execution.ctx.update()
+            execution.result().close()
+        except Exception as e:
+            _batch_failed(result, e)
+            continue
+        result['status'] = 'succeeded'
+        result['exit_code'] = 0
+        result['return_value'] = execution.return_value
+    return results
+
+
+def _batch_failed(result, error):
+    result['status'] = 'failed'
+    result['exit_code'] = getattr(error, 'exit_code', None)
+    result['error'] = '{0}: {1}'.format(type(error).__name__, error)
+    for stream in ('stdout', 'stderr'):
+        output = getattr(error, stream, None)
+        if output is not None:
+            output.close()
 
-    file_server_script_path = os.path.join(dirname(resources.__file__),
-                                           "file_server.sh")
 
-    env['CLOUDIFY_LOGGING'] = logging_script_path
-    env['CLOUDIFY_FILE_SERVER'] = file_server_script_path
+def get_script_to_run(ctx, script_path=None):
+    resource = _script_resource(ctx, script_path)
+    if resource is None:
+        return None
+    return download_script(ctx, resource)
 
-    url = '{0}/{1}'.format(
-        utils.get_manager_file_server_blueprints_root_url(),
-        ctx.blueprint_id)
 
-    env['CLOUDIFY_FILE_SERVER_BLUEPRINT_ROOT'] = url.encode('utf-8')
+def _script_resource(ctx, script_path):
+    if script_path:
+        return script_path
+    if 'scripts' in ctx.properties:
+        operation_simple_name = ctx.operation.split('.')[-1:].pop()
+        scripts = ctx.properties['scripts']
+        if operation_simple_name not in scripts:
+            ctx.logger.info("No script mapping found for operation {0}. "
+                            "Nothing to do.".format(operation_simple_name))
+            return None
+        return scripts[operation_simple_name]
 
-    # assuming properties are flat.
-    # inject each property as an environment variable.
-    for key, value in flatten(ctx.properties).iteritems():
-        env[key] = value.encode('utf-8') \
-            if isinstance(value, unicode) \
-            or isinstance(value, str) else repr(value)
+    raise RuntimeError('No script to run')
 
-    return env
 
+def download_script(ctx, resource_path):
+    """
+    Return a local path of a blueprint resource. Goes through the agent's
+    script cache when it is enabled and the manager's file server is
+    known, and falls back to ctx.download_resource otherwise.
+    """
+    cache = get_script_cache()
+    base_url = os.environ.get(MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY)
+    if cache is None or not base_url:
+        return ctx.download_resource(resource_path)
+    return cache.get(ctx.blueprint_id, resource_path, base_url)
+
+
+def run_and_return_output(ctx, script_path=None, log_all=False,
+                          max_output_memory=DEFAULT_MAX_MEMORY, warm=False,
+                          timeout=None, kill_grace=DEFAULT_KILL_GRACE,
+                          property_flush_interval=DEFAULT_FLUSH_INTERVAL,
+                          limits=None, skip_unchanged=False, skip_ttl=None,
+                          force=False, stream=False, retry=None,
+                          interpreter=None, offload_size=None, **kwargs):
+    """
+    Same as 'run', but returns the script's stdout as a CapturedOutput.
+    A skipped script returns the stdout of the run that was reused.
+    """
+    sh = get_script_to_run(ctx, script_path)
+    if sh is None:
+        return None
+    stdout, _ = _run_script(
+        sh, ctx, log_all, skip_unchanged, skip_ttl, force, interpreter,
+        max_output_memory=max_output_memory,
+        warm=warm, timeout=timeout, kill_grace=kill_grace,
+        property_flush_interval=property_flush_interval,
+        limits=limits, stream=stream, retry=retry,
+        offload_size=offload_size)
+    return stdout
+
+
+def _run_script(sh, ctx, log_all, skip_unchanged, skip_ttl, force,
+                interpreter, **kwargs):
+    """
+    Run sh, or reuse its last run when skip_unchanged allows it.
+    Returns its stdout (a CapturedOutput) and return value.
+    """
+    command = interpreter_command(sh, interpreter)
+    step_cache = get_step_cache() if skip_unchanged else None
+    if step_cache is None:
+        execution = _execute(command, ctx, log_all, **kwargs)
+        return execution.result(), execution.return_value
+
+    fingerprint = step_cache.fingerprint(ctx, sh)
+    if not force:
+        step = step_cache.lookup(ctx, fingerprint, ttl=skip_ttl)
+        if step is not None:
+            ctx.logger.info('Skipping {0}: unchanged since its run at {1}'
+                            .format(os.path.basename(sh),
+                                    time.strftime('%Y-%m-%d %H:%M:%S',
+                                                  time.localtime(
+                                                      step.finished))))
+            step.apply(ctx)
+            return (step.stdout(kwargs.get('max_output_memory',
+                                           DEFAULT_MAX_MEMORY)),
+                    step.return_value)
+    # a failed run may have changed part of what the recorded run did
+    step_cache.invalidate(ctx)
+    execution = _execute(command, ctx, log_all, **kwargs)
+    stdout = execution.result()
+    step_cache.store(ctx, fingerprint, stdout, execution.return_value,
+                     execution.runtime_properties)
+    return stdout, execution.return_value
+
+
+def bash(path, ctx, log_all, **kwargs):
+    return execute(['/bin/bash', path], ctx, log_all, **kwargs)
+
+
+def execute(command, ctx, log_all, max_output_memory=DEFAULT_MAX_MEMORY,
+            logger=None, warm=False, timeout=None,
+            kill_grace=DEFAULT_KILL_GRACE,
+            property_flush_interval=DEFAULT_FLUSH_INTERVAL, limits=None,
+            stream=False, retry=None, offload_size=None):
+    """
+    Run command and return its stdout as a CapturedOutput.
+
+    command is either an argv list, executed directly, or a string,
+    executed with /bin/sh -c. With warm, a ['/bin/bash', script] command
+    runs on the agent's warm bash worker pool. The command leads its own
+    process group; when timeout seconds passed, the group is sent SIGTERM,
+    then SIGKILL after kill_grace seconds, and ProcessTimeoutException is
+    raised. limits are the command's ResourceLimits, exceeding them
+    raises ResourceLimitException. With stream, all of the command's
+    output is logged in batches as it is written. retry is the
+    command's RetryPolicy. Property values over offload_size bytes are
+    passed in files, see setup_environment.
+
+    The output's 'usage' (or the exception's) is the command's
+    ResourceUsage: CPU time, peak memory, I/O and output counts.
+
+    This is the synchronous form of execute_many() for a single command.
+    """
+    return _execute(command, ctx, log_all,
+                    max_output_memory=max_output_memory,
+                    logger=logger,
+                    warm=warm,
+                    timeout=timeout,
+                    kill_grace=kill_grace,
+                    property_flush_interval=property_flush_interval,
+                    limits=limits,
+                    stream=stream,
+                    retry=retry,
+                    offload_size=offload_size).result()
+
+
+def _execute(command, ctx, log_all, **kwargs):
+    execution, = execute_many([command], ctx,
+                              concurrency=1,
+                              log_all=log_all,
+                              **kwargs)
+    return execution
+
+
+class AggregateProcessException(ProcessException):
+    """
+    Raised by run_many when one or more scripts failed.
+    'errors' is a list of (script name, exception) in completion order and
+    'skipped' the names of scripts that never ran. The ProcessException
+    attributes are those of the first failing script (when it failed with
+    a ProcessException).
+    """
+    def __init__(self, errors, skipped=None):
+        self.errors = errors
+        self.skipped = list(skipped or [])
+        lines = ['[{0}] {1}'.format(name, error) for name, error in errors]
+        if self.skipped:
+            lines.append('skipped: {0}'.format(', '.join(self.skipped)))
+        Exception.__init__(self, '\n'.join(lines))
+        first = errors[0][1]
+        self.command = getattr(first, 'command', None)
+        self.exit_code = getattr(first, 'exit_code', None)
+        self.stdout = getattr(first, 'stdout', None)
+        self.stderr = getattr(first, 'stderr', None)
+        self.usage = getattr(first, 'usage', None)
+        self.attempts = getattr(first, 'attempts', [])
+
+
+class PrefixLogger(logging.LoggerAdapter):
+    """
+    Logger adapter prefixing every line of every message.
+    """
+    def __init__(self, logger, prefix):
+        logging.LoggerAdapter.__init__(self, logger, {})
+        self.prefix = prefix
 
-class ProcessException(Exception):
-    def __init__(self, command, exit_code, stdout, stderr):
-        Exception.__init__(self, stderr)
-        self.command = command
-        self.exit_code = exit_code
-        self.stdout = stdout
-        self.stderr = stderr
+    def process(self, msg, kwargs):
+        return self.prefix + msg.replace('\n', '\n' + self.prefix), kwargs
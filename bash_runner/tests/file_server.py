@@ -20,9 +20,11 @@ from multiprocessing import Process
 import subprocess
 import SimpleHTTPServer
 import SocketServer
+import StringIO
 import os
 import sys
 import socket
+import ssl
 import time
 
 PORT = 53229
@@ -48,11 +50,15 @@ logger.setLevel(logging.DEBUG)
 
 class FileServer(object):
 
-    def __init__(self, root_path, use_subprocess=False, timeout=5):
+    def __init__(self, root_path, use_subprocess=False, timeout=5,
+                 port=PORT, certificate=None):
         self.root_path = root_path
         self.process = Process(target=self.start_impl)
         self.use_subprocess = use_subprocess
         self.timeout = timeout
+        self.port = port
+        # a PEM file holding a key and certificate, to serve https
+        self.certificate = certificate
 
     def start(self):
         logger.info("Starting file server")
@@ -95,22 +101,81 @@ class FileServer(object):
                      self.root_path)
         os.chdir(self.root_path)
 
-        class TCPServer(SocketServer.TCPServer):
+        class TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
             allow_reuse_address = True
-        httpd = TCPServer(('0.0.0.0', PORT),
-                          SimpleHTTPServer.SimpleHTTPRequestHandler)
+            daemon_threads = True
+        httpd = TCPServer(('0.0.0.0', self.port), RequestHandler)
+        if self.certificate is not None:
+            httpd.socket = ssl.wrap_socket(httpd.socket,
+                                           certfile=self.certificate,
+                                           server_side=True)
         httpd.serve_forever()
 
     def is_alive(self):
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            s.connect(('localhost', PORT))
+            s.connect(('localhost', self.port))
             s.close()
             return True
         except socket.error:
             return False
 
 
+class RequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """
+    Serves files over keep-alive connections, with an ETag, conditional
+    GETs (If-None-Match) and single 'bytes=<first>-[<last>]' ranges (with
+    If-Range), like the manager's file server does.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # one segment per response, as a real server sends it; header lines
+    # written one by one stall keep-alive clients on delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.close_connection = 1
+            return SimpleHTTPServer.SimpleHTTPRequestHandler.send_head(self)
+        f = open(path, 'rb')
+        stat = os.fstat(f.fileno())
+        etag = '"{0}-{1}"'.format(stat.st_size, int(stat.st_mtime))
+        if self.headers.getheader('If-None-Match') == etag:
+            f.close()
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        start, end = 0, stat.st_size
+        requested = self.headers.getheader('Range', '')
+        if requested.startswith('bytes=') and \
+                self.headers.getheader('If-Range', etag) == etag:
+            first, _, last = requested[len('bytes='):].partition('-')
+            start = int(first)
+            if last:
+                end = min(int(last) + 1, end)
+        if (start, end) != (0, stat.st_size):
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(
+                start, end - 1, stat.st_size))
+        else:
+            self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Last-Modified',
+                         self.date_time_string(stat.st_mtime))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        f.seek(start)
+        content = StringIO.StringIO(f.read(end - start))
+        f.close()
+        return content
+
+
 class TimeoutException(Exception):
     def __init__(self, *args):
         Exception.__init__(self, args)
@@ -0,0 +1,6 @@
+#!/bin/bash
+. ${CLOUDIFY_CTX}
+
+echo ran >> "${runs_file}"
+cfy_set_property marker set
+echo "output of the run"
@@ -0,0 +1,6 @@
+#!/bin/bash
+# ignores SIGTERM, and leaves a child holding stdout and stderr
+trap '' TERM
+sleep 60 &
+echo started
+sleep 60
@@ -0,0 +1,2 @@
+#!/bin/sh
+echo big_size=$(wc -c < ${big_FILE})
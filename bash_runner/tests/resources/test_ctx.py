@@ -0,0 +1,10 @@
+import json
+import os
+
+ctx = os.fdopen(int(os.environ['CLOUDIFY_CTX_FD']), 'w')
+ctx.write(json.dumps({'type': 'log', 'level': 'info',
+                      'message': 'THIS IS AN INFO RECORD'}) + '\n')
+ctx.write(json.dumps({'type': 'return',
+                      'value': {'node': os.environ['CLOUDIFY_NODE_ID'],
+                                'port': 8080}}) + '\n')
+ctx.flush()
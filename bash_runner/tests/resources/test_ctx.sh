@@ -0,0 +1,6 @@
+#!/bin/bash
+. ${CLOUDIFY_CTX}
+
+cfy_log info THIS IS AN INFO RECORD
+cfy_set_property started true
+cfy_return_json '{"node": "'"${CLOUDIFY_NODE_ID}"'", "port": 8080}'
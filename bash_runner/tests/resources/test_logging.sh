@@ -3,3 +3,5 @@
 
 cfy_info THIS IS AN INFO PRINT
 cfy_error THIS IS AN ERROR PRINT
+cfy_warn THIS IS A WARN PRINT
+cfy_debug THIS IS A DEBUG PRINT
@@ -0,0 +1,106 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bash_runner import bash_pool
+from bash_runner.bash_pool import BashWorkerPool
+from bash_runner.bash_pool import bash_version
+from bash_runner.bash_pool import get_bash_pool
+
+
+class TestBashWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.pool = BashWorkerPool(size=1, max_uses=3, helpers=[])
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.temp_dir)
+
+    def run_script(self, content, env):
+        job_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        script = os.path.join(job_dir, 'script.sh')
+        with open(script, 'w') as f:
+            f.write(content)
+        process = self.pool.start(script, env, job_dir)
+        stdout = []
+        while True:
+            try:
+                data = os.read(process.stdout.fileno(), 4096)
+            except OSError:
+                continue
+            if not data:
+                break
+            stdout.append(data)
+        return_code = process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        return ''.join(stdout), return_code
+
+    def test_isolated_environment(self):
+        out, code = self.run_script('echo "$A-$B"; export B=leak; exit 0',
+                                    {'A': 'a'})
+        self.assertEqual(('a-\n', 0), (out, code))
+        out, code = self.run_script('echo "$A-$B"', {})
+        self.assertEqual(('-\n', 0), (out, code))
+
+    def test_exit_code_and_recycling(self):
+        pids = set()
+        for i in range(4):
+            out, code = self.run_script('echo $$; exit 7', {})
+            self.assertEqual(7, code)
+            pids.add(out)
+        # failed jobs never reuse their worker
+        self.assertEqual(4, len(pids))
+
+        for i in range(4):
+            out, code = self.run_script('echo $$', {})
+            pids.add(out)
+        # a worker serves max_uses scripts
+        self.assertEqual(6, len(pids))
+
+    def test_start_without_blocking(self):
+        job_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        script = os.path.join(job_dir, 'script.sh')
+        with open(script, 'w') as f:
+            f.write('exit 0\n')
+        process = self.pool.start(script, {}, job_dir)
+        # the only worker is busy until the job finished
+        self.assertEqual(None, self.pool.start(script, {}, self.temp_dir,
+                                               block=False))
+        self.assertEqual(0, process.wait())
+        process.stdout.close()
+        process.stderr.close()
+        process.ctx.close()
+        out, code = self.run_script('echo idle', {})
+        self.assertEqual(('idle\n', 0), (out, code))
+
+    def test_old_bash_runs_cold(self):
+        # $0 of warm jobs needs bash 5 (BASH_ARGV0)
+        self.assertIsNotNone(bash_version())
+        supported = bash_pool._supported
+        min_version = bash_pool.MIN_BASH_VERSION
+        bash_pool._supported = None
+        bash_pool.MIN_BASH_VERSION = bash_version() + 1
+        try:
+            self.assertEqual(None, get_bash_pool())
+        finally:
+            bash_pool._supported = supported
+            bash_pool.MIN_BASH_VERSION = min_version
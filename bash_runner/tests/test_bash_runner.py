@@ -15,16 +15,27 @@
 
 import os
 from os.path import dirname
+import shutil
+import sys
+import tempfile
+import time
 import unittest
 
 from cloudify.mocks import MockCloudifyContext
 from cloudify.constants import MANAGER_IP_KEY, \
     MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY, MANAGER_FILE_SERVER_URL_KEY
 
+from bash_runner.script_cache import ScriptCache
+from bash_runner.step_cache import STEP_CACHE_DIR_ENV
+from bash_runner.step_cache import StepCache
 from bash_runner.tasks import run_and_return_output
 
+from bash_runner.tasks import AggregateProcessException
 from bash_runner.tasks import ProcessException
+from bash_runner.tasks import ProcessTimeoutException
 from bash_runner.tasks import run
+from bash_runner.tasks import run_batch
+from bash_runner.tasks import run_many
 import bash_runner.tests as test_path
 
 
@@ -142,6 +153,18 @@ class TestBashRunner(unittest.TestCase):
         for key in expected_dict:
             self.assertEqual(expected_dict[key], actual_dict[key])
 
+    def test_large_property(self):
+
+        # larger than what a single environment string may hold on Linux
+        properties = {'big': 'x' * 256 * 1024}
+
+        out = run_and_return_output(self.create_context(properties),
+                                    script_path="large-prop.sh",
+                                    offload_size=32 * 1024)
+
+        actual_dict = properties_to_dict(out)
+        self.assertEqual(256 * 1024, actual_dict['big_size'])
+
     def test_no_script_mapping_for_operation(self):
 
         scripts = {
@@ -159,6 +182,140 @@ class TestBashRunner(unittest.TestCase):
         except ProcessException as e:
             self.assertEqual(5, e.exit_code)
 
+    def test_output_spilled_to_disk(self):
+
+        out = run_and_return_output(self.create_context({}),
+                                    script_path="env.sh",
+                                    max_output_memory=16)
+        self.assertTrue(out.spilled)
+        actual_dict = properties_to_dict(out)
+        self.assertEqual('test', actual_dict['CLOUDIFY_NODE_ID'])
+
+    def test_warm(self):
+
+        out = run_and_return_output(self.create_context({'port': 8080}),
+                                    script_path="env.sh", warm=True)
+        actual_dict = properties_to_dict(out)
+        self.assertEqual('test', actual_dict['CLOUDIFY_NODE_ID'])
+        self.assertEqual(8080, actual_dict['port'])
+
+        out = run_and_return_output(self.create_context({}),
+                                    script_path="test_logging.sh", warm=True)
+        self.assertEqual("[INFO] [test_logging.sh] THIS IS AN INFO PRINT",
+                         out.splitlines()[0])
+
+        try:
+            run_and_return_output(self.create_context({}),
+                                  script_path="bad.sh", warm=True)
+            self.fail("Expected exception")
+        except ProcessException as e:
+            self.assertEqual(5, e.exit_code)
+
+    def test_ctx_side_channel(self):
+
+        for warm in (False, True):
+            result = run(self.create_context({}),
+                         script_path="test_ctx.sh", warm=warm)
+            self.assertEqual({'node': 'test', 'port': 8080}, result)
+
+    def test_python_script(self):
+
+        for warm in (False, True):
+            result = run(self.create_context({}),
+                         script_path="test_ctx.py",
+                         interpreter=sys.executable, warm=warm)
+            self.assertEqual({'node': 'test', 'port': 8080}, result)
+
+    def test_timeout(self):
+
+        for warm in (False, True):
+            start = time.time()
+            try:
+                run_and_return_output(self.create_context({}),
+                                      script_path="hang.sh", timeout=0.5,
+                                      kill_grace=0.5, warm=warm)
+                self.fail("Expected exception")
+            except ProcessTimeoutException as e:
+                self.assertTrue(0.5 <= e.elapsed < 5)
+                self.assertEqual('started\n', str(e.stdout))
+                self.assertIn('Timed out after', str(e))
+            # SIGTERM is ignored, so the script and its background child
+            # are only gone after SIGKILL.
+            self.assertTrue(time.time() - start < 5)
+
+    def test_run_many(self):
+
+        out = run_many(self.create_context({}),
+                       scripts=['ls.sh',
+                                {'name': 'env', 'path': 'env.sh',
+                                 'depends_on': ['ls.sh']}])
+        self.assertEqual('[ls.sh, env] succeeded. return code 0', out)
+
+    def test_run_many_from_scripts_property(self):
+
+        scripts = {
+            'start': ['ls.sh', 'env.sh']
+        }
+
+        out = run_many(self.create_context({'scripts': scripts}))
+        self.assertEqual('[ls.sh, env.sh] succeeded. return code 0', out)
+
+    def test_run_many_collects_errors(self):
+
+        try:
+            run_many(self.create_context({}),
+                     scripts=['bad.sh',
+                              'ls.sh',
+                              {'path': 'env.sh', 'depends_on': ['bad.sh']}],
+                     fail_fast=False)
+            self.fail("Expected exception")
+        except AggregateProcessException as e:
+            self.assertEqual(['bad.sh'], [name for name, _ in e.errors])
+            self.assertEqual(['env.sh'], e.skipped)
+            self.assertEqual(5, e.exit_code)
+
+    def test_run_batch(self):
+
+        updated = []
+
+        class Context(BashRunnerMockCloudifyContext):
+            def update(self):
+                updated.append((self.node_id, dict(self.runtime_properties)))
+
+        def create_context(node_id, scripts):
+            return Context(
+                node_id=node_id,
+                blueprint_id='',
+                deployment_id='test',
+                execution_id='test',
+                operation='cloudify.interfaces.lifecycle.start',
+                properties={'scripts': scripts})
+
+        ctxs = [create_context('node_{0}'.format(i), {'start': 'test_ctx.sh'})
+                for i in range(10)]
+        ctxs.append(create_context('bad', {'start': 'bad.sh'}))
+        ctxs.append(create_context('unmapped', {'stop': 'bad.sh'}))
+        results = run_batch(ctxs, concurrency=4)
+
+        self.assertEqual([ctx.node_id for ctx in ctxs],
+                         [result['node_id'] for result in results])
+        for i, result in enumerate(results[:10]):
+            self.assertEqual('succeeded', result['status'])
+            self.assertEqual({'node': 'node_{0}'.format(i), 'port': 8080},
+                             result['return_value'])
+            self.assertEqual(0, result['exit_code'])
+            self.assertTrue(result['usage']['wall_time'] > 0)
+        self.assertEqual('failed', results[10]['status'])
+        self.assertEqual(5, results[10]['exit_code'])
+        self.assertTrue(results[10]['error'].startswith('ProcessException'))
+        self.assertEqual('skipped', results[11]['status'])
+        self.assertEqual(None, results[11]['exit_code'])
+        # not operations: the properties set are stored by run_batch
+        self.assertEqual(sorted(('node_{0}'.format(i), {'started': 'true'})
+                                for i in range(10)),
+                         sorted(updated))
+        self.assertEqual([], run_batch([]))
+
     def test_logging(self):
 
         out = run_and_return_output(self.create_context({}),
@@ -168,6 +325,75 @@ class TestBashRunner(unittest.TestCase):
                          "[INFO] [test_logging.sh] THIS IS AN INFO PRINT")
         self.assertEqual(line[1],
                          "[ERROR] [test_logging.sh] THIS IS AN ERROR PRINT")
+        self.assertEqual(line[2],
+                         "[WARN] [test_logging.sh] THIS IS A WARN PRINT")
+        self.assertEqual(line[3],
+                         "[DEBUG] [test_logging.sh] THIS IS A DEBUG PRINT")
+
+    def test_script_cache(self):
+
+        from bash_runner.tests.file_server import PORT
+
+        root = tempfile.mkdtemp()
+        try:
+            cache = ScriptCache(root)
+            base_url = "http://localhost:{0}".format(PORT)
+            path = cache.get('', 'ls.sh', base_url)
+            self.assertEqual('ls.sh', os.path.basename(path))
+            self.assertEqual(path, cache.get('', 'ls.sh', base_url))
+            self.assertEqual({'hits': 1, 'misses': 1, 'evictions': 0},
+                             cache.stats())
+
+            cache.max_size = 0
+            cache.evict()
+            self.assertTrue(os.path.exists(path))  # recently used
+            past = time.time() - 3600
+            os.utime(dirname(path), (past, past))
+            cache.evict()
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(1, cache.evictions)
+
+            # an evicted object is downloaded again
+            self.assertEqual(path, cache.get('', 'ls.sh', base_url))
+            self.assertEqual(2, cache.misses)
+        finally:
+            shutil.rmtree(root)
+
+    def test_skip_unchanged(self):
+
+        root = tempfile.mkdtemp()
+        os.environ[STEP_CACHE_DIR_ENV] = root
+        try:
+            runs_file = os.path.join(root, 'runs')
+            properties = {'runs_file': runs_file}
+
+            def count_runs(**kwargs):
+                ctx = self.create_context(dict(properties))
+                kwargs.setdefault('skip_unchanged', True)
+                output = run_and_return_output(ctx,
+                                               script_path="count_runs.sh",
+                                               **kwargs)
+                self.assertEqual('output of the run\n', str(output))
+                self.assertEqual('set', ctx['marker'])
+                with open(runs_file) as f:
+                    return len(f.readlines())
+
+            self.assertEqual(1, count_runs())
+            # skipped, the stdout and runtime properties are reused
+            self.assertEqual(1, count_runs())
+            self.assertEqual(2, count_runs(force=True))
+            self.assertEqual(3, count_runs(skip_ttl=0))
+            properties['port'] = 8080
+            self.assertEqual(4, count_runs())
+            self.assertEqual(4, count_runs())
+            self.assertEqual(5, count_runs(skip_unchanged=False))
+
+            # records another user could plant are not trusted
+            os.chmod(root, 0777)
+            self.assertRaises(OSError, StepCache, root)
+        finally:
+            del os.environ[STEP_CACHE_DIR_ENV]
+            shutil.rmtree(root)
 
     def test_download_resource(self):
 
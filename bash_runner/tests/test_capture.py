@@ -0,0 +1,52 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import unittest
+
+from bash_runner.capture import CapturedOutput
+from bash_runner.capture import OutputCapture
+
+
+class TestOutputCapture(unittest.TestCase):
+
+    def test_in_memory(self):
+        capture = OutputCapture(max_memory=100)
+        capture.write('line1\n')
+        capture.write('line2\n')
+        out = capture.result()
+        self.assertFalse(out.spilled)
+        self.assertEqual(12, len(out))
+        self.assertEqual('line1\nline2\n', str(out))
+        self.assertEqual(['line1\n', 'line2\n'], list(out))
+
+    def test_spill_to_disk(self):
+        capture = OutputCapture(max_memory=10, head_size=4, tail_size=4)
+        for i in range(1000):
+            capture.write('{0}\n'.format(i))
+        out = capture.result()
+        self.assertTrue(out.spilled)
+        expected = ''.join('{0}\n'.format(i) for i in range(1000))
+        self.assertEqual(expected, out.read())
+        self.assertEqual(expected, str(out))
+        self.assertEqual('0\n1\n\n... [{0} bytes omitted] ...\n999\n'
+                         .format(len(expected) - 8),
+                         out.summary())
+        out.close()
+
+    def test_from_string(self):
+        out = CapturedOutput.from_string('a\nb')
+        self.assertEqual('a\n', out.readline())
+        self.assertEqual('b', out.read())
+        self.assertEqual(['a', 'b'], out.splitlines())
@@ -0,0 +1,287 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import hashlib
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import unittest
+from os.path import dirname
+
+from cloudify.mocks import MockCloudifyContext
+from cloudify.constants import MANAGER_IP_KEY, \
+    MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+
+from bash_runner.downloader import DownloadService
+from bash_runner.downloader import ENABLE_ENV
+from bash_runner.downloader import get_download_service
+from bash_runner.engine import ProcessException
+from bash_runner.http_pool import get_connection_pool
+from bash_runner.script_cache import CACHE_DIR_ENV
+from bash_runner.script_cache import ChecksumMismatch
+from bash_runner.script_cache import ScriptCache
+from bash_runner.tasks import execute
+from bash_runner.tests.file_server import FileServer
+from bash_runner.tests.file_server import PORT
+import bash_runner.tests as test_path
+
+RESOURCES = os.path.join(dirname(test_path.__file__), 'resources')
+
+BASE_URL = 'http://localhost:{0}'.format(PORT)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class TestDownloads(unittest.TestCase):
+
+    file_server_process = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.file_server_process = FileServer(RESOURCES)
+        cls.file_server_process.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.file_server_process.stop()
+
+    def setUp(self):
+        self.original_environ = os.environ.copy()
+        self.root = tempfile.mkdtemp()
+        os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY] = BASE_URL
+        os.environ[MANAGER_IP_KEY] = 'localhost'
+        os.environ[CACHE_DIR_ENV] = os.path.join(self.root, 'cache')
+        os.environ[ENABLE_ENV] = 'true'
+        self.cache = ScriptCache(os.path.join(self.root, 'cache'))
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.original_environ)
+        shutil.rmtree(self.root)
+
+    def test_keep_alive(self):
+        pool, _ = get_connection_pool(BASE_URL)
+        self.cache.get('', 'ls.sh', BASE_URL)
+        opened = pool.connections_opened
+        for name in ('index.html', 'bad.sh', 'ls.sh', 'env.sh'):
+            self.cache.get('', name, BASE_URL)
+        self.assertEqual(opened, pool.connections_opened)
+        self.assertEqual([], self._partials())
+
+    def _partial(self, resource_path, content, validator):
+        key = hashlib.sha1('\0' + resource_path).hexdigest()
+        partial = os.path.join(self.cache.root, 'objects', '.partial-' + key)
+        with open(partial, 'wb') as f:
+            f.write(content)
+        with open(partial + '.validator', 'w') as f:
+            f.write(validator)
+        return partial
+
+    def test_resume(self):
+        path = os.path.join(RESOURCES, 'index.html')
+        content = read(path)
+        etag = '"{0}-{1}"'.format(len(content), int(os.path.getmtime(path)))
+
+        # a matching validator: only the rest is requested
+        partial = self._partial('index.html', 'X' * 100, etag)
+        self.assertEqual('X' * 100 + content[100:],
+                         read(self.cache.get('', 'index.html', BASE_URL)))
+        self.assertFalse(os.path.exists(partial))
+        self.assertFalse(os.path.exists(partial + '.validator'))
+
+        # the resource changed since: downloaded from the start
+        self._partial('ls.sh', 'X' * 5, '"stale"')
+        self.assertEqual(read(os.path.join(RESOURCES, 'ls.sh')),
+                         read(self.cache.get('', 'ls.sh', BASE_URL)))
+
+    def test_checksum(self):
+        content = read(os.path.join(RESOURCES, 'ls.sh'))
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertRaises(ChecksumMismatch, self.cache.get,
+                          '', 'ls.sh', BASE_URL, sha256='0' * 64)
+        self.assertEqual([], self._partials())
+        path = self.cache.get('', 'ls.sh', BASE_URL, sha256=digest)
+        self.assertEqual(content, read(path))
+        # a cached object with the digest is current by definition
+        hits = self.cache.hits
+        self.assertEqual(path, self.cache.get('', 'ls.sh', BASE_URL,
+                                              sha256=digest.upper()))
+        self.assertEqual(hits + 1, self.cache.hits)
+        self.assertRaises(ChecksumMismatch, self.cache.get,
+                          '', 'ls.sh', BASE_URL, sha256='0' * 64)
+        self.assertEqual([], self._partials())
+
+    def _partials(self):
+        return [name for name in os.listdir(
+            os.path.join(self.cache.root, 'objects'))
+            if name.startswith('.')]
+
+    def test_shared_root(self):
+        # another user could plant an index entry and the object it names
+        root = os.path.join(self.root, 'shared')
+        os.mkdir(root)
+        os.chmod(root, 0777)
+        self.assertRaises(OSError, ScriptCache, root)
+
+    def test_parallel_parts(self):
+        cache = ScriptCache(os.path.join(self.root, 'parallel'),
+                            parallel_min_size=100, parallel_parts=3)
+        pool, _ = get_connection_pool(BASE_URL)
+        opened = pool.connections_opened
+        path = cache.get('', 'index.html', BASE_URL)
+        self.assertEqual(read(os.path.join(RESOURCES, 'index.html')),
+                         read(path))
+        # two more ranges, each on a connection of its own
+        self.assertTrue(pool.connections_opened >= opened + 2)
+        # too small for parts
+        self.assertEqual(read(os.path.join(RESOURCES, 'ls.sh')),
+                         read(cache.get('', 'ls.sh', BASE_URL)))
+
+    def test_https(self):
+        # the socket carries TLS records: bodies must not be spliced
+        pem = os.path.join(self.root, 'server.pem')
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(
+                ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+                 '-subj', '/CN=localhost', '-days', '1',
+                 '-keyout', pem, '-out', pem + '.crt'],
+                stdout=devnull, stderr=devnull)
+        with open(pem, 'a') as f:
+            f.write(read(pem + '.crt'))
+        server = FileServer(RESOURCES, port=PORT + 1, certificate=pem)
+        server.start()
+        default_context = ssl._create_default_https_context
+        ssl._create_default_https_context = ssl._create_unverified_context
+        try:
+            base_url = 'https://localhost:{0}'.format(PORT + 1)
+            cache = ScriptCache(os.path.join(self.root, 'https'),
+                                parallel_min_size=100, parallel_parts=3)
+            self.assertEqual(read(os.path.join(RESOURCES, 'index.html')),
+                             read(cache.get('', 'index.html', base_url)))
+
+            pool, path = get_connection_pool(base_url + '/ls.sh')
+            target = os.path.join(self.root, 'ls.sh')
+            with pool.request(path) as response, open(target, 'wb') as f:
+                response.copy_to(f.fileno(), response.length)
+            self.assertEqual(read(os.path.join(RESOURCES, 'ls.sh')),
+                             read(target))
+        finally:
+            ssl._create_default_https_context = default_context
+            server.stop()
+
+    def test_disabled_by_default(self):
+        del os.environ[ENABLE_ENV]
+        self.assertIsNone(get_download_service())
+        os.environ[ENABLE_ENV] = 'true'
+        self.assertIsNotNone(get_download_service())
+
+    def test_target_linked_to_cache(self):
+        content = read(os.path.join(RESOURCES, 'ls.sh'))
+        target = os.path.join(self.root, 'ls.sh')
+        service = DownloadService(self.cache)
+        try:
+            self.assertEqual([], service.download('', [('ls.sh', target,
+                                                        None)]))
+        finally:
+            service.close()
+        path = self.cache.get('', 'ls.sh', BASE_URL)
+        self.assertEqual(os.stat(path).st_ino, os.stat(target).st_ino)
+        # a script changing the target in place changes the object
+        with open(target, 'a') as f:
+            f.write('echo changed\n')
+        os.utime(target, (0, 0))
+        path = self.cache.get('', 'ls.sh', BASE_URL)
+        self.assertEqual(content, read(path))
+        self.assertNotEqual(os.stat(path).st_ino, os.stat(target).st_ino)
+
+    def test_stream(self):
+        ctx = MockCloudifyContext(node_id='node',
+                                  blueprint_id='',
+                                  deployment_id='deployment',
+                                  execution_id='execution',
+                                  properties={})
+        content = read(os.path.join(RESOURCES, 'index.html'))
+        digest = hashlib.sha256(content).hexdigest()
+        out = execute(['/bin/bash', '-c',
+                       '. "$CLOUDIFY_FILE_SERVER"; '
+                       'cfy_download_resource --pipe index.html '
+                       '--sha256 "$1" | cat && '
+                       'cfy_download_resource index.html -O -',
+                       'bash', digest],
+                      ctx, log_all=False)
+        self.assertEqual(content * 2, str(out))
+
+        try:
+            execute(['/bin/bash', '-c',
+                     '. "$CLOUDIFY_FILE_SERVER"; '
+                     'cfy_download_resource --pipe index.html --sha256 0 '
+                     '> /dev/null || exit 7; '
+                     'cfy_download_resource --pipe missing > /dev/null '
+                     '|| exit 8'],
+                    ctx, log_all=False)
+            self.fail('Expected exception')
+        except ProcessException as e:
+            self.assertEqual(7, e.exit_code)
+            self.assertIn('expected SHA-256 0', str(e))
+
+        try:
+            execute(['/bin/bash', '-c',
+                     '. "$CLOUDIFY_FILE_SERVER"; '
+                     'cfy_download_resource --pipe missing || exit 8'],
+                    ctx, log_all=False)
+            self.fail('Expected exception')
+        except ProcessException as e:
+            self.assertEqual(8, e.exit_code)
+            self.assertIn('404', str(e))
+
+    def test_script_helpers(self):
+        ctx = MockCloudifyContext(node_id='node',
+                                  blueprint_id='',
+                                  deployment_id='deployment',
+                                  execution_id='execution',
+                                  properties={})
+        target = os.path.join(self.root, 'target')
+        os.mkdir(target)
+        digest = hashlib.sha256(
+            read(os.path.join(RESOURCES, 'ls.sh'))).hexdigest()
+        execute(['/bin/bash', '-c',
+                 '. "$CLOUDIFY_FILE_SERVER"; cd "$1"; '
+                 'test -n "$CLOUDIFY_DOWNLOAD_SERVICE" && '
+                 'cfy_download_resources -P sub index.html bad.sh && '
+                 'cfy_download_resource ls.sh --sha256 "$2" && '
+                 'cfy_download_resource env.sh -O renamed.sh',
+                 'bash', target, digest],
+                ctx, log_all=False)
+        for name, resource in (('sub/index.html', 'index.html'),
+                               ('sub/bad.sh', 'bad.sh'),
+                               ('ls.sh', 'ls.sh'),
+                               ('renamed.sh', 'env.sh')):
+            self.assertEqual(read(os.path.join(RESOURCES, resource)),
+                             read(os.path.join(target, name)))
+
+        try:
+            execute(['/bin/bash', '-c',
+                     '. "$CLOUDIFY_FILE_SERVER"; cd "$1"; '
+                     'cfy_download_resource ls.sh --sha256 0000 || exit 7',
+                     'bash', target],
+                    ctx, log_all=False)
+            self.fail('Expected exception')
+        except ProcessException as e:
+            self.assertEqual(7, e.exit_code)
+            self.assertIn('expected SHA-256 0000', str(e))
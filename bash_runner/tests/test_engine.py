@@ -0,0 +1,289 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+from cloudify.mocks import MockCloudifyContext
+from cloudify.constants import MANAGER_IP_KEY, \
+    MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+from testfixtures import LogCapture
+
+from bash_runner import bash_pool
+from bash_runner.accounting import ExecutionHooks
+from bash_runner.accounting import register_hooks
+from bash_runner.accounting import unregister_hooks
+from bash_runner.bash_pool import BashWorkerPool
+from bash_runner.engine import ProcessException
+from bash_runner.engine import execute_many
+from bash_runner.log_sender import get_log_sender
+
+
+class TestExecutionEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.original_environ = os.environ.copy()
+        os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY] = \
+            'http://localhost:53229'
+        os.environ[MANAGER_IP_KEY] = 'localhost'
+        self.ctx = MockCloudifyContext(node_id='node',
+                                       blueprint_id='blueprint',
+                                       deployment_id='deployment',
+                                       execution_id='execution',
+                                       properties={})
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.original_environ)
+
+    def test_concurrent(self):
+        get_log_sender()
+        threads = threading.active_count()
+        start = time.time()
+        executions = execute_many(
+            ['sleep 0.5; echo {0}'.format(i) for i in range(20)], self.ctx)
+        # all commands overlap, on the calling thread and the log sender
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(threads, threading.active_count())
+        self.assertEqual(['{0}\n'.format(i) for i in range(20)],
+                         [str(execution.result()) for execution in executions])
+
+    def test_concurrency_limit(self):
+        start = time.time()
+        execute_many(['sleep 0.3'] * 4, self.ctx, concurrency=2)
+        self.assertTrue(time.time() - start >= 0.6)
+
+    def test_log_levels(self):
+        logger = logging.getLogger('bash_runner.tests.engine')
+        with LogCapture('bash_runner.tests.engine') as capture:
+            execute_many([['/bin/bash', '-c',
+                           '. "$CLOUDIFY_LOGGING"; cfy_debug d; cfy_info i; '
+                           'cfy_warn "w  w"; cfy_error e; echo plain']],
+                         self.ctx, logger=logger, log_all=True)
+        done = capture.records.pop()
+        capture.check(
+            ('bash_runner.tests.engine', 'INFO',
+             "Running command: /bin/bash -c '. \"$CLOUDIFY_LOGGING\"; "
+             "cfy_debug d; cfy_info i; cfy_warn \"w  w\"; cfy_error e; "
+             "echo plain'"),
+            ('bash_runner.tests.engine', 'DEBUG', '[bash] d'),
+            ('bash_runner.tests.engine', 'INFO', '[bash] i'),
+            ('bash_runner.tests.engine', 'WARNING', '[bash] w  w'),
+            ('bash_runner.tests.engine', 'ERROR', '[bash] e'),
+            ('bash_runner.tests.engine', 'INFO', 'plain'))
+        self.assertEqual('INFO', done.levelname)
+        self.assertRegexpMatches(
+            done.getMessage(),
+            r"^Done running command \(return_code=0, wall=[0-9.]+s, "
+            r"user=[0-9.]+s, .*, stdout=\d+B, stderr=0B, log_lines=5\): "
+            r"/bin/bash -c '\. \"\$CLOUDIFY_LOGGING\"; cfy_debug d; "
+            r"cfy_info i; cfy_warn \"w  w\"; cfy_error e; echo plain'$")
+
+    def test_failures_are_per_command(self):
+        failing, succeeding = execute_many(
+            ['echo oops >&2; exit 4', 'echo fine'], self.ctx)
+        self.assertEqual('fine\n', str(succeeding.result()))
+        try:
+            failing.result()
+            self.fail('Expected exception')
+        except ProcessException as e:
+            self.assertEqual(4, e.exit_code)
+            self.assertEqual('oops\n', str(e))
+
+    def test_side_channel(self):
+        logger = logging.getLogger('bash_runner.tests.engine')
+        with LogCapture('bash_runner.tests.engine') as capture:
+            execution, = execute_many(
+                [['/bin/bash', '-c',
+                  '. "$CLOUDIFY_CTX"; echo "[INFO] on stdout"; '
+                  'cfy_log warn \'say "hi"\'; '
+                  'cfy_ctx_send \'{"type": "runtime_property", '
+                  '"key": "port", "value": 8080}\'; '
+                  'cfy_ctx_send "not json"; '
+                  'cfy_return_json \'{"ok": [1, 2]}\'',
+                  'script.sh']],
+                self.ctx, logger=logger)
+        self.assertEqual('[INFO] on stdout\n', str(execution.result()))
+        self.assertEqual({'ok': [1, 2]}, execution.return_value)
+        self.assertEqual({'port': 8080}, execution.runtime_properties)
+        self.assertEqual(8080, self.ctx['port'])
+        # a record per line, e.g. not glued to 'Running command: ...'
+        messages = [(r.levelname, r.getMessage()) for r in capture.records]
+        self.assertIn(('INFO', 'on stdout'), messages)
+        self.assertTrue(messages[0][1].startswith('Running command: '))
+        warnings = [m for level, m in messages if level == 'WARNING']
+        self.assertIn('[script.sh] say "hi"', warnings)
+        self.assertIn('Invalid ctx record (No JSON object could be '
+                      'decoded): not json', warnings)
+
+    def test_background_child(self):
+        # a detached child keeps the side channel open, not the command
+        start = time.time()
+        execution, = execute_many(
+            [['/bin/bash', '-c',
+              '. "$CLOUDIFY_CTX"; cfy_return early; '
+              'nohup sleep 30 >/dev/null 2>&1 & echo $!']],
+            self.ctx)
+        os.kill(int(str(execution.result())), signal.SIGKILL)
+        self.assertTrue(time.time() - start < 10)
+        self.assertEqual('early', execution.return_value)
+
+    def test_warm_pool_busy(self):
+        # with more commands than workers, the others run cold rather
+        # than wait for a worker, which the engine would stop draining
+        pool = bash_pool._pool
+        bash_pool._pool = BashWorkerPool(size=1, helpers=[])
+        script = os.path.join(tempfile.mkdtemp(), 'script.sh')
+        try:
+            with open(script, 'w') as f:
+                f.write('head -c 300000 /dev/zero; echo $$\n')
+            executions = execute_many([['/bin/bash', script]] * 3,
+                                      self.ctx, concurrency=3, warm=True)
+            pids = set(str(e.result())[300000:] for e in executions)
+            self.assertEqual(3, len(pids))
+        finally:
+            bash_pool._pool.close()
+            bash_pool._pool = pool
+            shutil.rmtree(os.path.dirname(script))
+
+    def test_last_line_not_held_back(self):
+        logged = []
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                logged.append((time.time(), record.getMessage()))
+
+        logger = logging.getLogger('bash_runner.tests.engine.latest')
+        handler = Handler()
+        logger.addHandler(handler)
+        try:
+            start = time.time()
+            execute_many([['/bin/bash', '-c', '. "$CLOUDIFY_LOGGING"; '
+                           'cfy_info hello; sleep 2']],
+                         self.ctx, logger=logger)
+        finally:
+            logger.removeHandler(handler)
+        hello, = [t for t, message in logged if message == '[bash] hello']
+        self.assertTrue(hello - start < 1.5)
+
+    def test_single_sender_thread(self):
+        threads = set()
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                threads.add(threading.current_thread())
+
+        logger = logging.getLogger('bash_runner.tests.engine.threads')
+        handler = Handler()
+        logger.addHandler(handler)
+        try:
+            for i in range(3):
+                execute_many(['echo "[INFO] {0}"'.format(i)], self.ctx,
+                             logger=logger)
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(1, len(threads))
+
+    def test_offload_size(self):
+        self.ctx.properties['big'] = 'x' * 40 * 1024
+        command = ['/bin/bash', '-c', 'echo ${#big} ${big_FILE:+file}']
+        inline, = execute_many([command], self.ctx)
+        self.assertEqual('40960\n', str(inline.result()))
+        offloaded, = execute_many([command], self.ctx, offload_size=1024)
+        self.assertEqual('0 file\n', str(offloaded.result()))
+
+    def test_resource_usage(self):
+        succeeding, failing = execute_many(
+            ['head -c 100000 /dev/zero | md5sum; echo "[INFO] done"',
+             'echo oops >&2; exit 1'], self.ctx)
+        usage = succeeding.usage
+        self.assertIs(usage, succeeding.result().usage)
+        self.assertTrue(usage.wall_time > 0)
+        self.assertTrue(usage.max_rss > 0)
+        self.assertTrue(usage.voluntary_switches >= 0)
+        self.assertEqual(len(str(succeeding.result())), usage.stdout_bytes)
+        self.assertEqual(0, usage.stderr_bytes)
+        self.assertEqual(1, usage.log_lines)
+        self.assertEqual(set(usage.FIELDS), set(usage.as_dict()))
+        try:
+            failing.result()
+            self.fail('Expected exception')
+        except ProcessException as e:
+            self.assertIs(failing.usage, e.usage)
+            self.assertEqual(5, e.usage.stderr_bytes)
+
+    def test_stream(self):
+        logger = logging.getLogger('bash_runner.tests.engine')
+        with LogCapture('bash_runner.tests.engine') as capture:
+            execute_many(['echo a; echo b; echo e >&2; sleep 1; echo c'],
+                         self.ctx, logger=logger, stream=True,
+                         stream_interval=0.1)
+        done = capture.records.pop()
+        records = capture.records[1:]
+        self.assertEqual(
+            set([('INFO', 'a\nb'), ('ERROR', 'e')]),
+            set((r.levelname, r.getMessage()) for r in records[:2]))
+        self.assertEqual(('INFO', 'c'),
+                         (records[2].levelname, records[2].getMessage()))
+        self.assertEqual(3, len(records))
+        # logged while the command was still running
+        for record in records[:2]:
+            self.assertTrue(done.created - record.created > 0.5)
+
+    def test_hooks(self):
+        events = []
+
+        class Hooks(ExecutionHooks):
+            def pre_spawn(self, execution, argv, env):
+                env['HOOKED'] = 'yes'
+                events.append(('pre_spawn', argv[-1]))
+
+            def on_line(self, execution, stream, line):
+                events.append((stream, line))
+
+            def post_exit(self, execution, usage):
+                events.append(('post_exit', usage.stdout_bytes))
+
+        class Failing(ExecutionHooks):
+            def on_line(self, execution, stream, line):
+                raise RuntimeError('broken exporter')
+
+        hooks = Hooks()
+        register_hooks(hooks)
+        try:
+            execution, = execute_many(['echo $HOOKED; echo err >&2'],
+                                      self.ctx)
+        finally:
+            unregister_hooks(hooks)
+        self.assertEqual('yes\n', str(execution.result()))
+        self.assertEqual(('pre_spawn', 'echo $HOOKED; echo err >&2'),
+                         events[0])
+        self.assertEqual(set([('stdout', 'yes'), ('stderr', 'err')]),
+                         set(events[1:3]))
+        self.assertEqual(('post_exit', 4), events[3])
+
+        with LogCapture('bash_runner.tests.engine') as capture:
+            execution, = execute_many(
+                ['echo fine'], self.ctx, hooks=[Failing()],
+                logger=logging.getLogger('bash_runner.tests.engine'))
+        self.assertEqual('fine\n', str(execution.result()))
+        self.assertIn('Execution hook Failing.on_line failed: '
+                      'broken exporter',
+                      [r.getMessage() for r in capture.records])
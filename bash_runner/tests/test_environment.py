@@ -0,0 +1,106 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudify.mocks import MockCloudifyContext
+from cloudify.constants import MANAGER_IP_KEY, \
+    MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+
+from bash_runner.environment import flatten
+from bash_runner.environment import setup_environment
+
+
+class TestEnvironment(unittest.TestCase):
+
+    def setUp(self):
+        self.original_environ = os.environ.copy()
+        os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY] = \
+            'http://localhost:53229'
+        os.environ[MANAGER_IP_KEY] = 'localhost'
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.original_environ)
+
+    def create_context(self, properties):
+        return MockCloudifyContext(node_id='node',
+                                   blueprint_id='blueprint',
+                                   deployment_id='deployment',
+                                   execution_id='execution',
+                                   properties=properties)
+
+    def test_flatten(self):
+        self.assertEqual({'a': 1, 'b_c': 2, 'b_d_e': u'x'},
+                         flatten({'a': 1, 'b': {'c': 2, 'd': {'e': u'x'}}}))
+
+    def test_flatten_lists(self):
+        self.assertEqual({'a.b': [1, {'c': 2}], 'a.b.0': 1, 'a.b.1.c': 2},
+                         flatten({'a': {'b': [1, {'c': 2}]}},
+                                 separator='.'))
+
+    def test_large_values_offloaded(self):
+        properties = {'small': 'x', 'big': 'y' * 100}
+        offload_dir = tempfile.mkdtemp()
+        try:
+            env = setup_environment(self.create_context(properties),
+                                    offload_dir=offload_dir,
+                                    max_value_size=50)
+            self.assertEqual('x', env['small'])
+            self.assertNotIn('big', env)
+            with open(env['big_FILE']) as f:
+                self.assertEqual('y' * 100, f.read())
+            self.assertEqual(offload_dir, os.path.dirname(env['big_FILE']))
+        finally:
+            shutil.rmtree(offload_dir)
+
+        # '<key>_FILE' would replace a property
+        properties['big_FILE'] = 'z'
+        offload_dir = tempfile.mkdtemp()
+        try:
+            self.assertRaises(ValueError, setup_environment,
+                              self.create_context(properties),
+                              offload_dir=offload_dir, max_value_size=50)
+        finally:
+            shutil.rmtree(offload_dir)
+
+        # without an offload directory values stay inline
+        env = setup_environment(self.create_context(properties),
+                                max_value_size=50)
+        self.assertEqual('y' * 100, env['big'])
+
+    def test_properties_change_invalidates(self):
+        properties = {'port': 8080, 'nested': {'key': u'value'}}
+        env = setup_environment(self.create_context(properties))
+        self.assertEqual('8080', env['port'])
+        self.assertEqual('value', env['nested_key'])
+        self.assertEqual('node', env['CLOUDIFY_NODE_ID'])
+        self.assertEqual('http://localhost:53229/blueprint',
+                         env['CLOUDIFY_FILE_SERVER_BLUEPRINT_ROOT'])
+
+        env['port'] = 'modified by caller'
+        properties['nested']['key'] = u'changed'
+        env = setup_environment(self.create_context(properties))
+        self.assertEqual('8080', env['port'])
+        self.assertEqual('changed', env['nested_key'])
+
+    def test_manager_change_invalidates(self):
+        setup_environment(self.create_context({}))
+        os.environ[MANAGER_IP_KEY] = '10.0.0.1'
+        env = setup_environment(self.create_context({}))
+        self.assertEqual('10.0.0.1', env['CLOUDIFY_MANAGER_IP'])
@@ -0,0 +1,147 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from cloudify.mocks import MockCloudifyContext
+from cloudify.constants import MANAGER_IP_KEY, \
+    MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+
+from bash_runner import helpers
+from bash_runner.environment import setup_environment
+from bash_runner.helpers import CHAINED_BASH_ENV
+from bash_runner.helpers import HELPERS_DIR_ENV
+from bash_runner.helpers import PRELOAD_ENV
+from bash_runner.helpers import build_bundle
+from bash_runner.helpers import get_helper_bundle
+from bash_runner.helpers import get_helper_loader
+
+
+class TestHelpers(unittest.TestCase):
+
+    def setUp(self):
+        self.original_environ = os.environ.copy()
+        os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY] = \
+            'http://localhost:53229'
+        os.environ[MANAGER_IP_KEY] = 'localhost'
+        self.helpers_dir = tempfile.mkdtemp()
+        os.environ[HELPERS_DIR_ENV] = self.helpers_dir
+        os.environ[PRELOAD_ENV] = 'true'
+        self.ctx = MockCloudifyContext(node_id='node',
+                                       blueprint_id='blueprint',
+                                       deployment_id='deployment',
+                                       execution_id='execution',
+                                       properties={'port': 8080})
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.original_environ)
+        shutil.rmtree(self.helpers_dir)
+
+    def run_script(self, script):
+        env = setup_environment(self.ctx)
+        return subprocess.check_output(['/bin/bash', '-c', script], env=env)
+
+    def test_bundle_written_once(self):
+        path = get_helper_bundle()
+        _, version = build_bundle()
+        self.assertEqual(self.helpers_dir, os.path.dirname(path))
+        self.assertEqual('cfy-helpers-{0}.sh'.format(version),
+                         os.path.basename(path))
+        loader = get_helper_loader()
+        self.assertEqual('cfy-helpers-{0}-loader.sh'.format(version),
+                         os.path.basename(loader))
+        mtime = os.stat(path).st_mtime
+        # another process finds it written
+        helpers._bundles.clear()
+        self.assertEqual(path, get_helper_bundle())
+        self.assertEqual(mtime, os.stat(path).st_mtime)
+        self.assertEqual(sorted([os.path.basename(path),
+                                 os.path.basename(loader)]),
+                         sorted(os.listdir(self.helpers_dir)))
+
+    def test_planted_files_replaced(self):
+        _, version = build_bundle()
+        loader = os.path.join(self.helpers_dir,
+                              'cfy-helpers-{0}-loader.sh'.format(version))
+        with open(loader, 'w') as f:
+            f.write('echo planted\n')
+        os.chmod(loader, 0666)
+        self.assertEqual(loader, get_helper_loader())
+        self.assertEqual('[INFO] [bash] ok\n', self.run_script('cfy_info ok'))
+        self.assertEqual(0644, os.stat(loader).st_mode & 0777)
+
+    def test_shared_directory(self):
+        os.chmod(self.helpers_dir, 0777)
+        self.assertRaises(OSError, get_helper_bundle)
+        # scripts source the libraries themselves
+        env = setup_environment(self.ctx)
+        self.assertNotIn('BASH_ENV', env)
+        self.assertNotIn('CLOUDIFY_HELPERS', env)
+
+    def test_preloaded(self):
+        output = self.run_script('cfy_info "port $port"; '
+                                 'type -t cfy_download_resource')
+        self.assertEqual('[INFO] [bash] port 8080\nfunction\n', output)
+
+    def test_not_preloaded_by_default(self):
+        del os.environ[PRELOAD_ENV]
+        user_env = os.path.join(self.helpers_dir, 'user_env.sh')
+        os.environ['BASH_ENV'] = user_env
+        env = setup_environment(self.ctx)
+        self.assertEqual(user_env, env['BASH_ENV'])
+        self.assertNotIn(CHAINED_BASH_ENV, env)
+        del os.environ['BASH_ENV']
+        output = self.run_script('type -t cfy_info; '
+                                 '. $CLOUDIFY_HELPERS; type -t cfy_info')
+        self.assertEqual('function\n', output)
+
+    def test_loaded_on_first_call(self):
+        output = self.run_script('echo "[$__cfy_ctx_loaded]"; '
+                                 'cfy_info first; cfy_info second; '
+                                 'echo "[$__cfy_ctx_loaded]"')
+        self.assertEqual('[]\n[INFO] [bash] first\n'
+                         '[INFO] [bash] second\n[1]\n', output)
+
+    def test_partly_sourced(self):
+        # a library sourced before the bundle is loaded by a stub
+        output = self.run_script('. $CLOUDIFY_CTX; cfy_error partly; '
+                                 'type -t cfy_return')
+        self.assertEqual('[ERROR] [bash] partly\nfunction\n', output)
+
+    def test_explicit_sourcing(self):
+        # scripts written before the bundle source the libraries again
+        output = self.run_script('. $CLOUDIFY_LOGGING; . $CLOUDIFY_CTX; '
+                                 '. $CLOUDIFY_FILE_SERVER; '
+                                 'cfy_warn sourced; '
+                                 'echo $__cfy_helpers_version')
+        _, version = build_bundle()
+        self.assertEqual('[WARN] [bash] sourced\n{0}\n'.format(version),
+                         output)
+
+    def test_chained_bash_env(self):
+        user_env = os.path.join(self.helpers_dir, 'user_env.sh')
+        with open(user_env, 'w') as f:
+            f.write('USER_ENV_LOADED=yes\n')
+        os.environ['BASH_ENV'] = user_env
+        env = setup_environment(self.ctx)
+        self.assertEqual(user_env, env[CHAINED_BASH_ENV])
+        self.assertEqual(get_helper_loader(), env['BASH_ENV'])
+        output = self.run_script('echo $USER_ENV_LOADED; cfy_debug chained')
+        self.assertEqual('yes\n[DEBUG] [bash] chained\n', output)
@@ -0,0 +1,115 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from distutils.spawn import find_executable
+
+from cloudify.mocks import MockCloudifyContext
+from cloudify.constants import MANAGER_IP_KEY, \
+    MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+
+from bash_runner.bash_pool import get_bash_pool
+from bash_runner.engine import execute_many
+from bash_runner.interpreters import get_warm_pool
+from bash_runner.interpreters import interpreter_command
+from bash_runner.python_pool import get_python_pool
+
+PYTHON_SCRIPT = '''
+import json
+import os
+import sys
+sys.stdout.write('[INFO] port {0}\\n'.format(os.environ['port']))
+fd = int(os.environ['CLOUDIFY_CTX_FD'])
+os.write(fd, json.dumps({'type': 'return', 'value': os.getpid()}) + '\\n')
+'''
+
+
+class TestInterpreters(unittest.TestCase):
+
+    def setUp(self):
+        self.original_environ = os.environ.copy()
+        os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY] = \
+            'http://localhost:53229'
+        os.environ[MANAGER_IP_KEY] = 'localhost'
+        self.temp_dir = tempfile.mkdtemp()
+        self.ctx = MockCloudifyContext(node_id='node',
+                                       blueprint_id='blueprint',
+                                       deployment_id='deployment',
+                                       execution_id='execution',
+                                       properties={'port': 8080})
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.original_environ)
+        shutil.rmtree(self.temp_dir)
+
+    def script(self, name, content):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_interpreter_command(self):
+        perl = find_executable('perl') or 'perl'
+        for name, content, expected in (
+                ('a.sh', 'echo\n', ['/bin/bash']),
+                ('a', 'echo\n', ['/bin/bash']),
+                ('a.sh', '#!/bin/sh\necho\n', ['/bin/bash']),
+                ('a.sh', '#!/bin/bash -e\necho\n', ['/bin/bash']),
+                ('a', '#!/usr/bin/env bash\necho\n', ['/bin/bash']),
+                ('a.pl', 'print 1\n', [perl]),
+                ('a.txt', '#!/usr/bin/env perl\n', [perl]),
+                ('a.py', '#! /usr/bin/python -u -O\n',
+                 ['/usr/bin/python', '-u -O'])):
+            path = self.script(name, content)
+            self.assertEqual(expected + [path], interpreter_command(path))
+        path = self.script('a.sh', '#!/bin/sh\n')
+        self.assertEqual([sys.executable, '-u', path],
+                         interpreter_command(path, sys.executable + ' -u'))
+        self.assertEqual(['/bin/bash', '-x', path],
+                         interpreter_command(path, 'bash -x'))
+
+    def test_bash_shebang_argument_ignored(self):
+        # run as they were before shebangs were read: neither -e nor warm
+        # runs change what the script does
+        path = self.script('a.sh', '#!/bin/bash -e\nfalse\necho after\n')
+        command = interpreter_command(path)
+        self.assertIs(get_bash_pool(), get_warm_pool(command))
+        for warm in (False, True):
+            execution, = execute_many([command], self.ctx, warm=warm)
+            self.assertEqual('after\n', str(execution.result()))
+
+    def test_warm_pool(self):
+        self.assertIs(get_bash_pool(), get_warm_pool(['/bin/bash', 'a']))
+        self.assertIs(get_python_pool(),
+                      get_warm_pool([sys.executable, 'a.py']))
+        self.assertEqual(None, get_warm_pool(['/bin/bash', '-e', 'a']))
+        self.assertEqual(None, get_warm_pool(['/bin/sh', 'a']))
+
+    def test_python_script(self):
+        path = self.script('script.py', PYTHON_SCRIPT)
+        command = interpreter_command(path, sys.executable)
+        pids = set()
+        for warm in (False, True, True):
+            execution, = execute_many([command], self.ctx, warm=warm)
+            self.assertEqual('[INFO] port 8080\n',
+                             str(execution.result()))
+            pids.add(execution.return_value)
+        # a fork of the warm worker per run
+        self.assertEqual(3, len(pids))
@@ -0,0 +1,161 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudify.mocks import MockCloudifyContext
+from cloudify.constants import MANAGER_IP_KEY, \
+    MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+
+from bash_runner.engine import ResourceLimitException
+from bash_runner.limits import ADDRESS_SPACE
+from bash_runner.limits import CGROUP_ENV
+from bash_runner.limits import CGROUP_NONE
+from bash_runner.limits import CPU_SECONDS
+from bash_runner.limits import ResourceLimits
+from bash_runner.limits import Sandbox
+from bash_runner.tasks import execute
+
+
+class TestResourceLimits(unittest.TestCase):
+
+    def setUp(self):
+        self.original_environ = os.environ.copy()
+        os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY] = \
+            'http://localhost:53229'
+        os.environ[MANAGER_IP_KEY] = 'localhost'
+        os.environ[CGROUP_ENV] = CGROUP_NONE
+        self.ctx = MockCloudifyContext(node_id='node',
+                                       blueprint_id='blueprint',
+                                       deployment_id='deployment',
+                                       execution_id='execution',
+                                       properties={})
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.original_environ)
+
+    def test_from_dict(self):
+        limits = ResourceLimits.from_dict({u'open_files': '64',
+                                           u'ionice': 'best-effort:7'})
+        self.assertEqual(64, limits.open_files)
+        self.assertEqual(2 << 13 | 7, limits.ionice)
+        self.assertTrue(limits)
+        self.assertFalse(ResourceLimits.from_dict({}))
+        self.assertRaises(ValueError, ResourceLimits.from_dict,
+                          {'memory': 1})
+        self.assertRaises(ValueError, ResourceLimits, processes=-1)
+        self.assertRaises(ValueError, ResourceLimits, ionice='fast')
+        self.assertRaises(ValueError, ResourceLimits, ionice='idle:8')
+
+    def test_applied_before_exec(self):
+        output = execute(['/bin/bash', '-c',
+                          'ulimit -n; ulimit -v; nice; ionice -p $$'],
+                         self.ctx, False,
+                         limits={'open_files': 64,
+                                 'address_space': 512 * 1024 * 1024,
+                                 'nice': 5,
+                                 'ionice': 'idle'})
+        self.assertEqual(['64', str(512 * 1024), '5', 'idle'],
+                         str(output).split('\n')[:4])
+
+    def test_cpu_seconds(self):
+        try:
+            execute(['/bin/bash', '-c', 'while :; do :; done'],
+                    self.ctx, False, limits={'cpu_seconds': 1})
+            self.fail('Expected exception')
+        except ResourceLimitException as e:
+            self.assertEqual(CPU_SECONDS, e.limit)
+            self.assertEqual(1, e.value)
+            self.assertTrue(str(e).startswith(
+                'Exceeded the cpu_seconds limit (1)'))
+
+    def test_other_failures(self):
+        try:
+            execute('exit 3', self.ctx, False, limits={'cpu_seconds': 10})
+            self.fail('Expected exception')
+        except ResourceLimitException:
+            self.fail('Not a limit')
+        except Exception as e:
+            self.assertEqual(3, e.exit_code)
+
+
+class TestCgroup(unittest.TestCase):
+
+    def setUp(self):
+        self.original_environ = os.environ.copy()
+        # a stand in for a delegated cgroup v2 directory
+        self.parent = tempfile.mkdtemp()
+        with open(os.path.join(self.parent, 'cgroup.subtree_control'),
+                  'w') as f:
+            f.write('cpu memory pids\n')
+        os.environ[CGROUP_ENV] = self.parent
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.original_environ)
+        shutil.rmtree(self.parent)
+
+    def _read(self, *parts):
+        with open(os.path.join(*parts)) as f:
+            return f.read()
+
+    def test_cgroup_limits(self):
+        sandbox = Sandbox(ResourceLimits(address_space=1024 * 1024,
+                                         processes=10, open_files=32))
+        path = sandbox.cgroup.path
+        self.assertEqual(self.parent, os.path.dirname(path))
+        self.assertEqual('1048576', self._read(path, 'memory.max'))
+        self.assertEqual('10', self._read(path, 'pids.max'))
+        # the cgroup replaces the per process memory and process rlimits
+        self.assertEqual(1, len(sandbox._rlimits))
+        self.assertEqual(None, sandbox.fallback)
+
+        self.assertEqual(None, sandbox.breach(1))
+        with open(os.path.join(path, 'memory.events'), 'w') as f:
+            f.write('low 0\nhigh 0\nmax 3\noom 1\noom_kill 1\n')
+        self.assertEqual(ADDRESS_SPACE, sandbox.breach(137))
+        sandbox.close()
+
+    def test_without_controllers(self):
+        with open(os.path.join(self.parent, 'cgroup.subtree_control'),
+                  'w') as f:
+            f.write('cpu\n')
+        sandbox = Sandbox(ResourceLimits(processes=10))
+        self.assertEqual(None, sandbox.cgroup)
+        self.assertEqual(1, len(sandbox._rlimits))
+        self.assertIn('has no pids controllers', sandbox.fallback)
+
+    def test_not_delegated(self):
+        # e.g. EBUSY writing the subtree_control of a populated cgroup
+        subtree_control = os.path.join(self.parent, 'cgroup.subtree_control')
+        os.remove(subtree_control)
+        os.mkdir(subtree_control)
+        sandbox = Sandbox(ResourceLimits(address_space=1024 * 1024))
+        self.assertEqual(None, sandbox.cgroup)
+        self.assertEqual(1, len(sandbox._rlimits))
+        self.assertIn('Cannot enable the memory controllers',
+                      sandbox.fallback)
+
+    def test_not_configured(self):
+        del os.environ[CGROUP_ENV]
+        sandbox = Sandbox(ResourceLimits(processes=10, nice=1))
+        self.assertEqual(None, sandbox.cgroup)
+        self.assertEqual('{0} is not set'.format(CGROUP_ENV),
+                         sandbox.fallback)
+        self.assertEqual(None, Sandbox(ResourceLimits(nice=1)).fallback)
@@ -0,0 +1,156 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import logging
+import threading
+import time
+import unittest
+
+from bash_runner.log_sender import AsyncLogSender
+from bash_runner.log_sender import LineBatch
+from bash_runner.log_sender import get_log_sender
+
+
+class RecordingLogger(object):
+
+    def __init__(self, gate=None):
+        self.records = []
+        self.gate = gate
+
+    def log(self, level, message):
+        if self.gate is not None:
+            self.gate.wait()
+        self.records.append((level, message))
+
+    def warning(self, message):
+        self.records.append((logging.WARNING, message))
+
+
+class TestAsyncLogSender(unittest.TestCase):
+
+    def test_batches_and_coalesces(self):
+        logger = RecordingLogger(gate=threading.Event())
+        sender = AsyncLogSender(logger)
+        sender.info('first')
+        sender.info('second')
+        sender.info('second')
+        sender.error('boom')
+        sender.info('third')
+        logger.gate.set()
+        sender.close()
+
+        self.assertEqual([(logging.INFO, 'first'),
+                          (logging.INFO, 'second (repeated 2 times)'),
+                          (logging.ERROR, 'boom'),
+                          (logging.INFO, 'third')],
+                         logger.records)
+        self.assertEqual(5, sender.emitted)
+        self.assertEqual(1, sender.coalesced)
+        self.assertEqual(0, sender.dropped)
+
+    def test_per_record_logger(self):
+        default = RecordingLogger(gate=threading.Event())
+        other = RecordingLogger()
+        sender = AsyncLogSender(default)
+        sender.info('a')
+        sender.info('a', other)
+        sender.info('b', other)
+        sender.info('c')
+        default.gate.set()
+        sender.close()
+
+        self.assertEqual([(logging.INFO, 'a'), (logging.INFO, 'c')],
+                         default.records)
+        self.assertEqual([(logging.INFO, 'a'), (logging.INFO, 'b')],
+                         other.records)
+
+    def test_drops_when_queue_is_full(self):
+        logger = RecordingLogger(gate=threading.Event())
+        sender = AsyncLogSender(logger, queue_size=2, batch_size=1)
+        for i in range(10):
+            sender.info(str(i))
+        logger.gate.set()
+        sender.close()
+
+        self.assertTrue(sender.dropped > 0)
+        self.assertEqual(10, sender.emitted + sender.dropped)
+        self.assertIn((logging.WARNING, '{0} script log lines were '
+                       'dropped'.format(sender.dropped)),
+                      logger.records)
+
+    def test_close_with_full_queue(self):
+        logger = RecordingLogger(gate=threading.Event())
+        sender = AsyncLogSender(logger, queue_size=1, batch_size=1)
+        sender.info('0')
+        sender.flush()
+        # the sender thread is stuck logging '0', '1' fills the queue
+        time.sleep(0.1)
+        for i in range(1, 5):
+            sender.info(str(i))
+        started = time.time()
+        sender.close(timeout=0.2)
+        self.assertTrue(time.time() - started < 1)
+        self.assertEqual(3, sender.dropped)
+        logger.gate.set()
+
+    def test_wait(self):
+        logger = RecordingLogger(gate=threading.Event())
+        sender = AsyncLogSender(logger)
+        sender.info('a')
+        self.assertFalse(sender.wait(timeout=0.1))
+        logger.gate.set()
+        self.assertTrue(sender.wait())
+        self.assertEqual([(logging.INFO, 'a')], logger.records)
+        sender.close()
+
+    def test_process_wide_sender(self):
+        sender = get_log_sender()
+        self.assertIs(sender, get_log_sender())
+        logger = RecordingLogger()
+        sender.info('a', logger)
+        self.assertTrue(sender.wait(logger))
+        self.assertEqual([(logging.INFO, 'a')], logger.records)
+
+    def test_rate_limit(self):
+        logger = RecordingLogger()
+        sender = AsyncLogSender(logger, rate_limit=0.001, burst=3)
+        for i in range(10):
+            sender.info(str(i))
+        sender.close()
+        self.assertEqual(4, sender.emitted)
+        self.assertEqual(6, sender.dropped)
+
+
+class TestLineBatch(unittest.TestCase):
+
+    def test_interval_and_size(self):
+        logger = RecordingLogger()
+        # a logger call per record
+        sender = AsyncLogSender(logger, batch_size=1)
+        batch = LineBatch(sender, logging.INFO, interval=10, size=12)
+        self.assertEqual(None, batch.due(0))
+        batch.add('one')
+        batch.add('two')
+        remaining = batch.due(time.time())
+        self.assertTrue(0 < remaining <= 10)
+        batch.add('three')
+        # 'one\ntwo\nthree\n' reached the size
+        self.assertEqual(None, batch.due(time.time()))
+        batch.add('four')
+        self.assertEqual(None, batch.due(time.time() + 10))
+        sender.close()
+        self.assertEqual([(logging.INFO, 'one\ntwo\nthree'),
+                          (logging.INFO, 'four')],
+                         logger.records)
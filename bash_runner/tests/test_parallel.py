@@ -0,0 +1,66 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import threading
+import time
+import unittest
+
+from bash_runner.parallel import parse_jobs
+from bash_runner.parallel import run_jobs
+
+
+class TestParallel(unittest.TestCase):
+
+    def test_dependencies_run_in_order(self):
+        jobs = parse_jobs([{'path': 'c', 'depends_on': ['a', 'b']},
+                           'a',
+                           {'path': 'b', 'depends_on': ['a']}])
+        order = []
+        lock = threading.Lock()
+
+        def target(job):
+            with lock:
+                order.append(job.name)
+            return job.name.upper()
+
+        results, errors, skipped = run_jobs(jobs, target, concurrency=3)
+        self.assertEqual(['a', 'b', 'c'], order)
+        self.assertEqual({'a': 'A', 'b': 'B', 'c': 'C'}, results)
+        self.assertEqual([], errors)
+        self.assertEqual([], skipped)
+
+    def test_concurrency(self):
+        jobs = parse_jobs([str(i) for i in range(8)])
+        start = time.time()
+        run_jobs(jobs, lambda job: time.sleep(0.2), concurrency=8)
+        self.assertTrue(time.time() - start < 1)
+
+    def test_fail_fast(self):
+        jobs = parse_jobs(['a', {'path': 'b', 'depends_on': ['a']}, 'c'])
+
+        def target(job):
+            if job.name == 'a':
+                raise RuntimeError('failed')
+
+        results, errors, skipped = run_jobs(jobs, target, concurrency=1)
+        self.assertEqual(['a'], [name for name, _ in errors])
+        self.assertEqual(['b', 'c'], skipped)
+
+    def test_cycle(self):
+        self.assertRaises(RuntimeError, parse_jobs,
+                          [{'path': 'a', 'depends_on': ['b']},
+                           {'path': 'b', 'depends_on': ['a']}])
+        self.assertRaises(RuntimeError, parse_jobs,
+                          [{'path': 'a', 'depends_on': ['missing']}])
@@ -0,0 +1,60 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import subprocess
+import unittest
+
+from bash_runner.pump import LineSplitter
+from bash_runner.pump import OutputPump
+
+
+class TestLineSplitter(unittest.TestCase):
+
+    def test_lines_across_chunks(self):
+        splitter = LineSplitter()
+        self.assertEqual(['a'], splitter.feed('a\nb'))
+        self.assertEqual([], splitter.feed('c'))
+        self.assertEqual(['bcd', ''], splitter.feed('d\n\ne'))
+        self.assertEqual('e', splitter.flush())
+        self.assertIsNone(splitter.flush())
+
+
+class TestOutputPump(unittest.TestCase):
+
+    def test_pump_both_streams(self):
+        process = subprocess.Popen(
+            ['/bin/bash', '-c',
+             'seq 1 20000; echo err >&2; printf partial'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        chunks = []
+        lines = []
+        errors = []
+        pump = OutputPump()
+        pump.register(process.stdout.fileno(),
+                      on_chunk=chunks.append,
+                      on_line=lines.append)
+        pump.register(process.stderr.fileno(), on_line=errors.append,
+                      on_eof=lambda: errors.append('EOF'))
+        pump.run()
+        pump.close()
+        process.wait()
+
+        self.assertFalse(pump.active)
+        self.assertEqual(20001, len(lines))
+        self.assertEqual('20000', lines[-2])
+        self.assertEqual('partial', lines[-1])
+        self.assertEqual('\n'.join(lines), ''.join(chunks))
+        self.assertEqual(['err', 'EOF'], errors)
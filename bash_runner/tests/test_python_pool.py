@@ -0,0 +1,92 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bash_runner.python_pool import PythonWorkerPool
+
+
+class TestPythonWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.pool = PythonWorkerPool(size=1, max_uses=3, helpers=['json'])
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.temp_dir)
+
+    def run_script(self, content, env):
+        job_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        script = os.path.join(job_dir, 'script.py')
+        with open(script, 'w') as f:
+            f.write(content)
+        process = self.pool.start(script, env, job_dir)
+        output = {}
+        for name in ('stdout', 'stderr', 'ctx'):
+            stream = getattr(process, name)
+            chunks = []
+            while True:
+                try:
+                    data = os.read(stream.fileno(), 4096)
+                except OSError:
+                    continue
+                if not data:
+                    break
+                chunks.append(data)
+            stream.close()
+            output[name] = ''.join(chunks)
+        return output, process.wait()
+
+    def test_environment_and_side_channel(self):
+        output, code = self.run_script(
+            'import os, sys\n'
+            'print(os.environ.get("A"), os.environ.get("B"), sys.argv[0])\n'
+            'os.write(3, "{\\"type\\": \\"return\\", \\"value\\": 1}\\n")\n'
+            'os.environ["B"] = "leak"\n',
+            {'A': 'a'})
+        self.assertEqual(0, code)
+        self.assertIn("('a', None, ", output['stdout'])
+        self.assertIn('script.py', output['stdout'])
+        self.assertEqual('{"type": "return", "value": 1}\n', output['ctx'])
+        output, code = self.run_script(
+            'import os\nprint(os.environ.get("A"), os.environ.get("B"))\n',
+            {})
+        self.assertEqual(('(None, None)\n', 0), (output['stdout'], code))
+
+    def test_preloaded_and_isolated(self):
+        output, _ = self.run_script(
+            'import sys\n'
+            'print("json" in sys.modules, "leaked" in globals())\n'
+            'sys.modules["leaked"] = sys\n', {})
+        self.assertEqual('(True, False)\n', output['stdout'])
+        output, _ = self.run_script(
+            'import sys\nprint("leaked" in sys.modules)\n', {})
+        self.assertEqual('False\n', output['stdout'])
+
+    def test_exit_codes(self):
+        self.assertEqual(7, self.run_script('import sys\nsys.exit(7)\n',
+                                            {})[1])
+        output, code = self.run_script('raise ValueError("boom")\n', {})
+        self.assertEqual(1, code)
+        self.assertIn('ValueError: boom', output['stderr'])
+        output, code = self.run_script('import sys\nsys.exit("bye")\n', {})
+        self.assertEqual(('bye\n', 1), (output['stderr'], code))
+        self.assertEqual(128 + 9, self.run_script(
+            'import os, signal\nos.kill(os.getpid(), signal.SIGKILL)\n',
+            {})[1])
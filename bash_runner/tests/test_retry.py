@@ -0,0 +1,155 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudify.mocks import MockCloudifyContext
+from cloudify.constants import MANAGER_IP_KEY, \
+    MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+
+from bash_runner import engine
+from bash_runner.engine import ProcessException
+from bash_runner.engine import ProcessTimeoutException
+from bash_runner.engine import execute_many
+from bash_runner.retry import RetryPolicy
+from bash_runner.tasks import execute
+
+# fails with the exit code in $1 until it ran $2 times
+FLAKY = ('echo x >> "$RUNS"; runs=$(wc -l < "$RUNS"); '
+         'if [ $runs -lt {1} ]; then echo "E: could not get lock $runs" >&2; '
+         'exit {0}; fi; echo "done after $runs"')
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_from_dict(self):
+        policy = RetryPolicy.from_dict({u'retries': 2,
+                                        u'exit_codes': ['100'],
+                                        u'patterns': ['lock']})
+        self.assertEqual(2, policy.retries)
+        self.assertEqual(frozenset([100]), policy.exit_codes)
+        self.assertEqual(3, RetryPolicy.from_dict(3).retries)
+        self.assertFalse(RetryPolicy.from_dict({}))
+        self.assertRaises(ValueError, RetryPolicy.from_dict, {'tries': 1})
+        self.assertRaises(ValueError, RetryPolicy, retries=-1)
+        self.assertRaises(ValueError, RetryPolicy, jitter=2)
+
+    def test_retryable(self):
+        self.assertTrue(RetryPolicy(1).retryable(1, False))
+        policy = RetryPolicy(1, exit_codes=[100], patterns=['lock'])
+        self.assertTrue(policy.retryable(100, False))
+        self.assertTrue(policy.retryable(1, True))
+        self.assertFalse(policy.retryable(1, False))
+        self.assertTrue(policy.matches('E: could not get lock'))
+
+    def test_delay(self):
+        policy = RetryPolicy(5, backoff=1, max_backoff=3, jitter=0.5)
+        for retry, delay in ((1, 1), (2, 2), (3, 3), (4, 3)):
+            for _ in range(20):
+                self.assertTrue(delay / 2.0 <= policy.delay(retry) <= delay)
+        self.assertEqual(2, RetryPolicy(5, jitter=0).delay(2))
+
+
+class TestRetry(unittest.TestCase):
+
+    def setUp(self):
+        self.original_environ = os.environ.copy()
+        os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY] = \
+            'http://localhost:53229'
+        os.environ[MANAGER_IP_KEY] = 'localhost'
+        self.work_dir = tempfile.mkdtemp()
+        os.environ['RUNS'] = os.path.join(self.work_dir, 'runs')
+        self.ctx = MockCloudifyContext(node_id='node',
+                                       blueprint_id='blueprint',
+                                       deployment_id='deployment',
+                                       execution_id='execution',
+                                       properties={})
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.original_environ)
+        shutil.rmtree(self.work_dir)
+
+    def test_succeeds_after_retries(self):
+        environments = []
+        setup_environment = engine.setup_environment
+
+        def counting_setup_environment(*args, **kwargs):
+            environments.append(None)
+            return setup_environment(*args, **kwargs)
+        engine.setup_environment = counting_setup_environment
+        try:
+            output = execute(FLAKY.format(100, 3), self.ctx, False,
+                             retry={'retries': 2, 'exit_codes': [100],
+                                    'backoff': 0.01})
+        finally:
+            engine.setup_environment = setup_environment
+        self.assertEqual('done after 3\n', str(output))
+        # the environment is built once for all attempts
+        self.assertEqual(1, len(environments))
+
+    def test_properties_of_failed_attempts_dropped(self):
+        execution, = execute_many(
+            [['/bin/bash', '-c',
+              '. "$CLOUDIFY_CTX"; echo x >> "$RUNS"; '
+              'runs=$(wc -l < "$RUNS"); cfy_set_property attempt $runs; '
+              'if [ $runs -lt 2 ]; then '
+              'cfy_set_property half_done yes; exit 1; fi']],
+            self.ctx, retry={'retries': 1, 'backoff': 0.01})
+        execution.result()
+        self.assertEqual({'attempt': '2'}, execution.runtime_properties)
+        self.assertEqual({'attempt': '2'}, self.ctx.runtime_properties)
+
+    def test_patterns(self):
+        output = execute(FLAKY.format(1, 2), self.ctx, False,
+                         retry={'retries': 1, 'patterns': ['get lock'],
+                                'backoff': 0.01})
+        self.assertEqual('done after 2\n', str(output))
+        try:
+            execute(FLAKY.format(1, 5), self.ctx, False,
+                    retry={'retries': 1, 'patterns': ['network'],
+                           'backoff': 0.01})
+            self.fail('Expected exception')
+        except ProcessException as e:
+            self.assertEqual(1, e.exit_code)
+            self.assertEqual([], e.attempts)
+
+    def test_attempts_exhausted(self):
+        try:
+            execute(FLAKY.format(100, 5), self.ctx, False,
+                    retry={'retries': 2, 'backoff': 0.01})
+            self.fail('Expected exception')
+        except ProcessException as e:
+            self.assertEqual(100, e.exit_code)
+            self.assertEqual([1, 2, 3], [a.number for a in e.attempts])
+            self.assertEqual('E: could not get lock 2\n',
+                             e.attempts[1].stderr_tail)
+            self.assertTrue(all(a.wall_time >= 0 for a in e.attempts))
+            self.assertIn('Failed 3 attempts:\n'
+                          'attempt 1: return_code=100 after ', str(e))
+            self.assertIn('could not get lock 3', str(e).splitlines()[-1])
+
+    def test_timeouts_not_retried(self):
+        try:
+            execute('echo x >> "$RUNS"; sleep 5', self.ctx, False,
+                    timeout=0.2, kill_grace=1,
+                    retry={'retries': 2, 'backoff': 0.01})
+            self.fail('Expected exception')
+        except ProcessTimeoutException:
+            with open(os.environ['RUNS']) as f:
+                self.assertEqual(1, len(f.readlines()))
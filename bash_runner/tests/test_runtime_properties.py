@@ -0,0 +1,119 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import os
+import time
+import unittest
+
+from cloudify.mocks import MockCloudifyContext
+from cloudify.constants import MANAGER_IP_KEY, \
+    MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+
+from bash_runner.engine import execute_many
+from bash_runner.runtime_properties import RuntimePropertyBuffer
+from bash_runner.runtime_properties import get_property_buffer
+
+
+class UpdateCountingContext(MockCloudifyContext):
+
+    def __init__(self, **kwargs):
+        MockCloudifyContext.__init__(self, **kwargs)
+        self.stored = []
+
+    def update(self):
+        self.stored.append(dict(self.runtime_properties))
+
+
+class TestRuntimePropertyBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = UpdateCountingContext(node_id='node',
+                                         runtime_properties={'kept': 1})
+
+    def test_apply_deduplicates(self):
+        buffer = RuntimePropertyBuffer(self.ctx)
+        buffer.set('a', 1)
+        buffer.set('a', 2)
+        buffer.set('kept', 1)
+        self.assertEqual(1, buffer.apply())
+        self.assertEqual({'a': 2, 'kept': 1}, self.ctx.runtime_properties)
+        self.assertEqual(0, buffer.apply())
+        self.assertEqual([], self.ctx.stored)
+
+    def test_flush_if_due(self):
+        buffer = RuntimePropertyBuffer(self.ctx)
+        self.assertIsNone(buffer.flush_if_due(time.time(), 10))
+        buffer.set('a', 1)
+        now = time.time()
+        self.assertTrue(0 < buffer.flush_if_due(now, 10) <= 10)
+        self.assertIsNone(buffer.flush_if_due(now, None))
+        self.assertEqual([], self.ctx.stored)
+        self.assertIsNone(buffer.flush_if_due(now + 10, 10))
+        self.assertEqual([{'a': 1, 'kept': 1}], self.ctx.stored)
+        # unchanged values are not stored again
+        buffer.set('a', 1)
+        buffer.flush_if_due(now + 30, 10)
+        self.assertEqual(1, len(self.ctx.stored))
+
+    def test_shared_per_context(self):
+        self.assertIs(get_property_buffer(self.ctx),
+                      get_property_buffer(self.ctx))
+        self.assertIsNot(get_property_buffer(self.ctx),
+                         get_property_buffer(UpdateCountingContext()))
+
+
+class TestScriptProperties(unittest.TestCase):
+
+    def setUp(self):
+        self.original_environ = os.environ.copy()
+        os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY] = \
+            'http://localhost:53229'
+        os.environ[MANAGER_IP_KEY] = 'localhost'
+        self.ctx = UpdateCountingContext(node_id='node',
+                                         blueprint_id='blueprint',
+                                         deployment_id='deployment',
+                                         execution_id='execution',
+                                         properties={})
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.original_environ)
+
+    def test_batched(self):
+        executions = execute_many(
+            [['/bin/bash', '-c',
+              '. "$CLOUDIFY_CTX"; '
+              'for i in $(seq 100); do cfy_set_property "k$1" "$i"; done; '
+              'cfy_set_property_json "j$1" \'{"a": [1]}\'',
+              'bash', str(i)] for i in range(3)],
+            self.ctx)
+        for execution in executions:
+            execution.result()
+        self.assertEqual({'k0': '100', 'k1': '100', 'k2': '100',
+                          'j0': {'a': [1]}, 'j1': {'a': [1]},
+                          'j2': {'a': [1]}},
+                         self.ctx.runtime_properties)
+        # stored by the operation once it ends
+        self.assertEqual([], self.ctx.stored)
+
+    def test_periodic_flush(self):
+        execution, = execute_many(
+            [['/bin/bash', '-c',
+              '. "$CLOUDIFY_CTX"; cfy_set_property first 1; sleep 1; '
+              'cfy_set_property second 2']],
+            self.ctx, property_flush_interval=0.2)
+        execution.result()
+        self.assertEqual([{'first': '1'}], self.ctx.stored)
+        self.assertEqual({'first': '1', 'second': '2'},
+                         self.ctx.runtime_properties)
@@ -0,0 +1,103 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import signal
+import unittest
+
+from bash_runner.spawn import CTX_FD
+from bash_runner.spawn import SPAWN_FORK
+from bash_runner.spawn import SPAWN_POSIX
+from bash_runner.spawn import posix_spawn_available
+from bash_runner.spawn import signal_process_group
+from bash_runner.spawn import spawn
+
+
+class TestSpawn(unittest.TestCase):
+
+    def _run(self, method):
+        leaked_read, leaked_write = os.pipe()
+        try:
+            process = spawn(
+                ['/bin/bash', '-c',
+                 'echo "$GREETING" "$1"; '
+                 'read -r _ _ _ _ pgid _ < /proc/$$/stat; echo "$pgid"; '
+                 'ls /proc/$$/fd; exit 3',
+                 'bash', 'with spaces'],
+                {'GREETING': 'hello'},
+                method=method)
+            stdout = process.stdout.read()
+            process.stderr.read()
+            return_code = process.wait()
+        finally:
+            os.close(leaked_read)
+            os.close(leaked_write)
+        greeting, pgid, fds = stdout.split('\n', 2)
+        self.assertEqual('hello with spaces', greeting)
+        # the child leads its own process group
+        self.assertEqual(str(process.pid), pgid)
+        self.assertEqual(3, return_code)
+        # reaped with wait4(), the children bash waited for included
+        self.assertTrue(process.rusage.ru_maxrss > 0)
+        self.assertTrue(process.rusage.ru_utime +
+                        process.rusage.ru_stime > 0)
+        self.assertEqual(['0', '1', '2'], sorted(fds.split())[:3])
+        self.assertNotIn(str(leaked_write), fds.split())
+
+    def test_fork(self):
+        self._run(SPAWN_FORK)
+
+    def test_posix_spawn(self):
+        if not posix_spawn_available():
+            raise unittest.SkipTest('posix_spawn is not available')
+        self._run(SPAWN_POSIX)
+
+    def _run_side_channel(self, method):
+        leaked_read, leaked_write = os.pipe()
+        try:
+            process = spawn(
+                ['/bin/bash', '-c',
+                 'echo record >&{0}; ls /proc/$$/fd; exit 0'.format(CTX_FD)],
+                {}, method=method, side_channel=True)
+            stdout = process.stdout.read()
+            process.stderr.read()
+            self.assertEqual('record\n', process.ctx.read())
+            self.assertEqual(0, process.wait())
+            process.ctx.close()
+        finally:
+            os.close(leaked_read)
+            os.close(leaked_write)
+        fds = sorted(stdout.split(), key=int)
+        self.assertEqual(['0', '1', '2', str(CTX_FD)], fds[:4])
+        self.assertNotIn(str(leaked_write), fds)
+
+    def test_fork_side_channel(self):
+        self._run_side_channel(SPAWN_FORK)
+
+    def test_posix_spawn_side_channel(self):
+        if not posix_spawn_available():
+            raise unittest.SkipTest('posix_spawn is not available')
+        self._run_side_channel(SPAWN_POSIX)
+
+    def test_signal_process_group(self):
+        # the background sleep holds the pipes open, so EOF shows it was
+        # signalled as well.
+        process = spawn(['/bin/bash', '-c', 'sleep 60 & echo $!; wait'],
+                        dict(os.environ))
+        process.stdout.readline()
+        self.assertTrue(signal_process_group(process, signal.SIGKILL))
+        self.assertEqual('', process.stdout.read())
+        process.stderr.read()
+        self.assertEqual(-signal.SIGKILL, process.wait())
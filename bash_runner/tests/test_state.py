@@ -0,0 +1,86 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bash_runner import state
+from bash_runner.state import check_private_directory
+from bash_runner.state import ensure_private_directory
+from bash_runner.state import get_state_dir
+from bash_runner.state import is_private_file
+
+
+class TestPrivateDirectory(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_created_private(self):
+        path = os.path.join(self.temp_dir, 'a', 'b')
+        ensure_private_directory(path)
+        self.assertEqual(0700, os.stat(path).st_mode & 0777)
+        # existing ones are checked again
+        ensure_private_directory(path)
+
+    def test_shared_directory(self):
+        os.chmod(self.temp_dir, 0777)
+        self.assertRaises(OSError, check_private_directory, self.temp_dir)
+        # nor may anyone else replace what it holds
+        path = os.path.join(self.temp_dir, 'private')
+        os.mkdir(path, 0700)
+        self.assertRaises(OSError, check_private_directory, path)
+        os.chmod(self.temp_dir, 01777)
+        check_private_directory(path)
+
+    def test_symbolic_link(self):
+        target = os.path.join(self.temp_dir, 'target')
+        link = os.path.join(self.temp_dir, 'link')
+        os.mkdir(target, 0700)
+        os.symlink(target, link)
+        self.assertRaises(OSError, check_private_directory, link)
+        self.assertRaises(OSError, ensure_private_directory, link)
+
+    def test_private_file(self):
+        path = os.path.join(self.temp_dir, 'file')
+        with open(path, 'w') as f:
+            f.write('content')
+        os.chmod(path, 0644)
+        self.assertTrue(is_private_file(path))
+        os.chmod(path, 0666)
+        self.assertFalse(is_private_file(path))
+        self.assertFalse(is_private_file(self.temp_dir))
+
+    def test_state_dir_taken(self):
+        default = state.DEFAULT_STATE_DIR
+        state_dir = state._state_dir
+        taken = os.path.join(self.temp_dir, 'taken')
+        os.mkdir(taken)
+        os.chmod(taken, 0777)
+        state.DEFAULT_STATE_DIR = taken
+        state._state_dir = None
+        try:
+            path = get_state_dir()
+            self.assertNotEqual(taken, path)
+            check_private_directory(path)
+        finally:
+            state.DEFAULT_STATE_DIR = default
+            state._state_dir = state_dir
+        shutil.rmtree(path)
@@ -0,0 +1,83 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from bash_runner.zero_copy import copy_fd
+
+CONTENT = os.urandom(300 * 1024)
+
+
+class TestCopyFd(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.source = tempfile.mkstemp()
+        os.write(fd, CONTENT)
+        os.close(fd)
+        fd, self.target = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.source)
+        os.remove(self.target)
+
+    def read_target(self):
+        with open(self.target, 'rb') as f:
+            return f.read()
+
+    def test_file_to_file(self):
+        with open(self.source, 'rb') as s, open(self.target, 'wb') as t:
+            s.seek(10)
+            self.assertEqual(len(CONTENT) - 10,
+                             copy_fd(s.fileno(), t.fileno(), len(CONTENT)))
+        self.assertEqual(CONTENT[10:], self.read_target())
+
+    def test_socket_to_file(self):
+        # a non blocking socket, as httplib leaves them with a timeout
+        reader, writer = socket.socketpair()
+        reader.settimeout(5)
+
+        def send():
+            writer.sendall(CONTENT)
+            writer.close()
+        sender = threading.Thread(target=send)
+        sender.start()
+        try:
+            with open(self.target, 'wb') as t:
+                self.assertEqual(1000, copy_fd(reader.fileno(), t.fileno(),
+                                               1000, timeout=5))
+                self.assertEqual(len(CONTENT) - 1000,
+                                 copy_fd(reader.fileno(), t.fileno(),
+                                         len(CONTENT), timeout=5))
+        finally:
+            sender.join()
+            reader.close()
+        self.assertEqual(CONTENT, self.read_target())
+
+    def test_unsupported_target(self):
+        # splice() refuses files opened for appending
+        reader, writer = socket.socketpair()
+        writer.sendall(CONTENT[:1000])
+        writer.close()
+        try:
+            with open(self.target, 'ab') as t:
+                self.assertEqual(1000, copy_fd(reader.fileno(), t.fileno(),
+                                               len(CONTENT)))
+        finally:
+            reader.close()
+        self.assertEqual(CONTENT[:1000], self.read_target())
@@ -0,0 +1,206 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+"""
+Copying between file descriptors inside the kernel.
+
+Python 2 has neither os.sendfile nor os.splice, so they are called
+through ctypes. copy_fd() falls back to read()/write() where neither
+applies.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+
+_CHUNK_SIZE = 1024 * 1024
+_BUFFER_SIZE = 64 * 1024
+
+_SPLICE_F_MOVE = 1
+_SPLICE_F_MORE = 4
+
+
+def _load_libc():
+    name = ctypes.util.find_library('c')
+    if not name:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'sendfile') or not hasattr(libc, 'splice'):
+        return None
+    libc.sendfile.argtypes = [ctypes.c_int, ctypes.c_int,
+                              ctypes.c_void_p, ctypes.c_size_t]
+    libc.sendfile.restype = ctypes.c_ssize_t
+    libc.splice.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                            ctypes.c_void_p, ctypes.c_size_t,
+                            ctypes.c_uint]
+    libc.splice.restype = ctypes.c_ssize_t
+    return libc
+
+
+_libc = _load_libc()
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def copy_fd(in_fd, out_fd, count, timeout=None):
+    """
+    Copy up to count bytes from in_fd's position to out_fd. Returns the
+    number of bytes copied, less than count if in_fd reached EOF.
+
+    sendfile() is used when in_fd is a regular file, splice() through a
+    pipe when it is a socket or a pipe, read() and write() otherwise.
+    Non blocking descriptors (e.g. sockets with a timeout) are waited
+    for up to timeout seconds at a time (None for no limit).
+    """
+    if _libc is not None:
+        for method in (_sendfile, _splice):
+            try:
+                return method(in_fd, out_fd, count, timeout)
+            except _Unsupported:
+                continue
+    return _read_write(in_fd, out_fd, count, timeout)
+
+
+def _call(function, fd, for_write, timeout, *args):
+    """
+    Call a libc function returning a byte count, retrying on EINTR and,
+    once fd is ready, on EAGAIN.
+    """
+    while True:
+        result = function(*args)
+        if result >= 0:
+            return result
+        code = ctypes.get_errno()
+        if code == errno.EINTR:
+            continue
+        if code == errno.EAGAIN:
+            _wait(fd, for_write, timeout)
+            continue
+        raise OSError(code, os.strerror(code))
+
+
+def _wait(fd, for_write, timeout):
+    if for_write:
+        ready = select.select([], [fd], [], timeout)[1]
+    else:
+        ready = select.select([fd], [], [], timeout)[0]
+    if not ready:
+        raise OSError(errno.ETIMEDOUT, os.strerror(errno.ETIMEDOUT))
+
+
+def _sendfile(in_fd, out_fd, count, timeout):
+    copied = 0
+    while copied < count:
+        try:
+            sent = _call(_libc.sendfile, out_fd, True, timeout,
+                         out_fd, in_fd, None,
+                         min(count - copied, _CHUNK_SIZE))
+        except OSError as e:
+            if copied == 0 and e.errno in (errno.EINVAL, errno.ENOSYS):
+                raise _Unsupported()
+            raise
+        if sent == 0:
+            break
+        copied += sent
+    return copied
+
+
+def _splice(in_fd, out_fd, count, timeout):
+    read_end, write_end = os.pipe()
+    flags = _SPLICE_F_MOVE | _SPLICE_F_MORE
+    try:
+        copied = 0
+        while copied < count:
+            try:
+                moved = _call(_libc.splice, in_fd, False, timeout,
+                              in_fd, None, write_end, None,
+                              min(count - copied, _BUFFER_SIZE), flags)
+            except OSError as e:
+                if copied == 0 and e.errno in (errno.EINVAL, errno.ENOSYS):
+                    raise _Unsupported()
+                raise
+            if moved == 0:
+                break
+            pending = moved
+            while pending:
+                try:
+                    pending -= _call(_libc.splice, out_fd, True, timeout,
+                                     read_end, None, out_fd, None,
+                                     pending, flags)
+                except OSError as e:
+                    if e.errno != errno.EINVAL:
+                        raise
+                    # out_fd does not support splice: write what was
+                    # already taken from in_fd, copy the rest in user space
+                    _read_write(read_end, out_fd, pending, timeout)
+                    copied += moved
+                    return copied + _read_write(in_fd, out_fd,
+                                                count - copied, timeout)
+            copied += moved
+        return copied
+    finally:
+        os.close(read_end)
+        os.close(write_end)
+
+
+def copy_stream(read, out_fd, count, timeout=None):
+    """
+    Copy up to count bytes returned by read(size) to out_fd, for sources
+    whose descriptor does not hold the bytes themselves (e.g. a TLS
+    connection). Returns the number of bytes copied, as copy_fd.
+    """
+    copied = 0
+    while copied < count:
+        data = read(min(count - copied, _BUFFER_SIZE))
+        if not data:
+            break
+        copied += _write_all(out_fd, data, timeout)
+    return copied
+
+
+def _read_write(in_fd, out_fd, count, timeout):
+    copied = 0
+    while copied < count:
+        data = _retry(os.read, in_fd, False, timeout,
+                      in_fd, min(count - copied, _BUFFER_SIZE))
+        if not data:
+            break
+        copied += _write_all(out_fd, data, timeout)
+    return copied
+
+
+def _write_all(out_fd, data, timeout):
+    written = 0
+    while written < len(data):
+        written += _retry(os.write, out_fd, True, timeout, out_fd,
+                          data[written:])
+    return written
+
+
+def _retry(function, fd, for_write, timeout, *args):
+    while True:
+        try:
+            return function(*args)
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            if e.errno != errno.EAGAIN:
+                raise
+        _wait(fd, for_write, timeout)
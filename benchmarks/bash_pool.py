@@ -0,0 +1,92 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+"""
+Measure how many short scripts per second run on a cold spawned bash
+(which sources the helper libraries itself) and on a warm worker.
+
+    python benchmarks/bash_pool.py [--runs 1000]
+"""
+import optparse
+import os
+import shutil
+import tempfile
+import time
+
+from bash_runner.bash_pool import BashWorkerPool
+from bash_runner.helpers import helper_paths
+from bash_runner.spawn import spawn
+
+SCRIPT = '''
+. $CLOUDIFY_LOGGING
+. $CLOUDIFY_CTX
+. $CLOUDIFY_FILE_SERVER
+echo done
+'''
+
+
+def drain(process):
+    # the output fits the pipe buffers, so it can be read after the exit.
+    # Warm processes hand out non blocking FIFOs, which read() only drains
+    # completely once the job finished.
+    returncode = process.wait()
+    process.stdout.read()
+    process.stderr.read()
+    process.stdout.close()
+    process.stderr.close()
+    return returncode
+
+
+def measure(name, run_one, runs):
+    start = time.time()
+    for i in range(runs):
+        run_one(i)
+    elapsed = time.time() - start
+    print('{0:>6}: {1:8.1f} scripts/s'.format(name, runs / elapsed))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--runs', type='int', default=1000)
+    options, _ = parser.parse_args()
+
+    logging_sh, ctx_sh, file_server_sh = helper_paths()
+    env = os.environ.copy()
+    env['CLOUDIFY_LOGGING'] = logging_sh
+    env['CLOUDIFY_CTX'] = ctx_sh
+    env['CLOUDIFY_FILE_SERVER'] = file_server_sh
+
+    work_dir = tempfile.mkdtemp()
+    path = os.path.join(work_dir, 'script.sh')
+    with open(path, 'w') as f:
+        f.write(SCRIPT)
+    pool = BashWorkerPool(size=1)
+    try:
+        measure('cold',
+                lambda i: drain(spawn(['/bin/bash', path], env)),
+                options.runs)
+
+        def warm(i):
+            job_dir = os.path.join(work_dir, str(i))
+            os.mkdir(job_dir)
+            drain(pool.start(path, env, job_dir))
+            shutil.rmtree(job_dir)
+        measure('warm', warm, options.runs)
+    finally:
+        pool.close()
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
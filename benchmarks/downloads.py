@@ -0,0 +1,171 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+"""
+Measure how many resources per second a script downloads from the test
+file server with cfy_download_resource through wget, through the
+plugin's download service, and with cfy_download_resources in batches.
+Then measure fetching and unpacking a large tarball: downloaded to disk
+with wget or the service (in parallel ranges), and streamed into tar.
+
+    python benchmarks/downloads.py [--downloads 200] [--batch 20]
+                                   [--size-mb 100]
+"""
+import optparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from os.path import dirname
+
+from cloudify.constants import MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+from cloudify.constants import MANAGER_IP_KEY
+from cloudify.mocks import MockCloudifyContext
+
+from bash_runner.downloader import DownloadService
+from bash_runner.script_cache import ScriptCache
+from bash_runner.environment import setup_environment
+from bash_runner.spawn import spawn
+from bash_runner.tests.file_server import FileServer
+from bash_runner.tests.file_server import PORT
+import bash_runner.tests as test_path
+
+SINGLE = '''
+. "$CLOUDIFY_FILE_SERVER"
+cd "$1"
+for ((i = 0; i < $2; i++)); do
+    cfy_download_resource index.html -O index.html -q || exit 1
+done
+'''
+
+SERVICE_SINGLE = SINGLE.replace(' -q', '')
+
+BATCH = '''
+. "$CLOUDIFY_FILE_SERVER"
+cd "$1"
+for ((i = 0; i < $2; i += $3)); do
+    resources=()
+    for ((j = i; j < i + $3; j++)); do
+        resources+=(index.html)
+    done
+    cfy_download_resources -P "batch" "${resources[@]}" || exit 1
+done
+'''
+
+
+TO_DISK = '''
+. "$CLOUDIFY_FILE_SERVER"
+cd "$1"
+cfy_download_resource artifact.tar -O artifact.tar $2 && tar xf artifact.tar
+'''
+
+STREAMED = '''
+. "$CLOUDIFY_FILE_SERVER"
+cd "$1"
+cfy_download_resource --pipe artifact.tar | tar x
+'''
+
+
+def measure_large(name, script, env, work_dir, size, wget_args=''):
+    directory = tempfile.mkdtemp(dir=work_dir)
+    start = time.time()
+    process = spawn(['/bin/bash', '-c', script, 'bench.sh', directory,
+                     wget_args], env)
+    process.stdout.read()
+    error = process.stderr.read()
+    if process.wait() != 0:
+        raise RuntimeError(error)
+    elapsed = time.time() - start
+    shutil.rmtree(directory)
+    print('{0:>8}: {1:8.1f} MB/s'.format(name, size / elapsed))
+
+
+def make_artifact(served, size_mb):
+    content = os.path.join(served, 'content')
+    os.mkdir(content)
+    with open(os.path.join(content, 'data'), 'wb') as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+    subprocess.check_call(['tar', 'cf', 'artifact.tar', 'content'],
+                          cwd=served)
+    shutil.rmtree(content)
+
+
+def measure(name, script, env, work_dir, downloads, batch):
+    start = time.time()
+    process = spawn(['/bin/bash', '-c', script, 'bench.sh', work_dir,
+                     str(downloads), str(batch)], env)
+    process.stdout.read()
+    error = process.stderr.read()
+    if process.wait() != 0:
+        raise RuntimeError(error)
+    elapsed = time.time() - start
+    print('{0:>8}: {1:8.1f} downloads/s'.format(name, downloads / elapsed))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--downloads', type='int', default=200)
+    parser.add_option('--batch', type='int', default=20)
+    parser.add_option('--size-mb', type='int', default=100)
+    options, _ = parser.parse_args()
+
+    base_url = 'http://localhost:{0}'.format(PORT)
+    os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY] = base_url
+    os.environ.setdefault(MANAGER_IP_KEY, 'localhost')
+    work_dir = tempfile.mkdtemp()
+    served = os.path.join(work_dir, 'served')
+    os.mkdir(served)
+    shutil.copy(os.path.join(dirname(test_path.__file__), 'resources',
+                             'index.html'), served)
+    make_artifact(served, options.size_mb)
+    server = FileServer(served)
+    server.start()
+    service = DownloadService(ScriptCache(os.path.join(work_dir, 'cache')))
+    try:
+        ctx = MockCloudifyContext(node_id='node', blueprint_id='',
+                                  deployment_id='deployment',
+                                  execution_id='execution',
+                                  properties={})
+        env = setup_environment(ctx)
+        measure('wget', SINGLE, env, work_dir, options.downloads,
+                options.batch)
+        env.update(service.register(''))
+        measure('service', SERVICE_SINGLE, env, work_dir,
+                options.downloads, options.batch)
+        measure('batch', BATCH, env, work_dir, options.downloads,
+                options.batch)
+
+        print('{0} MB tarball, fetched and unpacked:'.format(
+            options.size_mb))
+        wget_env = dict(env)
+        del wget_env['CLOUDIFY_DOWNLOAD_SERVICE']
+        measure_large('wget', TO_DISK, wget_env, work_dir, options.size_mb,
+                      '-q')
+        # a cache of its own each, so both download
+        for name, parallel_parts in (('service', 1), ('parts', 4)):
+            service.cache = ScriptCache(
+                tempfile.mkdtemp(dir=work_dir),
+                parallel_min_size=0, parallel_parts=parallel_parts)
+            measure_large(name, TO_DISK, env, work_dir, options.size_mb)
+        measure_large('pipe', STREAMED, env, work_dir, options.size_mb)
+    finally:
+        service.close()
+        server.stop()
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
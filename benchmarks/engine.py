@@ -0,0 +1,90 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+"""
+Run many sleep/echo scripts concurrently on the single threaded execution
+engine and compare the wall clock time with the longest script.
+
+    python benchmarks/engine.py [--scripts 500] [--sleep 1]
+                                [--concurrency 500]
+
+Every script keeps two pipes open, so the open file limit must allow
+about four descriptors per concurrent script.
+"""
+import logging
+import optparse
+import os
+import threading
+import time
+
+from cloudify.constants import MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+from cloudify.constants import MANAGER_IP_KEY
+from cloudify.mocks import MockCloudifyContext
+
+from bash_runner.engine import execute_many
+
+
+class ThreadCountingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.peak_threads = threading.active_count()
+
+    def emit(self, record):
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--scripts', type='int', default=500)
+    parser.add_option('--sleep', type='float', default=1)
+    parser.add_option('--concurrency', type='int', default=500)
+    options, _ = parser.parse_args()
+
+    os.environ.setdefault(MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY,
+                          'http://localhost:53229')
+    os.environ.setdefault(MANAGER_IP_KEY, 'localhost')
+    ctx = MockCloudifyContext(node_id='node',
+                              blueprint_id='blueprint',
+                              deployment_id='deployment',
+                              execution_id='execution',
+                              properties={})
+    handler = ThreadCountingHandler()
+    logger = logging.getLogger('benchmark')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    commands = [['/bin/bash', '-c',
+                 'sleep {0}; echo "[INFO] done {1}"'.format(options.sleep, i)]
+                for i in range(options.scripts)]
+    start = time.time()
+    executions = execute_many(commands, ctx,
+                              concurrency=options.concurrency,
+                              logger=logger)
+    elapsed = time.time() - start
+    failed = 0
+    for execution in executions:
+        try:
+            execution.result()
+        except Exception:
+            failed += 1
+    print('{0} scripts of {1}s: {2:.2f}s wall clock, {3} failed, '
+          '{4} threads at most'.format(options.scripts, options.sleep,
+                                       elapsed, failed,
+                                       handler.peak_threads))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+"""
+Measure the startup latency of short scripts using the helper libraries:
+sourcing each library itself, or finding them preloaded through the
+helper loader in BASH_ENV. A script without helpers is the baseline,
+with and without the loader.
+
+    python benchmarks/helpers.py [--runs 1000]
+"""
+import optparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from bash_runner.helpers import get_helper_loader
+from bash_runner.helpers import helper_paths
+
+SOURCED = '''
+. $CLOUDIFY_LOGGING
+. $CLOUDIFY_CTX
+. $CLOUDIFY_FILE_SERVER
+cfy_info started
+'''
+
+PRELOADED = '''
+cfy_info started
+'''
+
+
+def measure(name, command, env, runs):
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        for _ in range(runs):
+            subprocess.check_call(command, env=env, stdout=devnull)
+        elapsed = time.time() - start
+    print('{0:>9}: {1:6.3f} ms/script'.format(name, 1000 * elapsed / runs))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--runs', type='int', default=1000)
+    options, _ = parser.parse_args()
+
+    logging_sh, ctx_sh, file_server_sh = helper_paths()
+    env = os.environ.copy()
+    env.pop('BASH_ENV', None)
+    env['CLOUDIFY_LOGGING'] = logging_sh
+    env['CLOUDIFY_CTX'] = ctx_sh
+    env['CLOUDIFY_FILE_SERVER'] = file_server_sh
+    loader_env = dict(env, BASH_ENV=get_helper_loader())
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        paths = {}
+        for name, script in (('empty', 'exit 0\n'),
+                             ('sourced', SOURCED),
+                             ('preloaded', PRELOADED)):
+            paths[name] = os.path.join(work_dir, name + '.sh')
+            with open(paths[name], 'w') as f:
+                f.write(script)
+        measure('empty', ['/bin/bash', paths['empty']], env, options.runs)
+        measure('loader', ['/bin/bash', paths['empty']], loader_env,
+                options.runs)
+        measure('sourced', ['/bin/bash', paths['sourced']], env,
+                options.runs)
+        measure('preloaded', ['/bin/bash', paths['preloaded']], loader_env,
+                options.runs)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+"""
+Measure how many lines per second a bash loop logs with the previous
+logging.sh helpers, which forked for $(basename $0) on every call, and
+with the current ones.
+
+    python benchmarks/logging_helpers.py [--lines 5000]
+"""
+import optparse
+import os
+import subprocess
+import tempfile
+import time
+from os.path import dirname
+
+from bash_runner import resources
+
+LEGACY_HELPERS = '''
+function cfy_info(){ builtin echo [INFO] [$(basename $0)] $@; }
+function cfy_error(){ builtin echo [ERROR] [$(basename $0)] $@; }
+'''
+
+LOOP = '''
+. "$1"
+for ((i = 0; i < $2; i++)); do
+    cfy_info "line $i of the loop"
+done
+'''
+
+
+def measure(name, helpers, lines):
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        subprocess.check_call(['/bin/bash', '-c', LOOP, 'bench.sh',
+                               helpers, str(lines)], stdout=devnull)
+        elapsed = time.time() - start
+    print('{0:>8}: {1:10.0f} lines/s'.format(name, lines / elapsed))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--lines', type='int', default=5000)
+    options, _ = parser.parse_args()
+
+    fd, legacy = tempfile.mkstemp(suffix='.sh')
+    os.write(fd, LEGACY_HELPERS)
+    os.close(fd)
+    try:
+        measure('legacy', legacy, options.lines)
+        measure('current',
+                os.path.join(dirname(resources.__file__), 'logging.sh'),
+                options.lines)
+    finally:
+        os.remove(legacy)
+
+
+if __name__ == '__main__':
+    main()
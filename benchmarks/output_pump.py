@@ -0,0 +1,124 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+"""
+Compare the legacy select/readline output loop of execute() with the
+chunked OutputPump on a script that floods stdout.
+
+    python benchmarks/output_pump.py [--lines 1000000]
+"""
+import errno
+import fcntl
+import optparse
+import os
+import resource
+import select
+import subprocess
+import time
+
+from bash_runner.pump import OutputPump
+from bash_runner.tasks import is_error_log
+from bash_runner.tasks import is_info_log
+
+
+def _spawn(lines):
+    return subprocess.Popen(['/bin/bash', '-c',
+                             'seq 1 {0}; echo done >&2'.format(lines)],
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+
+
+def _classify(line):
+    # the same per line work execute() does, minus the logger call
+    return is_info_log(line) or is_error_log(line)
+
+
+def legacy_loop(process):
+    """
+    The pre-pump loop of execute(): one readline() per stream per wakeup.
+    """
+    def make_async(fd):
+        fcntl.fcntl(fd, fcntl.F_SETFL,
+                    fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def read_async(fd):
+        try:
+            return fd.readline()
+        except IOError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+            return ''
+
+    make_async(process.stdout)
+    make_async(process.stderr)
+    stdout = str()
+    count = 0
+    while True:
+        select.select([process.stdout, process.stderr], [], [])
+        return_code = process.poll()
+        stdout_piece = read_async(process.stdout)
+        stderr_piece = read_async(process.stderr)
+        if stdout_piece:
+            _classify(stdout_piece)
+            count += 1
+        stdout += stdout_piece
+        if return_code is not None and not stdout_piece \
+                and not stderr_piece:
+            break
+    return count
+
+
+def pump_loop(process):
+    counter = [0]
+
+    def on_line(line):
+        _classify(line)
+        counter[0] += 1
+
+    stdout = []
+    pump = OutputPump()
+    pump.register(process.stdout.fileno(), on_chunk=stdout.append,
+                  on_line=on_line)
+    pump.register(process.stderr.fileno(), on_line=_classify)
+    pump.run()
+    pump.close()
+    process.wait()
+    ''.join(stdout)
+    return counter[0]
+
+
+def measure(name, loop, lines):
+    process = _spawn(lines)
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.time()
+    count = loop(process)
+    elapsed = time.time() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (usage_after.ru_utime - usage_before.ru_utime +
+           usage_after.ru_stime - usage_before.ru_stime)
+    print('{0:>8}: {1} lines in {2:.2f}s wall, {3:.2f}s cpu '
+          '({4:.0f} lines/sec)'.format(name, count, elapsed, cpu,
+                                       count / elapsed))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--lines', type='int', default=1000000)
+    options, _ = parser.parse_args()
+    measure('legacy', legacy_loop, options.lines)
+    measure('pump', pump_loop, options.lines)
+
+
+if __name__ == '__main__':
+    main()
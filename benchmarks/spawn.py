@@ -0,0 +1,83 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+"""
+Measure the latency of spawning a trivial bash script, the way execute()
+used to (shell=True through /bin/sh) and with the argv based spawn
+methods.
+
+    python benchmarks/spawn.py [--runs 1000] [--heap-mb 0]
+
+--heap-mb grows the benchmark process first, to show how fork based
+spawning slows down with the size of the agent process.
+"""
+import optparse
+import os
+import subprocess
+import tempfile
+import time
+
+from bash_runner.spawn import SPAWN_FORK
+from bash_runner.spawn import SPAWN_POSIX
+from bash_runner.spawn import posix_spawn_available
+from bash_runner.spawn import spawn
+
+
+def legacy_spawn(path, env):
+    return subprocess.Popen('/bin/bash {0}'.format(path), shell=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            env=env)
+
+
+def measure(name, start_process, path, runs):
+    env = os.environ.copy()
+    start = time.time()
+    for _ in range(runs):
+        process = start_process(path, env)
+        process.stdout.read()
+        process.stderr.read()
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()
+    elapsed = time.time() - start
+    print('{0:>12}: {1:.3f} ms per spawn'.format(name,
+                                                 elapsed * 1000 / runs))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--runs', type='int', default=1000)
+    parser.add_option('--heap-mb', type='int', default=0)
+    options, _ = parser.parse_args()
+
+    heap = bytearray(options.heap_mb * 1024 * 1024)  # NOQA
+
+    fd, path = tempfile.mkstemp(suffix='.sh')
+    os.write(fd, 'exit 0\n')
+    os.close(fd)
+    try:
+        measure('shell=True', legacy_spawn, path, options.runs)
+        measure(SPAWN_FORK,
+                lambda p, env: spawn(['/bin/bash', p], env, SPAWN_FORK),
+                path, options.runs)
+        if posix_spawn_available():
+            measure(SPAWN_POSIX,
+                    lambda p, env: spawn(['/bin/bash', p], env, SPAWN_POSIX),
+                    path, options.runs)
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
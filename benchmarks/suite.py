@@ -0,0 +1,326 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+"""
+Benchmark the hot paths of the plugin and write the results as JSON, so
+runs can be compared across commits. Runs offline: the context is a
+MockCloudifyContext and downloads come from the test file server.
+
+    python benchmarks/suite.py [--scenario NAME ...] [--repeat 3]
+                               [--scale 1.0] [--output results.json]
+
+Scenarios (sizes at --scale 1):
+
+    stdout_lines     a script printing 1,000,000 lines, captured
+    interleaved      200,000 stdout and 200,000 stderr lines at once;
+                     stderr lines are logged
+    property_tree    setup_environment() for 10,000 nested properties
+    tiny_scripts     1,000 sequential execute() of an empty script
+    downloads        200 resources through the download service at
+                     once, into an empty cache
+    downloads_cached the same, revalidating the cached copies
+    instances        200 node instances running a downloaded script,
+                     one run_and_return_output() (task) each
+    instances_batch  the same 200 instances in one run_batch()
+
+Each scenario runs --repeat times. The JSON holds every run's seconds,
+the fastest and median run and the units (lines, keys, ...) per second
+of the fastest run, besides a description of the host. A summary is
+printed to stderr.
+"""
+import collections
+import gc
+import json
+import logging
+import optparse
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from cloudify.constants import MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY
+from cloudify.constants import MANAGER_IP_KEY
+from cloudify.mocks import MockCloudifyContext
+
+from bash_runner.downloader import DownloadService
+from bash_runner.environment import setup_environment
+from bash_runner.script_cache import ScriptCache
+from bash_runner.tasks import execute
+from bash_runner.tasks import run_and_return_output
+from bash_runner.tasks import run_batch
+from bash_runner.tests.file_server import FileServer
+from bash_runner.tests.file_server import PORT
+
+BLUEPRINT_ID = 'blueprint'
+
+_RESOURCE_SIZE = 16 * 1024
+
+
+class Context(object):
+    """
+    What scenarios share: a work directory, a mock context and cleanups
+    to run once every scenario finished.
+    """
+
+    def __init__(self, scale):
+        self.scale = scale
+        self.work_dir = tempfile.mkdtemp(prefix='cloudify-bash-bench-')
+        self.logger = logging.getLogger('benchmark')
+        self.logger.propagate = False
+        self.logger.addHandler(logging.NullHandler())
+        self.ctx = MockCloudifyContext(node_id='node',
+                                       blueprint_id=BLUEPRINT_ID,
+                                       deployment_id='deployment',
+                                       execution_id='execution',
+                                       properties={})
+        self._cleanups = []
+        self._file_server = None
+
+    def scaled(self, count):
+        return max(1, int(count * self.scale))
+
+    def path(self, *parts):
+        return os.path.join(self.work_dir, *parts)
+
+    def file_server(self):
+        """
+        Start the test file server on first use. Returns the directory it
+        serves the blueprint's resources from.
+        """
+        served = self.path('served')
+        if self._file_server is None:
+            os.makedirs(os.path.join(served, BLUEPRINT_ID))
+            self._file_server = FileServer(served)
+            self._file_server.start()
+            self.add_cleanup(self._file_server.stop)
+        return os.path.join(served, BLUEPRINT_ID)
+
+    def add_cleanup(self, cleanup):
+        self._cleanups.append(cleanup)
+
+    def close(self):
+        for cleanup in reversed(self._cleanups):
+            cleanup()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def stdout_lines(context):
+    lines = context.scaled(1000000)
+    command = ['seq', str(lines)]
+
+    def run():
+        execute(command, context.ctx, False, logger=context.logger).close()
+        return lines
+    return 'lines', run
+
+
+def interleaved(context):
+    lines = context.scaled(200000)
+    command = ('(yes out | head -n {0}) & '
+               '(yes err | head -n {0}) >&2; wait'.format(lines))
+
+    def run():
+        execute(command, context.ctx, False, logger=context.logger).close()
+        return 2 * lines
+    return 'lines', run
+
+
+def property_tree(context):
+    groups = context.scaled(100)
+    properties = {}
+    for group in range(groups):
+        properties['group_{0}'.format(group)] = dict(
+            ('key_{0}'.format(key), 'value {0} {1}'.format(group, key))
+            for key in range(100))
+    ctx = MockCloudifyContext(node_id='node',
+                              blueprint_id=BLUEPRINT_ID,
+                              deployment_id='deployment',
+                              execution_id='execution',
+                              properties=properties)
+    offload_dir = context.path('offload')
+    os.mkdir(offload_dir)
+
+    def run():
+        setup_environment(ctx, offload_dir=offload_dir)
+        return groups * 100
+    return 'keys', run
+
+
+def tiny_scripts(context):
+    scripts = context.scaled(1000)
+    path = context.path('tiny.sh')
+    with open(path, 'w') as f:
+        f.write('exit 0\n')
+
+    def run():
+        for _ in range(scripts):
+            execute(['/bin/bash', path], context.ctx, False,
+                    logger=context.logger).close()
+        return scripts
+    return 'scripts', run
+
+
+def _download_scenario(cached):
+    def scenario(context):
+        resources = context.scaled(200)
+        served = context.file_server()
+        content = os.urandom(_RESOURCE_SIZE)
+        for index in range(resources):
+            with open(os.path.join(served, 'r{0}'.format(index)), 'wb') as f:
+                f.write(content)
+        cache = ScriptCache(tempfile.mkdtemp(dir=context.work_dir))
+        service = DownloadService(cache)
+        context.add_cleanup(service.close)
+        targets = tempfile.mkdtemp(dir=context.work_dir)
+        items = [('r{0}'.format(index),
+                  os.path.join(targets, 'r{0}'.format(index)), None)
+                 for index in range(resources)]
+
+        def run():
+            if not cached:
+                service.cache = ScriptCache(
+                    tempfile.mkdtemp(dir=context.work_dir))
+            errors = service.download(BLUEPRINT_ID, items)
+            if errors:
+                raise RuntimeError('; '.join(errors))
+            return resources
+        if cached:
+            run()
+        return 'downloads', run
+    return scenario
+
+
+def _instances_scenario(batch):
+    def scenario(context):
+        instances = context.scaled(200)
+        served = context.file_server()
+        with open(os.path.join(served, 'instance.sh'), 'w') as f:
+            f.write('. "$CLOUDIFY_LOGGING"\n'
+                    'cfy_info "configuring $CLOUDIFY_NODE_ID"\n')
+        ctxs = [MockCloudifyContext(node_id='node_{0}'.format(index),
+                                    blueprint_id=BLUEPRINT_ID,
+                                    deployment_id='deployment',
+                                    execution_id='execution',
+                                    properties={'port': 8080})
+                for index in range(instances)]
+        # the contexts log to the mock context's logger, which prints
+        logging.getLogger('mock-context-logger').disabled = True
+
+        def run():
+            if batch:
+                for result in run_batch(ctxs, script_path='instance.sh'):
+                    if result['status'] != 'succeeded':
+                        raise RuntimeError(result['error'])
+            else:
+                for ctx in ctxs:
+                    run_and_return_output(ctx,
+                                          script_path='instance.sh').close()
+            return instances
+        return 'instances', run
+    return scenario
+
+
+SCENARIOS = collections.OrderedDict([
+    ('stdout_lines', stdout_lines),
+    ('interleaved', interleaved),
+    ('property_tree', property_tree),
+    ('tiny_scripts', tiny_scripts),
+    ('downloads', _download_scenario(cached=False)),
+    ('downloads_cached', _download_scenario(cached=True)),
+    ('instances', _instances_scenario(batch=False)),
+    ('instances_batch', _instances_scenario(batch=True))
+])
+
+
+def measure(name, context, repeat):
+    unit, run = SCENARIOS[name](context)
+    runs = []
+    units = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.time()
+        units = run()
+        runs.append(time.time() - start)
+    fastest = min(runs)
+    return collections.OrderedDict([
+        ('scenario', name),
+        ('unit', unit),
+        ('units', units),
+        ('runs', runs),
+        ('min', fastest),
+        ('median', sorted(runs)[len(runs) // 2]),
+        ('per_second', units / fastest if fastest else None)
+    ])
+
+
+def describe_host():
+    bash_version = subprocess.check_output(
+        ['/bin/bash', '-c', 'echo "$BASH_VERSION"']).strip()
+    return collections.OrderedDict([
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('cpus', os.sysconf('SC_NPROCESSORS_ONLN')),
+        ('bash', bash_version)
+    ])
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--scenario', action='append', dest='scenarios',
+                      choices=list(SCENARIOS), metavar='NAME',
+                      help='run only NAME, may be repeated')
+    parser.add_option('--repeat', type='int', default=3)
+    parser.add_option('--scale', type='float', default=1.0,
+                      help='multiply the scenario sizes by SCALE')
+    parser.add_option('--output', metavar='FILE',
+                      help='write the JSON results to FILE '
+                           'instead of stdout')
+    options, _ = parser.parse_args()
+
+    base_url = 'http://localhost:{0}'.format(PORT)
+    os.environ[MANAGER_FILE_SERVER_BLUEPRINTS_ROOT_URL_KEY] = base_url
+    os.environ.setdefault(MANAGER_IP_KEY, 'localhost')
+    context = Context(options.scale)
+    results = []
+    try:
+        for name in options.scenarios or SCENARIOS:
+            result = measure(name, context, options.repeat)
+            results.append(result)
+            sys.stderr.write('{0:>16}: {1:10.3f}s {2:14.1f} {3}/s\n'.format(
+                name, result['min'], result['per_second'], result['unit']))
+    finally:
+        context.close()
+
+    document = collections.OrderedDict([
+        ('host', describe_host()),
+        ('options', collections.OrderedDict([
+            ('repeat', options.repeat),
+            ('scale', options.scale)
+        ])),
+        ('results', results)
+    ])
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(document, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()